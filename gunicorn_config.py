@@ -1,4 +1,12 @@
 # Railway-optimized Gunicorn config
+import os
+
+# The master warms torch before forking, and a forked child can't use an OpenMP
+# pool its parent already started; keep the master's pool single-threaded
+# (workers raise it to TORCH_NUM_THREADS in post_fork)
+os.environ.setdefault('OMP_NUM_THREADS', '1')
+os.environ.setdefault('MKL_NUM_THREADS', '1')
+
 workers = 1
 threads = 2
 worker_class = "gthread"
@@ -6,3 +14,17 @@ worker_tmp_dir = "/dev/shm"
 timeout = 120
 max_requests = 100
 max_requests_jitter = 20
+
+# Load the app, models and corpus once in the master and fork warm workers from it,
+# so recycled workers don't pay for cold model loads on their first request
+preload_app = True
+
+
+def when_ready(server):
+    from recommender.warmup import warm_up
+    warm_up()
+
+
+def post_fork(server, worker):
+    from recommender import warmup
+    warmup.post_fork()
@@ -0,0 +1,214 @@
+"""
+Approximate nearest-neighbour index over resume embeddings.
+
+The NLP recommender scores every candidate with spaCy and sentence-transformer
+based components, which is linear in corpus size. The HNSW index built here
+(via hnswlib, CPU-only) shortlists the K resumes closest to the job embedding
+so that only those get the full multi-component score.
+
+The index is built by ``python manage.py build_ann_index`` and persisted next
+to an id map; workers load it lazily and keep it in sync with the corpus
+snapshot through ``add``/``remove``. The id map keeps a hash of each indexed
+vector, so re-adding an unchanged resume is a no-op while a re-generated
+embedding replaces the stale vector. If hnswlib is not installed or no index
+has been built, recommendations fall back to scoring the whole corpus.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger('recommender')
+
+ANN_INDEX_PATH = getattr(settings, 'ANN_INDEX_PATH', os.path.join('data', 'resume_index.bin'))
+ANN_SHORTLIST_SIZE = getattr(settings, 'ANN_SHORTLIST_SIZE', 200)
+ANN_SEARCH_EF = getattr(settings, 'ANN_SEARCH_EF', 100)
+
+
+def _ids_path(index_path):
+    return index_path + '.ids.json'
+
+
+def _vector_hash(vector):
+    return hashlib.blake2b(vector.tobytes(), digest_size=8).hexdigest()
+
+
+class ResumeANNIndex:
+    """HNSW index keyed by resume id"""
+
+    def __init__(self, dim, max_elements=1000, m=16, ef_construction=200):
+        import hnswlib
+        self.dim = dim
+        self._index = hnswlib.Index(space='cosine', dim=dim)
+        self._index.init_index(max_elements=max(1, max_elements), M=m, ef_construction=ef_construction, allow_replace_deleted=True)
+        self._labels = {}  # resume id -> integer label
+        self._ids = {}  # integer label -> resume id
+        self._hashes = {}  # resume id -> hash of its indexed vector
+        self._next_label = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._labels)
+
+    def __contains__(self, resume_id):
+        return resume_id in self._labels
+
+    @classmethod
+    def build(cls, resumes, m=16, ef_construction=200):
+        """Build an index from resumes that have an embedding"""
+        with_embeddings = [r for r in resumes if r.get('embedding') is not None and np.size(r['embedding']) > 0]
+        if not with_embeddings:
+            raise ValueError("No resumes with embeddings to index")
+        dim = np.size(with_embeddings[0]['embedding'])
+        index = cls(dim, max_elements=len(with_embeddings), m=m, ef_construction=ef_construction)
+        index.add(with_embeddings)
+        return index
+
+    def add(self, resumes):
+        """Insert resumes, replacing the vectors of indexed ids whose embedding changed"""
+        with self._lock:
+            ids, vectors, hashes = [], [], []
+            for resume in resumes:
+                embedding = resume.get('embedding')
+                if embedding is None or np.size(embedding) != self.dim:
+                    continue
+                vector = np.asarray(embedding, dtype=np.float32).ravel()
+                vector_hash = _vector_hash(vector)
+                if resume['id'] in self._labels and self._hashes.get(resume['id']) == vector_hash:
+                    continue
+                ids.append(resume['id'])
+                vectors.append(vector)
+                hashes.append(vector_hash)
+            if not ids:
+                return
+
+            new_labels, new_vectors = [], []
+            updated_labels, updated_vectors = [], []
+            for resume_id, vector in zip(ids, vectors):
+                label = self._labels.get(resume_id)
+                if label is None:
+                    label = self._next_label
+                    self._next_label += 1
+                    self._labels[resume_id] = label
+                    self._ids[label] = resume_id
+                    new_labels.append(label)
+                    new_vectors.append(vector)
+                else:
+                    updated_labels.append(label)
+                    updated_vectors.append(vector)
+
+            if updated_labels:
+                self._index.add_items(np.vstack(updated_vectors), np.array(updated_labels))
+            if new_labels:
+                needed = self._index.get_current_count() + len(new_labels)
+                if needed > self._index.get_max_elements():
+                    self._index.resize_index(max(needed, 2 * self._index.get_max_elements()))
+                # New labels may take over the slots of deleted resumes
+                self._index.add_items(np.vstack(new_vectors), np.array(new_labels), replace_deleted=True)
+            self._hashes.update(zip(ids, hashes))
+
+    def remove(self, resume_ids):
+        """Delete resumes from the index"""
+        with self._lock:
+            for resume_id in resume_ids:
+                label = self._labels.pop(resume_id, None)
+                self._hashes.pop(resume_id, None)
+                if label is None:
+                    continue
+                self._ids.pop(label, None)
+                try:
+                    self._index.mark_deleted(label)
+                except RuntimeError:
+                    pass
+
+    def query(self, embedding, k, ef=None):
+        """Return up to k resume ids nearest to embedding; larger ef trades latency for recall"""
+        k = min(k, len(self._labels))
+        if k <= 0:
+            return []
+        with self._lock:
+            # ef is index-wide state, so set and query under the lock
+            self._index.set_ef(max(k, ef or ANN_SEARCH_EF))
+            labels, _ = self._index.knn_query(np.asarray(embedding, dtype=np.float32).reshape(1, -1), k=k, num_threads=1)
+        return [self._ids[label] for label in labels[0] if label in self._ids]
+
+    def save(self, path=ANN_INDEX_PATH):
+        """Persist the index and its id map, swapping both files in atomically"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._lock:
+            self._index.save_index(path + '.tmp')
+            # [id, label, hash] entries rather than an object, so ids keep their JSON type
+            entries = [[resume_id, label, self._hashes.get(resume_id)] for resume_id, label in self._labels.items()]
+            with open(_ids_path(path) + '.tmp', 'w') as f:
+                json.dump({'dim': self.dim, 'next_label': self._next_label, 'entries': entries}, f)
+        os.replace(path + '.tmp', path)
+        os.replace(_ids_path(path) + '.tmp', _ids_path(path))
+
+    @classmethod
+    def load(cls, path=ANN_INDEX_PATH):
+        import hnswlib
+        with open(_ids_path(path)) as f:
+            meta = json.load(f)
+        index = cls.__new__(cls)
+        index.dim = meta['dim']
+        index._index = hnswlib.Index(space='cosine', dim=index.dim)
+        index._index.load_index(path, allow_replace_deleted=True)
+        if 'entries' in meta:
+            index._labels = {resume_id: label for resume_id, label, _ in meta['entries']}
+            index._hashes = {resume_id: vector_hash for resume_id, _, vector_hash in meta['entries'] if vector_hash}
+        else:
+            # Id maps written before entries had string keys and no hashes; rebuild to fix both
+            index._labels = meta['labels']
+            index._hashes = {}
+        index._ids = {label: resume_id for resume_id, label in index._labels.items()}
+        index._next_label = meta['next_label']
+        index._lock = threading.Lock()
+        return index
+
+
+_index = None
+_index_loaded = False
+_index_lock = threading.Lock()
+
+
+def get_ann_index():
+    """Return the persisted index, or None if hnswlib is missing or no index was built"""
+    global _index, _index_loaded
+    if not _index_loaded:
+        with _index_lock:
+            if not _index_loaded:
+                try:
+                    if os.path.exists(ANN_INDEX_PATH):
+                        _index = ResumeANNIndex.load(ANN_INDEX_PATH)
+                        logger.info(f"Loaded ANN index with {len(_index)} resumes from {ANN_INDEX_PATH}")
+                    else:
+                        logger.info(f"No ANN index at {ANN_INDEX_PATH}; scoring full corpus")
+                except ImportError:
+                    logger.warning("hnswlib is not installed; scoring full corpus")
+                except Exception as e:
+                    logger.error(f"Error loading ANN index: {str(e)}")
+                _index_loaded = True
+    return _index
+
+
+def shortlist_resumes(resumes, job_embedding, k=None, ef=None):
+    """
+    Keep the k resumes nearest to the job embedding according to the ANN index.
+    Resumes the index doesn't know about yet are always kept so new candidates
+    aren't hidden until the next rebuild. Returns resumes unchanged when there
+    is no index or the corpus is already smaller than k.
+    """
+    k = k or ANN_SHORTLIST_SIZE
+    index = get_ann_index()
+    if index is None or len(resumes) <= k or index.dim != np.size(job_embedding):
+        return resumes
+    try:
+        nearest = set(index.query(job_embedding, k, ef=ef))
+    except Exception as e:
+        logger.error(f"ANN query failed, scoring full corpus: {str(e)}")
+        return resumes
+    return [r for r in resumes if r.get('id') in nearest or r.get('id') not in index]
@@ -1,7 +1,8 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .supabase_client import supabase
+from django.conf import settings
+from .supabase_client import get_auth_client, get_supabase
 import logging
 from datetime import datetime
 import os
@@ -16,7 +17,7 @@ class SignUpView(APIView):
             role = 'candidate'  # Hardcoded for candidate signup
             
             # Create user in Supabase
-            response = supabase.auth.sign_up({
+            response = get_auth_client().auth.sign_up({
                 'email': email,
                 'password': password,
                 'options': {
@@ -29,7 +30,7 @@ class SignUpView(APIView):
             
             if response.user:
                 # Create profile with role
-                profile_response = supabase.table('profiles').upsert({
+                profile_response = get_auth_client().table('profiles').upsert({
                     'id': response.user.id,
                     'email': email,
                     'role': role,
@@ -56,10 +57,7 @@ class SignUpView(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     def create_recruiter_profile(self, user, profile_data):
-        supabase = create_client(
-            url=os.getenv("SUPABASE_URL"),
-            key=os.getenv("SUPABASE_ANON_KEY"),
-        )
+        supabase = get_supabase(settings.SUPABASE_ANON_KEY)
         supabase.table('recruiter_profiles').insert({
             'id': user.id,
             'company_name': profile_data.get('company_name'),
@@ -75,7 +73,7 @@ class LoginView(APIView):
             password = request.data.get('password')
             
             # Authenticate user with Supabase
-            response = supabase.auth.sign_in_with_password({
+            response = get_auth_client().auth.sign_in_with_password({
                 'email': email,
                 'password': password
             })
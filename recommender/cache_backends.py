@@ -0,0 +1,242 @@
+"""
+Host-shared Django cache backends.
+
+``LocMemCache`` gave every gunicorn worker its own cold cache, so adding
+workers divided the hit rate by the worker count. ``SQLiteCache`` keeps
+entries in one SQLite file (WAL mode) shared by every process on the host.
+Expired entries are dropped first, then the least recently used ones once
+the stored values exceed ``OPTIONS['MAX_BYTES']``. ``CountingRedisCache`` is
+Django's Redis backend, for deployments that span hosts; its memory bound is
+Redis' own ``maxmemory`` policy.
+
+Both count hits, misses and writes per process (see ``cache_stats``).
+Django hands each thread its own backend instance, so the counters live in a
+module-level table keyed by the cache's location rather than on the
+instance. The backend is chosen with ``CACHE_BACKEND`` in settings ('sqlite', 'redis' or
+'locmem').
+"""
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.redis import RedisCache
+
+# Prune expired/excess rows once every this many writes
+PRUNE_EVERY = 100
+# Evict down to this fraction of MAX_BYTES so pruning doesn't run on every write
+PRUNE_TARGET = 0.9
+# Don't rewrite an entry's access time more often than this many seconds
+ACCESS_RESOLUTION = 60
+
+_MISSING = object()
+
+# Per-process counters by stats key, shared by the thread-local backend instances of a cache
+_counters = {}
+_counters_lock = threading.Lock()
+
+
+class CountingCacheMixin:
+    """Per-process hit/miss/write counters for a cache backend"""
+
+    def _stats_key(self):
+        return (type(self).__name__, self.key_prefix)
+
+    def _count(self, **increments):
+        """Add increments to this cache's counters and return the updated value of the last one"""
+        with _counters_lock:
+            counters = _counters.setdefault(self._stats_key(), {'hits': 0, 'misses': 0, 'sets': 0})
+            for name, n in increments.items():
+                counters[name] = counters.get(name, 0) + n
+            return counters[name]
+
+    def _read_counters(self):
+        with _counters_lock:
+            return dict(_counters.get(self._stats_key(), {}))
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version=version)
+        if value is _MISSING:
+            self._count(misses=1)
+            return default
+        self._count(hits=1)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._count(sets=1)
+        return super().set(key, value, timeout, version=version)
+
+    def stats(self):
+        counters = {'hits': 0, 'misses': 0, 'sets': 0}
+        counters.update(self._read_counters())
+        counters.pop('writes', None)
+        counters.pop('evictions', None)
+        lookups = counters['hits'] + counters['misses']
+        counters['hit_rate'] = round(counters['hits'] / lookups, 3) if lookups else None
+        return counters
+
+
+class SQLiteCache(CountingCacheMixin, BaseCache):
+    """Cache stored in a SQLite file shared by every process on the host, bounded in bytes"""
+
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.path = location
+        self.max_bytes = int(options.get('MAX_BYTES', 256 * 1024 * 1024))
+        self._local = threading.local()
+        self._initialized = False
+
+    def _connection(self):
+        # One connection per thread, and never one inherited from a forked parent
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if not self._initialized:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS cache_entries ("
+                    "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+                    "expires_at REAL, accessed_at REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS cache_entries_accessed ON cache_entries (accessed_at)")
+                conn.commit()
+                self._initialized = True
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _stats_key(self):
+        return (type(self).__name__, os.path.abspath(self.path))
+
+    def get(self, key, default=None, version=None):
+        value = self._get(self.make_and_validate_key(key, version=version), _MISSING)
+        if value is _MISSING:
+            self._count(misses=1)
+            return default
+        self._count(hits=1)
+        return value
+
+    def _get(self, key, default):
+        now = time.time()
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT value, accessed_at FROM cache_entries WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, now)
+            ).fetchone()
+            if row is None:
+                return default
+            if now - row[1] > ACCESS_RESOLUTION:
+                conn.execute("UPDATE cache_entries SET accessed_at = ? WHERE key = ?", (now, key))
+        return pickle.loads(row[0])
+
+    def _set(self, key, value, timeout, only_if_absent=False):
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        now = time.time()
+        with self._connection() as conn:
+            if only_if_absent:
+                conn.execute("DELETE FROM cache_entries WHERE key = ? AND expires_at <= ?", (key, now))
+            cursor = conn.execute(
+                f"INSERT OR {'IGNORE' if only_if_absent else 'REPLACE'} INTO cache_entries "
+                "(key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, pickled, len(key) + len(pickled), self.get_backend_timeout(timeout), now)
+            )
+            stored = cursor.rowcount > 0
+        # Counted across this process' threads, so the process prunes once per PRUNE_EVERY writes
+        if self._count(writes=1) % PRUNE_EVERY == 0:
+            self.prune()
+        return stored
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._count(sets=1)
+        return self._set(key, value, timeout, only_if_absent=True)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._count(sets=1)
+        self._set(self.make_and_validate_key(key, version=version), value, timeout)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        with self._connection() as conn:
+            cursor = conn.execute(
+                "UPDATE cache_entries SET expires_at = ?, accessed_at = ? "
+                "WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (self.get_backend_timeout(timeout), now, key, now)
+            )
+        return cursor.rowcount > 0
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._connection() as conn:
+            cursor = conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+        return cursor.rowcount > 0
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM cache_entries WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, time.time())
+            ).fetchone()
+        return row is not None
+
+    def clear(self):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM cache_entries")
+
+    def prune(self):
+        """Drop expired entries, then the least recently used ones until the cache fits PRUNE_TARGET of max_bytes"""
+        with self._connection() as conn:
+            expired = conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (time.time(),)).rowcount
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries").fetchone()[0]
+            evicted = 0
+            if total > self.max_bytes:
+                evicted = conn.execute(
+                    "DELETE FROM cache_entries WHERE key IN ("
+                    "SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC, key) AS running "
+                    "FROM cache_entries) WHERE running > ?)",
+                    (int(self.max_bytes * PRUNE_TARGET),)
+                ).rowcount
+        self._count(evictions=expired + evicted)
+
+    def stats(self):
+        stats = super().stats()
+        with self._connection() as conn:
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries").fetchone()
+        stats.update(entries=entries, bytes=size, max_bytes=self.max_bytes,
+                     evictions=self._read_counters().get('evictions', 0))
+        return stats
+
+
+class CountingRedisCache(CountingCacheMixin, RedisCache):
+    """Django's Redis backend with per-process hit/miss counters"""
+
+    def _stats_key(self):
+        return (type(self).__name__, tuple(self._servers), self.key_prefix)
+
+    def get_many(self, keys, version=None):
+        found = super().get_many(keys, version=version)
+        self._count(hits=len(found), misses=len(keys) - len(found))
+        return found
+
+
+def cache_stats():
+    """Hit/miss counters (and size, for SQLite) of every configured cache that keeps them"""
+    stats = {}
+    for alias in caches.settings:
+        backend = caches[alias]
+        if isinstance(backend, CountingCacheMixin):
+            try:
+                stats[alias] = backend.stats()
+            except Exception as e:
+                stats[alias] = {'error': str(e)}
+    return stats
@@ -0,0 +1,328 @@
+"""
+Process-wide resume corpus snapshot.
+
+Loading the corpus means fetching every resume and profile from Supabase,
+decoding each embedding and generating embedding text with spaCy. Instead of
+doing that on every request, the snapshot is built once per process and then
+refreshed incrementally by fetching only the rows whose watermark column
+(``updated_at`` by default) moved since the last refresh.
+
+Deleted rows cannot be seen by an incremental fetch, so the snapshot is also
+rebuilt from scratch every ``CORPUS_FULL_RELOAD_SECONDS``.
+"""
+
+import logging
+import threading
+import time
+from django.conf import settings
+import numpy as np
+from .supabase_client import get_supabase
+from .utils import attach_profile, prepare_resumes, decode_resume_embeddings, fetch_concurrently
+from .ann_index import get_ann_index
+from .term_store import warm_resume_terms
+
+logger = logging.getLogger('recommender')
+
+CORPUS_MAX_STALENESS_SECONDS = getattr(settings, 'CORPUS_MAX_STALENESS_SECONDS', 60)
+CORPUS_FULL_RELOAD_SECONDS = getattr(settings, 'CORPUS_FULL_RELOAD_SECONDS', 3600)
+CORPUS_RETRY_SECONDS = getattr(settings, 'CORPUS_RETRY_SECONDS', 10)
+CORPUS_WATERMARK_COLUMN = getattr(settings, 'CORPUS_WATERMARK_COLUMN', 'updated_at')
+CORPUS_VERSION_CACHE_SECONDS = getattr(settings, 'CORPUS_VERSION_CACHE_SECONDS', 5)
+CORPUS_BACKEND = getattr(settings, 'CORPUS_BACKEND', 'live')
+CORPUS_STREAM_BATCH_SIZE = getattr(settings, 'CORPUS_STREAM_BATCH_SIZE', 1000)
+# User ids per profiles query; each id is a UUID in the request URL, so keep it well under URL limits
+CORPUS_PROFILE_CHUNK_SIZE = getattr(settings, 'CORPUS_PROFILE_CHUNK_SIZE', 150)
+CORPUS_RESUME_COLUMNS = getattr(settings, 'CORPUS_RESUME_COLUMNS', [
+    'id', 'user_id', 'embedding', 'skills', 'experience', 'education', 'certifications', 'languages'
+])
+CORPUS_PROFILE_COLUMNS = getattr(settings, 'CORPUS_PROFILE_COLUMNS', [
+    'id', 'first_name', 'last_name', 'email', 'phone', 'address'
+])
+
+
+def _max_watermark(rows, current=None):
+    """Return the highest watermark value among rows (ISO timestamps compare as strings)"""
+    watermark = current
+    for row in rows:
+        value = row.get(CORPUS_WATERMARK_COLUMN)
+        if value and (watermark is None or value > watermark):
+            watermark = value
+    return watermark
+
+
+def _sync_ann_index(updated, removed):
+    """
+    Apply inserts/updates and deletions to the in-memory ANN index, if one is
+    loaded; rows whose embedding is unchanged are skipped by the index
+    """
+    index = get_ann_index()
+    if index is None:
+        return
+    try:
+        if removed:
+            index.remove(removed)
+        index.add([r for r in updated if r.get('embedding') is not None and np.size(r['embedding']) > 0])
+    except Exception as e:
+        logger.error(f"Error updating ANN index: {str(e)}")
+
+
+class CorpusSnapshot:
+    """In-memory copy of the prepared resume corpus with incremental refresh"""
+
+    def __init__(self, max_staleness=CORPUS_MAX_STALENESS_SECONDS, full_reload_interval=CORPUS_FULL_RELOAD_SECONDS,
+                 retry_interval=CORPUS_RETRY_SECONDS):
+        self.max_staleness = max_staleness
+        self.full_reload_interval = full_reload_interval
+        self.retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self._resumes = {}
+        self._profiles = {}
+        self._ordered = []
+        self._resume_watermark = None
+        self._profile_watermark = None
+        self._refreshed_at = 0
+        self._full_loaded_at = 0
+        self._failed_at = 0
+        self._needs_full_reload = True
+        # Bumped whenever the set of resumes or their contents change
+        self.version = 0
+
+    def get_resumes(self):
+        """Return the prepared resumes, refreshing first if the snapshot is stale"""
+        if self.is_stale():
+            with self._lock:
+                # Another thread may have refreshed while we waited for the lock
+                if self.is_stale():
+                    self._refresh()
+        return self._ordered
+
+    def version_stamp(self):
+        """
+        Corpus version that is the same in every worker that has seen the same
+        rows (unlike ``version``, which counts this process' refreshes)
+        """
+        self.get_resumes()
+        return f"live:{self._resume_watermark}:{self._profile_watermark}:{len(self._ordered)}"
+
+    def is_stale(self):
+        now = time.time()
+        # Back off after a failed refresh instead of hitting Supabase on every read
+        if now - self._failed_at < self.retry_interval:
+            return False
+        return self._needs_full_reload or (now - self._refreshed_at) > self.max_staleness
+
+    def invalidate(self, full=False):
+        """Force a refresh on the next read; ``full=True`` also discards the current rows"""
+        with self._lock:
+            self._refreshed_at = 0
+            self._failed_at = 0
+            if full:
+                self._needs_full_reload = True
+        logger.info(f"Corpus snapshot invalidated (full={full})")
+
+    def _refresh(self):
+        start_time = time.time()
+        try:
+            if self._needs_full_reload or (start_time - self._full_loaded_at) > self.full_reload_interval:
+                self._full_reload()
+            else:
+                self._incremental_refresh()
+        except Exception as e:
+            # Keep serving the previous snapshot (possibly empty); retry after retry_interval
+            logger.error(f"Error refreshing corpus snapshot: {str(e)}")
+            self._failed_at = time.time()
+            return
+        self._refreshed_at = time.time()
+        logger.info(f"Corpus snapshot refreshed in {self._refreshed_at - start_time:.2f} seconds ({len(self._ordered)} resumes, version {self.version})")
+
+    def _full_reload(self):
+        stage_timings = {}
+        stage_start = time.time()
+        resumes, profiles = fetch_concurrently(
+            get_supabase().table('resumes').select('*'),
+            get_supabase().table('profiles').select('*')
+        )
+        stage_timings['fetch'] = time.time() - stage_start
+
+        stage_start = time.time()
+        resumes = decode_resume_embeddings(resumes)
+        stage_timings['decode'] = time.time() - stage_start
+
+        stage_start = time.time()
+        self._profiles = {p['id']: p for p in profiles}
+        stage_timings['join'] = time.time() - stage_start
+        self._profile_watermark = _max_watermark(profiles)
+        self._resume_watermark = _max_watermark(resumes)
+
+        stage_start = time.time()
+        prepared = {
+            resume['id']: resume
+            for resume in prepare_resumes(resumes, lambda resume: self._profiles.get(resume.get('user_id')))
+        }
+        stage_timings['prepare'] = time.time() - stage_start
+        logger.info({
+            'event': 'corpus_full_reload',
+            'resumes': len(prepared),
+            'profiles': len(profiles),
+            'stage_timings': {stage: round(seconds, 3) for stage, seconds in stage_timings.items()}
+        })
+
+        removed = set(self._resumes) - set(prepared)
+        self._resumes = prepared
+        self._ordered = list(prepared.values())
+        _sync_ann_index(self._ordered, removed)
+        warm_resume_terms(self._ordered)
+        self._full_loaded_at = time.time()
+        self._needs_full_reload = False
+        self.version += 1
+
+    def _incremental_refresh(self):
+        changed = False
+
+        profile_query = get_supabase().table('profiles').select('*')
+        if self._profile_watermark:
+            profile_query = profile_query.gte(CORPUS_WATERMARK_COLUMN, self._profile_watermark)
+        resume_query = get_supabase().table('resumes').select('*')
+        if self._resume_watermark:
+            resume_query = resume_query.gte(CORPUS_WATERMARK_COLUMN, self._resume_watermark)
+        profiles, resumes = fetch_concurrently(profile_query, resume_query)
+
+        # Profiles first so that new resumes join against the latest profile data
+        changed_users = set()
+        for profile in profiles:
+            if self._profiles.get(profile['id']) != profile:
+                self._profiles[profile['id']] = profile
+                changed_users.add(profile['id'])
+        self._profile_watermark = _max_watermark(profiles, self._profile_watermark)
+
+        # Readers may still hold the current dicts and rows, so changes go into copies that are swapped in
+        resumes_by_id = dict(self._resumes)
+        if changed_users:
+            for resume_id, resume in self._resumes.items():
+                if resume.get('user_id') in changed_users:
+                    resumes_by_id[resume_id] = attach_profile({**resume}, self._profiles[resume['user_id']])
+                    changed = True
+
+        resumes = decode_resume_embeddings(resumes)
+        # Rows at exactly the watermark are fetched again; skip the unchanged ones
+        fetched = [
+            resume for resume in resumes
+            if resumes_by_id.get(resume['id']) is None
+            or resumes_by_id[resume['id']].get(CORPUS_WATERMARK_COLUMN) != resume.get(CORPUS_WATERMARK_COLUMN)
+        ]
+        updated = prepare_resumes(fetched, lambda resume: self._profiles.get(resume.get('user_id')))
+        for resume in updated:
+            resumes_by_id[resume['id']] = resume
+            changed = True
+        self._resume_watermark = _max_watermark(resumes, self._resume_watermark)
+
+        if updated:
+            _sync_ann_index(updated, ())
+            warm_resume_terms(updated)
+        if changed:
+            self._resumes = resumes_by_id
+            self._ordered = list(resumes_by_id.values())
+            self.version += 1
+
+
+def iter_resume_batches(batch_size=None, resume_columns=None, profile_columns=None):
+    """
+    Stream the corpus from Supabase in keyset-paginated batches of prepared
+    resumes, fetching only the columns scoring and the response need. Each
+    batch joins the profiles of its own users and is decoded and prepared
+    (without embedding text) before it is yielded, so only one batch is held
+    at a time.
+    """
+    batch_size = batch_size or CORPUS_STREAM_BATCH_SIZE
+    resume_select = ','.join(dict.fromkeys(['id', 'user_id', *(resume_columns or CORPUS_RESUME_COLUMNS)]))
+    profile_select = ','.join(dict.fromkeys(['id', *(profile_columns or CORPUS_PROFILE_COLUMNS)]))
+    last_id = None
+    while True:
+        query = get_supabase().table('resumes').select(resume_select).order('id').limit(batch_size)
+        if last_id is not None:
+            query = query.gt('id', last_id)
+        resumes = query.execute().data
+        if not resumes:
+            return
+        last_id = resumes[-1]['id']
+
+        user_ids = list({r['user_id'] for r in resumes if r.get('user_id')})
+        profiles = {}
+        for start in range(0, len(user_ids), CORPUS_PROFILE_CHUNK_SIZE):
+            chunk = user_ids[start:start + CORPUS_PROFILE_CHUNK_SIZE]
+            profiles.update(
+                (p['id'], p) for p in get_supabase().table('profiles').select(profile_select).in_('id', chunk).execute().data
+            )
+
+        yield prepare_resumes(
+            decode_resume_embeddings(resumes),
+            lambda resume: profiles.get(resume.get('user_id')),
+            with_embedding_text=False
+        )
+        if len(resumes) < batch_size:
+            return
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def get_corpus():
+    """
+    Return the process-wide corpus, creating it on first use: the memory-mapped
+    local snapshot when CORPUS_BACKEND is 'snapshot' and one has been built,
+    otherwise the in-memory snapshot refreshed from Supabase. With 'stream',
+    NLP recommendations read iter_resume_batches instead and only the LLM
+    endpoints load this snapshot.
+    """
+    global _snapshot
+    if _snapshot is None:
+        with _snapshot_lock:
+            if _snapshot is None:
+                if CORPUS_BACKEND == 'snapshot':
+                    from .mapped_corpus import MappedCorpus, current_snapshot_dir
+                    if current_snapshot_dir() is not None:
+                        _snapshot = MappedCorpus()
+                        return _snapshot
+                    logger.warning("CORPUS_BACKEND is 'snapshot' but none has been built; loading from Supabase")
+                _snapshot = CorpusSnapshot()
+    return _snapshot
+
+
+_stream_version = {'stamp': None, 'read_at': 0}
+_stream_version_lock = threading.Lock()
+
+
+def corpus_version():
+    """
+    Version stamp of the corpus recommendations are computed from; it changes
+    whenever a resume or profile is inserted, updated or deleted. A streamed
+    corpus isn't held locally, so its stamp is read from Supabase (the newest
+    watermarks and the resume count) and reused for
+    ``CORPUS_VERSION_CACHE_SECONDS``.
+    """
+    if CORPUS_BACKEND != 'stream':
+        return get_corpus().version_stamp()
+    with _stream_version_lock:
+        if time.time() - _stream_version['read_at'] < CORPUS_VERSION_CACHE_SECONDS:
+            return _stream_version['stamp']
+    stamp = _read_stream_version()
+    with _stream_version_lock:
+        _stream_version.update(stamp=stamp, read_at=time.time())
+    return stamp
+
+
+def _read_stream_version():
+    latest_resume = get_supabase().table('resumes').select(CORPUS_WATERMARK_COLUMN, count='exact') \
+        .order(CORPUS_WATERMARK_COLUMN, desc=True).limit(1).execute()
+    latest_profile = get_supabase().table('profiles').select(CORPUS_WATERMARK_COLUMN) \
+        .order(CORPUS_WATERMARK_COLUMN, desc=True).limit(1).execute()
+    return (
+        f"stream:{_max_watermark(latest_resume.data)}:{_max_watermark(latest_profile.data)}"
+        f":{latest_resume.count}"
+    )
+
+
+def invalidate_corpus(full=False):
+    """Invalidate hook for code paths that write resumes or profiles"""
+    get_corpus().invalidate(full=full)
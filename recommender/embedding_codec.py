@@ -0,0 +1,189 @@
+"""
+Versioned binary format for stored resume embeddings.
+
+Embeddings used to be stored as base64 of raw float32 bytes, with the
+dimension, dtype and model left implicit. Each stored value is now base64 of:
+
+    magic (4 bytes) | version (u8) | dtype code (u8) | header length (u8)
+    | dimension (u16 LE) | model id length (u8) | model id | zero padding
+    | payload
+
+where the payload is the vector as float32 or float16, or for int8 a float32
+scale followed by the quantized values (value = int8 * scale). The header is
+padded so every record is a multiple of 3 bytes: base64 then never pads, and a
+batch of equally formatted records can be decoded with one ``b64decode`` of
+their concatenation and numpy slicing (``decode_embeddings``).
+
+Values without the magic prefix are read as the legacy raw float32 format, so
+existing rows keep working. Decoding always returns float32 vectors. Given the
+active model, decoding drops records written by a different base model (the
+PyTorch and ONNX backends of one model are interchangeable); legacy records
+carry no model and are always kept.
+"""
+
+import base64
+import binascii
+import logging
+import struct
+from collections import defaultdict
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger('recommender')
+
+MAGIC = b'\x93EMB'
+FORMAT_VERSION = 1
+DTYPES = {1: 'float32', 2: 'float16', 3: 'int8'}
+DTYPE_CODES = {name: code for code, name in DTYPES.items()}
+FIXED_HEADER = struct.Struct('<4sBBBHB')
+
+EMBEDDING_STORAGE_DTYPE = getattr(settings, 'EMBEDDING_STORAGE_DTYPE', 'float32')
+
+
+def _header(dim, dtype, model_id):
+    model_bytes = model_id.encode('utf-8')[:255]
+    payload_len = dim * (4 if dtype == 'float32' else 2 if dtype == 'float16' else 1) + (4 if dtype == 'int8' else 0)
+    length = FIXED_HEADER.size + len(model_bytes)
+    length += -(length + payload_len) % 3
+    header = FIXED_HEADER.pack(MAGIC, FORMAT_VERSION, DTYPE_CODES[dtype], length, dim, len(model_bytes)) + model_bytes
+    return header.ljust(length, b'\0')
+
+
+def _payloads(matrix, dtype):
+    """(n, payload bytes) uint8 block for a float matrix"""
+    if dtype == 'float32':
+        data = np.ascontiguousarray(matrix, dtype='<f4')
+    elif dtype == 'float16':
+        data = np.ascontiguousarray(matrix, dtype='<f2')
+    else:
+        scale = np.abs(matrix).max(axis=1, keepdims=True).astype('<f4') / 127
+        scale[scale == 0] = 1.0
+        values = np.clip(np.rint(matrix / scale), -127, 127).astype(np.int8)
+        return np.hstack([scale.view(np.uint8), values.view(np.uint8)])
+    return data.view(np.uint8).reshape(len(matrix), -1)
+
+
+def encode_embeddings(matrix, model_id, dtype=None):
+    """Encode the rows of an (n, dim) matrix as stored embedding strings"""
+    dtype = dtype or EMBEDDING_STORAGE_DTYPE
+    matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float32))
+    if dtype == 'legacy':
+        return [base64.b64encode(row.tobytes()).decode('ascii') for row in matrix]
+    if dtype not in DTYPE_CODES:
+        raise ValueError(f"Unsupported embedding storage dtype: {dtype}")
+    if len(matrix) == 0:
+        return []
+    header = np.frombuffer(_header(matrix.shape[1], dtype, model_id), dtype=np.uint8)
+    records = np.hstack([np.broadcast_to(header, (len(matrix), header.size)), _payloads(matrix, dtype)])
+    # Records are a multiple of 3 bytes, so the joint base64 splits evenly per record
+    text = base64.b64encode(records.tobytes()).decode('ascii')
+    width = records.shape[1] // 3 * 4
+    return [text[i:i + width] for i in range(0, len(text), width)]
+
+
+def encode_embedding(vector, model_id, dtype=None):
+    return encode_embeddings(np.asarray(vector, dtype=np.float32).reshape(1, -1), model_id, dtype)[0]
+
+
+def _parse_header(raw):
+    """Header fields of a record, or None if it isn't in the versioned format"""
+    if len(raw) < FIXED_HEADER.size or raw[:4] != MAGIC:
+        return None
+    _, version, dtype_code, length, dim, model_len = FIXED_HEADER.unpack_from(raw)
+    dtype = DTYPES.get(dtype_code)
+    if version != FORMAT_VERSION or dtype is None or length < FIXED_HEADER.size + model_len:
+        return None
+    payload_len = dim * np.dtype(dtype).itemsize + (4 if dtype == 'int8' else 0)
+    if len(raw) != length + payload_len:
+        return None
+    model_id = bytes(raw[FIXED_HEADER.size:FIXED_HEADER.size + model_len]).decode('utf-8', 'replace')
+    return {'version': version, 'dtype': dtype, 'dim': dim, 'model': model_id, 'header_length': length}
+
+
+def base_model(model_id):
+    """Model id without its backend suffix ('all-MiniLM-L6-v2+onnx-int8' -> 'all-MiniLM-L6-v2')"""
+    return model_id.split('+', 1)[0]
+
+
+def _decode_payloads(block, dtype):
+    """float32 (n, dim) matrix from an (n, payload bytes) uint8 block"""
+    block = np.ascontiguousarray(block)
+    if dtype == 'int8':
+        scale = block[:, :4].copy().view('<f4')
+        return block[:, 4:].view(np.int8).astype(np.float32) * scale
+    return block.view('<f4' if dtype == 'float32' else '<f2').astype(np.float32)
+
+
+def embedding_header(value):
+    """Header of a stored embedding (version, dtype, dim, model), or None for legacy/invalid values"""
+    try:
+        return _parse_header(base64.b64decode(value))
+    except (binascii.Error, ValueError, TypeError):
+        return None
+
+
+def decode_embedding(value, model=None):
+    """
+    Decode one stored embedding (versioned or legacy float32) to a float32
+    vector, or None if it was written by a base model other than model
+    """
+    raw = base64.b64decode(value)
+    header = _parse_header(raw)
+    if header is None:
+        return np.frombuffer(raw, dtype='<f4').astype(np.float32)
+    if model is not None and base_model(header['model']) != base_model(model):
+        logger.warning(f"Skipping embedding from model {header['model']} (active model {model})")
+        return None
+    block = np.frombuffer(raw, dtype=np.uint8)[header['header_length']:].reshape(1, -1)
+    return _decode_payloads(block, header['dtype'])[0]
+
+
+def decode_embeddings(values, model=None):
+    """
+    Decode stored embeddings in bulk. Values are grouped by length; each group
+    is base64-decoded in one call and sliced with numpy. Groups whose records
+    don't share one header fall back to per-value decoding. Entries that are
+    empty, fail to decode or, when model is given, come from another base
+    model come back as None.
+    """
+    decoded = [None] * len(values)
+    mismatched = defaultdict(int)
+    groups = defaultdict(list)
+    for i, value in enumerate(values):
+        if isinstance(value, str) and value:
+            groups[len(value)].append(i)
+
+    for length, indices in groups.items():
+        try:
+            if length % 4 or any(values[i].endswith('=') for i in indices):
+                raise ValueError("padded values can't be decoded jointly")
+            raw = base64.b64decode(''.join(values[i] for i in indices))
+            block = np.frombuffer(raw, dtype=np.uint8).reshape(len(indices), -1)
+            header = _parse_header(block[0].tobytes())
+            if header is None:
+                if block.shape[1] % 4 or (block[:, :4] == np.frombuffer(MAGIC, dtype=np.uint8)).all(axis=1).any():
+                    raise ValueError("mixed formats")
+                matrix = block.copy().view('<f4').astype(np.float32)
+            else:
+                size = header['header_length']
+                if not (block[:, :size] == block[0, :size]).all():
+                    raise ValueError("mixed headers")
+                if model is not None and base_model(header['model']) != base_model(model):
+                    mismatched[header['model']] += len(indices)
+                    continue
+                matrix = _decode_payloads(block[:, size:], header['dtype'])
+            for row, i in enumerate(indices):
+                decoded[i] = matrix[row]
+        except Exception:
+            for i in indices:
+                try:
+                    header = embedding_header(values[i])
+                    if model is not None and header and base_model(header['model']) != base_model(model):
+                        mismatched[header['model']] += 1
+                        continue
+                    decoded[i] = decode_embedding(values[i])
+                except Exception as e:
+                    logger.error(f"Error decoding embedding: {str(e)}")
+    for other, count in mismatched.items():
+        logger.warning(f"Skipped {count} embeddings from model {other} (active model {model}); regenerate them")
+    return decoded
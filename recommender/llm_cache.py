@@ -0,0 +1,60 @@
+"""
+Persistent cache for LLM resume evaluations.
+
+Evaluations live in the host-shared ``llm_evaluations`` cache (see
+``cache_backends``; a SQLite file at ``LLM_CACHE_PATH`` shared by every
+worker by default, Redis when ``CACHE_BACKEND`` is 'redis'), keyed by a hash
+of the job description, the formatted resume text, the model id and the
+prompt version. Entries expire after ``LLM_CACHE_TTL_SECONDS``; the least
+recently used ones are evicted once the cache exceeds ``LLM_CACHE_MAX_BYTES``.
+The alias is separate from the default cache so cheap entries can't evict
+expensive evaluations. Callers must only store successful evaluations;
+errors and fallbacks are never cached.
+"""
+
+import hashlib
+import logging
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger('recommender')
+
+LLM_CACHE_ALIAS = 'llm_evaluations'
+LLM_CACHE_TTL_SECONDS = getattr(settings, 'LLM_CACHE_TTL_SECONDS', 7 * 24 * 3600)
+
+
+def evaluation_cache_key(job_desc, resume_text, model_id, prompt_version):
+    digest = hashlib.sha256()
+    for part in (prompt_version, model_id, job_desc, resume_text):
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class EvaluationCache:
+    """Evaluation cache on top of a Django cache alias, with a fixed TTL"""
+
+    def __init__(self, backend, ttl=LLM_CACHE_TTL_SECONDS):
+        self.backend = backend
+        self.ttl = ttl
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def set(self, key, evaluation):
+        self.backend.set(key, evaluation, self.ttl)
+
+
+_cache = None
+
+
+def get_evaluation_cache():
+    """Return the process-wide evaluation cache, or None if it can't be opened"""
+    global _cache
+    if _cache is None:
+        try:
+            _cache = EvaluationCache(caches[LLM_CACHE_ALIAS] if LLM_CACHE_ALIAS in settings.CACHES else caches['default'])
+        except Exception as e:
+            logger.error(f"Error opening LLM evaluation cache: {str(e)}")
+            return None
+    return _cache
@@ -10,10 +10,14 @@ import os
 import time
 import uuid
 import traceback
-from functools import lru_cache
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import httpx
 from django.conf import settings
-from openai import OpenAI
+from openai import OpenAI, APITimeoutError
 from dotenv import load_dotenv
+from .llm_cache import get_evaluation_cache, evaluation_cache_key
 
 logger = logging.getLogger('recommender')
 
@@ -55,6 +59,23 @@ else:
         "Please add OPENROUTER_API_KEY in your .env file or Django settings."
     )
 
+# Concurrency and timeouts for LLM evaluation
+LLM_MAX_CONCURRENCY = getattr(settings, "LLM_MAX_CONCURRENCY", 5)
+LLM_REQUEST_TIMEOUT = getattr(settings, "LLM_REQUEST_TIMEOUT", 30)
+LLM_EVALUATION_DEADLINE = getattr(settings, "LLM_EVALUATION_DEADLINE", 90)
+
+# Most NLP candidates hybrid recommendations will send to the LLM
+LLM_EVALUATION_BUDGET = getattr(settings, "LLM_EVALUATION_BUDGET", 20)
+
+# Resumes packed into one batched evaluation prompt (1 disables batching)
+LLM_BATCH_SIZE = getattr(settings, "LLM_BATCH_SIZE", 1)
+
+# Prompt token budgets for resume text, per candidate and per batched prompt,
+# and the completion tokens requested per evaluated candidate
+LLM_RESUME_TOKEN_BUDGET = getattr(settings, "LLM_RESUME_TOKEN_BUDGET", 800)
+LLM_BATCH_TOKEN_BUDGET = getattr(settings, "LLM_BATCH_TOKEN_BUDGET", 3000)
+LLM_MAX_OUTPUT_TOKENS = getattr(settings, "LLM_MAX_OUTPUT_TOKENS", 800)
+
 # Initialize OpenRouter client
 try:
     # Clean any whitespace from API key
@@ -64,14 +85,24 @@ try:
     if not cleaned_api_key:
         logger.error("OpenRouter API key is missing or empty")
     
-    # Initialize with proper headers
+    # Initialize with proper headers and one pooled keep-alive HTTP client
+    # shared by all concurrent evaluations
     client = OpenAI(
         base_url="https://openrouter.ai/api/v1",
         api_key=cleaned_api_key,
         default_headers={
             "HTTP-Referer": getattr(settings, "SITE_URL", "https://careerreco.app"),
             "X-Title": "CareerReco"
-        }
+        },
+        timeout=LLM_REQUEST_TIMEOUT,
+        max_retries=1,
+        http_client=httpx.Client(
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONCURRENCY * 2,
+                max_keepalive_connections=LLM_MAX_CONCURRENCY
+            ),
+            timeout=httpx.Timeout(LLM_REQUEST_TIMEOUT, connect=10.0)
+        )
     )
     logger.info("OpenRouter client initialized successfully")
     
@@ -95,8 +126,26 @@ LLM_MODELS = {
 # Default model to use
 DEFAULT_LLM_MODEL = "llama4"
 
-def format_resume_for_llm(resume):
-    """Convert resume dict to a formatted text string for LLM processing"""
+_token_encoder = None
+
+def count_tokens(text):
+    """
+    Count prompt tokens locally. Uses tiktoken's cl100k_base when installed
+    (close enough to the Llama tokenizer for budgeting), else ~4 chars per token.
+    """
+    global _token_encoder
+    if _token_encoder is None:
+        try:
+            import tiktoken
+            _token_encoder = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _token_encoder = False
+    if _token_encoder:
+        return len(_token_encoder.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+def _render_resume(resume, experience=None, skills=None, include_extras=True):
+    """Render resume sections; experience/skills override the resume's own lists (used when compacting)"""
     sections = []
     
     # Add name and contact if available
@@ -120,7 +169,7 @@ def format_resume_for_llm(resume):
         sections.append("Education: No formal education listed")
     
     # Add experience
-    experience = resume.get('experience', [])
+    experience = resume.get('experience', []) if experience is None else experience
     if experience and isinstance(experience, list) and len(experience) > 0:
         exp_list = []
         for exp in experience:
@@ -138,12 +187,15 @@ def format_resume_for_llm(resume):
         sections.append("Experience: No work experience listed")
     
     # Add skills
-    skills = resume.get('skills', [])
+    skills = resume.get('skills', []) if skills is None else skills
     if skills and isinstance(skills, list) and len(skills) > 0:
         sections.append("Skills: " + ", ".join(skills))
     else:
         sections.append("Skills: No specific skills listed")
     
+    if not include_extras:
+        return "\n\n".join(sections)
+    
     # Add languages
     languages = resume.get('languages', [])
     if languages and isinstance(languages, list) and len(languages) > 0:
@@ -168,14 +220,153 @@ def format_resume_for_llm(resume):
     
     return "\n\n".join(sections)
 
-@lru_cache(maxsize=100)
+def _truncate_to_tokens(text, max_tokens):
+    """Longest word prefix of text within max_tokens (with an ellipsis if cut)"""
+    words = text.split()
+    low, high = 0, len(words)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if count_tokens(" ".join(words[:mid]) + "...") <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return " ".join(words[:low]) + "..." if low else ""
+
+def _compact_resume(resume, token_budget):
+    """
+    Fit a resume into token_budget by priority: skills, the most recent roles
+    and education first, then role descriptions (most recent first, truncated
+    to what's left), then languages and certifications.
+    """
+    experience = [e for e in resume.get('experience', []) or [] if isinstance(e, dict)]
+    # Most recent roles first; ISO dates sort as strings and ongoing roles have no end date
+    experience.sort(key=lambda e: (not e.get('end_date'), e.get('start_date') or ''), reverse=True)
+    roles = [{'position': e.get('position', ''), 'company': e.get('company', '')} for e in experience]
+    skills = [s for s in resume.get('skills', []) or [] if isinstance(s, str)]
+    
+    def render(include_extras=False):
+        return _render_resume(resume, experience=roles, skills=skills, include_extras=include_extras)
+    
+    # Core sections: drop the oldest roles, then the least prominent skills, until they fit
+    while count_tokens(render()) > token_budget and len(roles) > 1:
+        roles.pop()
+    while count_tokens(render()) > token_budget and len(skills) > 5:
+        skills = skills[:max(5, len(skills) * 3 // 4)]
+    
+    # Role descriptions, most recent first, in whatever budget is left
+    for role, exp in zip(roles, experience):
+        description = (exp.get('description') or '').strip()
+        if not description:
+            continue
+        remaining = token_budget - count_tokens(render()) - 2
+        if remaining < 8:
+            break
+        role['description'] = description
+        if count_tokens(render()) > token_budget:
+            role['description'] = _truncate_to_tokens(description, remaining)
+    
+    with_extras = render(include_extras=True)
+    return with_extras if count_tokens(with_extras) <= token_budget else render()
+
+def format_resume_for_llm(resume, token_budget=None):
+    """
+    Convert resume dict to a formatted text string for LLM processing.
+    Resumes over token_budget (default LLM_RESUME_TOKEN_BUDGET, 0 for no
+    limit) are compacted by section priority; shorter ones are left verbatim.
+    """
+    token_budget = LLM_RESUME_TOKEN_BUDGET if token_budget is None else token_budget
+    text = _render_resume(resume)
+    if not token_budget or count_tokens(text) <= token_budget:
+        return text
+    compacted = _compact_resume(resume, token_budget)
+    logger.debug(f"Compacted resume from {count_tokens(text)} to {count_tokens(compacted)} tokens")
+    return compacted
+
+# Bump whenever the evaluation prompts change so cached evaluations are not reused
+PROMPT_VERSION = "1"
+BATCH_PROMPT_VERSION = "batch-1"
+
+def clamp_score(score, default=50):
+    """An LLM match score as an int in 0-100; default when it isn't a number"""
+    try:
+        return min(100, max(0, int(round(float(score)))))
+    except (TypeError, ValueError, OverflowError):
+        return default
+
+def is_cacheable_evaluation(evaluation):
+    """Only complete, successful evaluations may be cached"""
+    return isinstance(evaluation, dict) and not evaluation.get('error') and not evaluation.get('partial')
+
+def token_usage(completion, resume_tokens, batch_size=1):
+    """
+    Tokens used for one evaluation: the API-reported prompt/completion tokens
+    (an even share of them for batched prompts) and the locally counted
+    tokens of the resume text itself.
+    """
+    usage = getattr(completion, 'usage', None)
+    prompt_tokens = getattr(usage, 'prompt_tokens', None)
+    completion_tokens = getattr(usage, 'completion_tokens', None)
+    return {
+        'prompt_tokens': round(prompt_tokens / batch_size) if prompt_tokens is not None else None,
+        'completion_tokens': round(completion_tokens / batch_size) if completion_tokens is not None else None,
+        'resume_tokens': resume_tokens,
+        'batch_size': batch_size
+    }
+
+def read_cached_evaluation(job_desc, resume_text, selected_model, prompt_version):
+    """
+    Return the evaluation cached under prompt_version, or None. The single and
+    batch prompts are calibrated differently, so each reads only its own entries.
+    """
+    cache = get_evaluation_cache()
+    if cache is None:
+        return None
+    key = evaluation_cache_key(job_desc, resume_text, selected_model, prompt_version)
+    try:
+        cached = cache.get(key)
+    except Exception as e:
+        logger.error(f"Error reading LLM evaluation cache: {str(e)}")
+        return None
+    if cached is None:
+        return None
+    logger.info(f"LLM evaluation cache hit ({key[:12]})")
+    cached['score'] = clamp_score(cached.get('score'))
+    resume_tokens = (cached.get('token_usage') or {}).get('resume_tokens', count_tokens(resume_text))
+    cached['token_usage'] = {'prompt_tokens': 0, 'completion_tokens': 0,
+                             'resume_tokens': resume_tokens, 'cached': True}
+    return cached
+
+def store_evaluation(job_desc, resume_text, selected_model, prompt_version, evaluation):
+    """Cache an evaluation if it is complete and successful"""
+    cache = get_evaluation_cache()
+    if cache is None or not is_cacheable_evaluation(evaluation):
+        return
+    try:
+        cache.set(evaluation_cache_key(job_desc, resume_text, selected_model, prompt_version), evaluation)
+    except Exception as e:
+        logger.error(f"Error writing LLM evaluation cache: {str(e)}")
+
 def get_llm_evaluation(job_desc, resume_text, model_name=DEFAULT_LLM_MODEL):
+    """
+    Evaluate a resume against a job description, serving repeated requests
+    from the persistent evaluation cache shared by all workers.
+    """
+    selected_model = LLM_MODELS.get(model_name, LLM_MODELS[DEFAULT_LLM_MODEL])
+    cached = read_cached_evaluation(job_desc, resume_text, selected_model, PROMPT_VERSION)
+    if cached is not None:
+        return cached
+    
+    evaluation = request_llm_evaluation(job_desc, resume_text, model_name)
+    store_evaluation(job_desc, resume_text, selected_model, PROMPT_VERSION, evaluation)
+    return evaluation
+
+def request_llm_evaluation(job_desc, resume_text, model_name=DEFAULT_LLM_MODEL):
     # Add request tracing
     request_id = str(uuid.uuid4())[:8]
     logger.info(f"[{request_id}] Starting LLM evaluation with model: {model_name}")
     """
     Use LLM to evaluate how well a resume matches a job description.
-    Caches results to avoid repeated API calls.
+    Always calls the API; use get_llm_evaluation for cached access.
     """
     start_time = time.time()
     request_id = f"req_{int(time.time())}_{model_name[:4]}"
@@ -267,7 +458,7 @@ Score the match from 0-100 and explain your reasoning in the required JSON forma
                     {"role": "assistant", "content": "I'll analyze this match and provide a JSON response."}
                 ],
                 temperature=0.1,  # Lower temperature for more consistent outputs
-                max_tokens=1500,  # Increase token limit to ensure complete response
+                max_tokens=LLM_MAX_OUTPUT_TOKENS,  # Evaluations are a few hundred tokens; don't reserve more
                 top_p=0.9,       # More focused sampling
                 presence_penalty=0.1,  # Slight penalty for repetition
                 seed=42          # Use consistent seed for more predictable outputs
@@ -279,6 +470,8 @@ Score the match from 0-100 and explain your reasoning in the required JSON forma
         
         response_text = completion.choices[0].message.content
         logger.info(f"[{request_id}] Raw response length: {len(response_text)} chars")
+        usage = token_usage(completion, count_tokens(resume_text))
+        logger.info(f"[{request_id}] Token usage: {usage}")
         
         # Parse the JSON response
         try:
@@ -301,14 +494,15 @@ Score the match from 0-100 and explain your reasoning in the required JSON forma
                 "experience_match": "Unknown",
                 "education_match": "Unknown",
                 "strengths": [],
-                "weaknesses": []
+                "weaknesses": [],
+                "partial": True  # Not cached; the next request retries
             }
             
             # Try to extract just the score and reasoning which appear at the beginning
             score_match = re.search(r'"score"\s*:\s*(\d+)', response_text)
             if score_match:
                 try:
-                    default_result["score"] = int(score_match.group(1))
+                    default_result["score"] = clamp_score(score_match.group(1))
                     logger.info(f"[{request_id}] Successfully extracted score: {default_result['score']}")
                 except:
                     pass
@@ -327,12 +521,16 @@ Score the match from 0-100 and explain your reasoning in the required JSON forma
                     if start >= 0 and end > start:
                         result = json.loads(clean_text[start:end+1])
                         logger.info(f"[{request_id}] Successfully parsed full JSON")
+                        # Rankings and the hybrid cascade's bound rely on an int score in 0-100
+                        result['score'] = clamp_score(result.get('score'))
+                        result['token_usage'] = usage
                         return result
             except:
                 logger.warning(f"[{request_id}] Full JSON parsing failed, using extracted values")
                 pass
                 
             # Return our default result with extracted values
+            default_result['token_usage'] = usage
             return default_result
             
             # Ensure we have the expected fields or provide defaults
@@ -368,13 +566,18 @@ Score the match from 0-100 and explain your reasoning in the required JSON forma
                 import re
                 score_match = re.search(r'score[:\s]+(\d+)', response_text, re.IGNORECASE)
                 if score_match:
-                    fallback_result["score"] = min(100, max(0, int(score_match.group(1))))
+                    fallback_result["score"] = clamp_score(score_match.group(1))
                     logger.info(f"[{request_id}] Extracted fallback score: {fallback_result['score']}")
             except Exception as extract_err:
                 logger.error(f"[{request_id}] Error extracting fallback score: {str(extract_err)}")
             
+            fallback_result['token_usage'] = usage
             return fallback_result
             
+    except APITimeoutError:
+        # Let the caller substitute its fallback evaluation (timeouts are never cached)
+        logger.error(f"[{request_id}] OpenRouter request timed out after {LLM_REQUEST_TIMEOUT}s")
+        raise
     except Exception as e:
         error_trace = traceback.format_exc()
         logger.error(f"[{request_id}] Error during LLM evaluation: {str(e)}")
@@ -386,7 +589,365 @@ Score the match from 0-100 and explain your reasoning in the required JSON forma
             "exception": str(e)
         }
 
-def recommend_resumes_llm(job_desc, resumes, top_n=5, model_name=DEFAULT_LLM_MODEL):
+BATCH_SYSTEM_PROMPT = """You are an expert resume analyst and hiring consultant with deep knowledge of various industries and roles.
+Your task is to evaluate, independently, how well each of several candidates' resumes matches one job description.
+Judge every candidate on their own merits against the job, not relative to the other candidates.
+
+IMPORTANT: Your response MUST be a valid, properly formatted JSON object with one entry per candidate, using the candidate ids given:
+{
+  "evaluations": [
+    {
+      "id": "C1",
+      "score": 85,
+      "reasoning": "Text explanation of the match scoring",
+      "skill_match": [
+        {"skill": "Python", "match": true, "importance": "critical"},
+        {"skill": "AWS", "match": false, "importance": "preferred"}
+      ],
+      "experience_match": "String describing how well experience matches",
+      "education_match": "String describing how well education matches",
+      "strengths": ["String array of candidate strengths for this role"],
+      "weaknesses": ["String array of candidate gaps for this role"]
+    }
+  ]
+}
+
+DO NOT include any text outside the JSON object. Do not include markdown formatting, code blocks, or explanations. Return ONLY the JSON object itself."""
+
+def parse_batch_response(response_text, candidate_ids):
+    """
+    Split a batched evaluation response into {candidate_id: evaluation}.
+    Candidates that are missing or whose entry has no valid 0-100 score are left out.
+    """
+    text = (response_text or '').strip()
+    start, end = text.find('{'), text.rfind('}')
+    if start < 0 or end <= start:
+        return {}
+    try:
+        payload = json.loads(text[start:end+1])
+    except json.JSONDecodeError:
+        return {}
+    entries = payload.get('evaluations') if isinstance(payload, dict) else None
+    if not isinstance(entries, list):
+        return {}
+    
+    parsed = {}
+    for entry in entries:
+        if not isinstance(entry, dict) or entry.get('id') not in candidate_ids:
+            continue
+        try:
+            score = int(entry.get('score'))
+        except (TypeError, ValueError):
+            continue
+        if not 0 <= score <= 100:
+            continue
+        evaluation = {k: v for k, v in entry.items() if k != 'id'}
+        evaluation['score'] = score
+        evaluation.setdefault('reasoning', '')
+        parsed[entry['id']] = evaluation
+    return parsed
+
+def request_llm_batch_evaluation(job_desc, resume_texts, model_name=DEFAULT_LLM_MODEL):
+    """
+    Evaluate several resumes against a job description in one chat completion.
+    Returns a list aligned with resume_texts holding each evaluation, or None
+    for candidates whose result was missing or failed to parse. Errors from
+    the request itself, including APITimeoutError, propagate to the caller.
+    """
+    request_id = f"batch_{int(time.time())}_{model_name[:4]}"
+    if not ROUTER_API_KEY:
+        logger.error(f"[{request_id}] Cannot perform batch evaluation: OpenRouter API key is missing")
+        return [None] * len(resume_texts)
+    
+    candidate_ids = [f"C{n + 1}" for n in range(len(resume_texts))]
+    candidates = "\n\n".join(
+        f"=== CANDIDATE {candidate_id} ===\n{resume_text}"
+        for candidate_id, resume_text in zip(candidate_ids, resume_texts)
+    )
+    user_prompt = f"""Please evaluate how well each of the following {len(resume_texts)} candidates matches the job description.
+
+JOB DESCRIPTION:
+{job_desc}
+
+CANDIDATES:
+{candidates}
+
+For each candidate consider:
+1. Technical skills alignment (critical skills vs. nice-to-have)
+2. Years and relevance of experience
+3. Educational qualifications
+4. Seniority level match
+5. Overall suitability
+
+Score each match from 0-100 and return one evaluation per candidate id ({", ".join(candidate_ids)}) in the required JSON format.
+"""
+    start_time = time.time()
+    selected_model = LLM_MODELS.get(model_name, LLM_MODELS[DEFAULT_LLM_MODEL])
+    logger.info(f"[{request_id}] Sending batch of {len(resume_texts)} resumes to OpenRouter ({len(user_prompt)} chars)")
+    try:
+        completion = client.chat.completions.create(
+            extra_headers={
+                "HTTP-Referer": getattr(settings, "SITE_URL", "https://careerreco.app"),
+                "X-Title": "CareerReco"
+            },
+            model=selected_model,
+            response_format={"type": "json_object"},
+            messages=[
+                {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+                {"role": "user", "content": user_prompt}
+            ],
+            temperature=0.1,
+            max_tokens=LLM_MAX_OUTPUT_TOKENS * len(resume_texts),
+            top_p=0.9,
+            presence_penalty=0.1,
+            seed=42
+        )
+        response_text = completion.choices[0].message.content
+    except APITimeoutError:
+        logger.error(f"[{request_id}] OpenRouter batch request timed out after {LLM_REQUEST_TIMEOUT}s")
+        raise
+    except Exception as e:
+        logger.error(f"[{request_id}] Batch evaluation failed: {str(e)}")
+        raise
+    
+    parsed = parse_batch_response(response_text, set(candidate_ids))
+    logger.info(f"[{request_id}] Batch evaluation parsed {len(parsed)}/{len(resume_texts)} candidates in {time.time() - start_time:.2f} seconds")
+    for candidate_id, resume_text in zip(candidate_ids, resume_texts):
+        if candidate_id in parsed:
+            parsed[candidate_id]['token_usage'] = token_usage(completion, count_tokens(resume_text), len(resume_texts))
+    return [parsed.get(candidate_id) for candidate_id in candidate_ids]
+
+def split_batch_evaluation(job_desc, resume_texts, model_name=DEFAULT_LLM_MODEL):
+    """
+    request_llm_batch_evaluation, retrying each half of the batch when the
+    request fails for a reason other than a timeout (an oversized prompt, a
+    transient API error). Single resumes are left as None for the caller's
+    single-resume call; timeouts propagate, as retrying them would only time
+    out again.
+    """
+    if len(resume_texts) == 1:
+        return [None]
+    try:
+        return request_llm_batch_evaluation(job_desc, resume_texts, model_name)
+    except APITimeoutError:
+        raise
+    except Exception:
+        half = len(resume_texts) // 2
+        return (split_batch_evaluation(job_desc, resume_texts[:half], model_name)
+                + split_batch_evaluation(job_desc, resume_texts[half:], model_name))
+
+def get_llm_batch_evaluations(job_desc, resume_texts, model_name=DEFAULT_LLM_MODEL):
+    """
+    Cached batched evaluation: returns a list aligned with resume_texts,
+    with None for candidates that still need a single-resume call. If the
+    batch times out, its uncached candidates get the fallback evaluation.
+    """
+    selected_model = LLM_MODELS.get(model_name, LLM_MODELS[DEFAULT_LLM_MODEL])
+    evaluations = [
+        read_cached_evaluation(job_desc, resume_text, selected_model, BATCH_PROMPT_VERSION)
+        for resume_text in resume_texts
+    ]
+    misses = [n for n, evaluation in enumerate(evaluations) if evaluation is None]
+    if len(misses) == 1:
+        # Nothing to amortize; the caller's single-resume call is just as cheap
+        return evaluations
+    if misses:
+        try:
+            batch = split_batch_evaluation(job_desc, [resume_texts[n] for n in misses], model_name)
+        except APITimeoutError:
+            for n in misses:
+                evaluations[n] = fallback_evaluation()
+            return evaluations
+        for n, evaluation in zip(misses, batch):
+            if evaluation is not None:
+                store_evaluation(job_desc, resume_texts[n], selected_model, BATCH_PROMPT_VERSION, evaluation)
+                evaluations[n] = evaluation
+    return evaluations
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_llm_executor():
+    """Process-wide thread pool bounding concurrent OpenRouter calls"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            # Requests arriving together must not each create a pool
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=LLM_MAX_CONCURRENCY, thread_name_prefix="llm-eval")
+    return _executor
+
+def fallback_evaluation():
+    """Evaluation used when the LLM call fails or times out"""
+    return {
+        'score': 50,  # Default middle score
+        'reasoning': f"Basic matching due to technical limitations. This candidate may have relevant skills and experience, but detailed analysis was not possible.",
+        'strengths': ["Resume contains relevant keywords", "Basic qualifications met"],
+        'weaknesses': ["Unable to perform detailed analysis"],
+        'error': True
+    }
+
+def iter_llm_evaluations(job_desc, resumes, model_name=DEFAULT_LLM_MODEL, deadline=None, window=None,
+                         should_stop=None, batch_size=None):
+    """
+    Evaluate resumes concurrently on the shared executor and yield
+    (index, evaluation, succeeded) in completion order. Calls that raise,
+    time out, or are still pending when the deadline passes yield the
+    fallback evaluation.
+    
+    Resumes are submitted in list order, batch_size at a time (default
+    LLM_BATCH_SIZE) as one batched prompt; candidates a batch fails to
+    evaluate are retried with single-resume calls, except after a timeout,
+    when they yield the fallback evaluation. With a window, at most
+    that many calls are in flight; should_stop(index) is checked before each
+    resume is queued and, once it returns True, nothing further is submitted.
+    Resumes never submitted are not yielded.
+    """
+    deadline = LLM_EVALUATION_DEADLINE if deadline is None else deadline
+    batch_size = max(1, LLM_BATCH_SIZE if batch_size is None else batch_size)
+    # Batched prompts share LLM_BATCH_TOKEN_BUDGET between their resumes
+    token_budget = min(LLM_RESUME_TOKEN_BUDGET, LLM_BATCH_TOKEN_BUDGET // batch_size) if batch_size > 1 else None
+    window = window or len(resumes)
+    end_time = time.time() + deadline
+    executor = get_llm_executor()
+    futures = {}
+    texts = {}
+    remaining = iter(range(len(resumes)))
+    exhausted = False
+    
+    def next_batch():
+        nonlocal exhausted
+        batch = []
+        while not exhausted and len(batch) < batch_size:
+            i = next(remaining, None)
+            if i is None:
+                exhausted = True
+            elif should_stop is not None and should_stop(i):
+                logger.info(f"Stopping LLM submissions before resume {i}")
+                exhausted = True
+            else:
+                try:
+                    texts[i] = format_resume_for_llm(resumes[i], token_budget=token_budget)
+                except Exception as e:
+                    logger.error(f"Error formatting resume {i} for LLM: {str(e)}")
+                    continue
+                logger.debug(f"Resume {i+1} text length: {len(texts[i])} chars")
+                batch.append(i)
+        return batch
+    
+    def submit_single(i):
+        futures[executor.submit(get_llm_evaluation, job_desc, texts[i], model_name)] = [i]
+    
+    def fill_window():
+        while len(futures) < window:
+            batch = next_batch()
+            if not batch:
+                return
+            if len(batch) == 1:
+                submit_single(batch[0])
+            else:
+                futures[executor.submit(get_llm_batch_evaluations, job_desc, [texts[i] for i in batch], model_name)] = batch
+    
+    fill_window()
+    while futures:
+        done, _ = wait(futures, timeout=max(0, end_time - time.time()), return_when=FIRST_COMPLETED)
+        if not done:
+            pending = [i for indices in futures.values() for i in indices]
+            logger.error(f"LLM evaluation deadline of {deadline}s reached with {len(pending)} resumes pending")
+            for future in futures:
+                future.cancel()
+            for i in pending:
+                yield i, fallback_evaluation(), False
+            return
+        for future in done:
+            indices = futures.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"Error evaluating resumes {indices}: {str(e)}")
+                for i in indices:
+                    yield i, fallback_evaluation(), False
+                continue
+            if len(indices) == 1 and not isinstance(result, list):
+                yield indices[0], result, True
+                continue
+            for i, evaluation in zip(indices, result):
+                if evaluation is None:
+                    # Missing or unparseable in the batch response
+                    submit_single(i)
+                else:
+                    # Only a timed-out batch returns error evaluations
+                    yield i, evaluation, not evaluation.get('error')
+        # Refill the window; should_stop sees the results yielded above
+        fill_window()
+
+def build_llm_result(resume, evaluation):
+    """Turn an LLM evaluation into the recommendation entry the frontend expects"""
+    # Normalize score to 0-1 range
+    raw_score = clamp_score(evaluation.get('score', 0), default=0)
+    normalized_score = raw_score / 100
+    
+    # Generate match reasons from evaluation - formatted to match NLP model display
+    match_reasons = []
+    
+    # First add the main reasoning as a long paragraph (will be displayed at the top)
+    if 'reasoning' in evaluation and evaluation['reasoning']:
+        match_reasons.append(evaluation['reasoning'])
+        
+    # Then add strengths with the exact format that ResumeCard.jsx expects
+    if 'strengths' in evaluation and evaluation['strengths']:
+        for strength in evaluation['strengths']:
+            match_reasons.append(f"✓ Strength: {strength}")
+            
+    # Then add weaknesses/gaps with the exact format that ResumeCard.jsx expects
+    if 'weaknesses' in evaluation and evaluation['weaknesses']:
+        for weakness in evaluation['weaknesses']:
+            match_reasons.append(f"△ Gap: {weakness}")
+        
+    # Add skill matches if available
+    if 'skill_match' in evaluation and evaluation['skill_match']:
+        for skill in evaluation['skill_match']:
+            if isinstance(skill, dict) and 'skill' in skill and 'match' in skill:
+                if skill['match']:
+                    match_reasons.append(f"✓ Strength: Has required skill: {skill['skill']}")
+                else:
+                    match_reasons.append(f"△ Gap: Missing skill: {skill['skill']}")
+    
+    return {
+        'resume': resume,
+        'score': normalized_score,
+        'raw_score': raw_score,
+        'reasoning': evaluation.get('reasoning', ''),
+        'skill_match': evaluation.get('skill_match', []),
+        'experience_match': evaluation.get('experience_match', ''),
+        'education_match': evaluation.get('education_match', ''),
+        'strengths': evaluation.get('strengths', []),
+        'weaknesses': evaluation.get('weaknesses', []),
+        'match_reasons': match_reasons,
+        'token_usage': evaluation.get('token_usage'),
+        'llm_error': bool(evaluation.get('error'))
+    }
+
+def llm_only_candidates(job_desc, resumes, top_n=5, budget=None):
+    """
+    Resumes worth an LLM call in llm_only mode: the best `budget` (default
+    LLM_EVALUATION_BUDGET, at least top_n) by NLP score, so the number of paid
+    calls doesn't grow with the corpus. Falls back to the first ones in corpus
+    order if NLP ranking fails.
+    """
+    budget = max(int(top_n), LLM_EVALUATION_BUDGET if budget is None else max(0, budget))
+    if len(resumes) <= budget:
+        return list(resumes)
+    try:
+        from .utils import recommend_resumes
+        by_id = {resume.get('id'): resume for resume in resumes}
+        ranked = index_nlp_results(recommend_resumes(job_desc, resumes, top_n=budget))
+        return [by_id[resume_id] for resume_id, _ in ranked[:budget] if resume_id in by_id]
+    except Exception as e:
+        logger.error(f"Error pre-ranking candidates for LLM evaluation: {str(e)}")
+        return list(resumes[:budget])
+
+def recommend_resumes_llm(job_desc, resumes, top_n=5, model_name=DEFAULT_LLM_MODEL, llm_budget=None):
     """
     Recommend resumes for a job description using LLM-based matching.
     
@@ -395,6 +956,8 @@ def recommend_resumes_llm(job_desc, resumes, top_n=5, model_name=DEFAULT_LLM_MOD
         resumes (list): List of resume dictionaries
         top_n (int): Number of top recommendations to return
         model_name (str): Name of the LLM model to use
+        llm_budget (int): Most candidates to evaluate with the LLM, picked by NLP score
+            (default LLM_EVALUATION_BUDGET; see llm_only_candidates)
         
     Returns:
         list: Top N resume recommendations with scores and explanations
@@ -413,79 +976,24 @@ def recommend_resumes_llm(job_desc, resumes, top_n=5, model_name=DEFAULT_LLM_MOD
     results = []
     success_count = 0
     error_count = 0
+    candidates = llm_only_candidates(job_desc, resumes, top_n, llm_budget)
+    logger.info(f"Evaluating {len(candidates)} of {len(resumes)} resumes with the LLM")
     
-    for i, resume in enumerate(resumes):
-        try:
-            # Generate resume text for LLM
-            resume_text = format_resume_for_llm(resume)
-            logger.debug(f"Resume {i+1} text length: {len(resume_text)} chars")
-            
-            # Get LLM evaluation (with error handling)
-            try:
-                # For debugging - print API key without showing full key
-                api_key_preview = "*" * (len(ROUTER_API_KEY.strip()) - 4) + ROUTER_API_KEY.strip()[-4:] if ROUTER_API_KEY else "None"
-                logger.info(f"Using API key: {api_key_preview}")
-                
-                evaluation = get_llm_evaluation(job_desc, resume_text, model_name)
+    # Evaluate concurrently (bounded by LLM_MAX_CONCURRENCY) and collect in completion order
+    try:
+        for i, evaluation, succeeded in iter_llm_evaluations(job_desc, candidates, model_name):
+            if succeeded:
                 success_count += 1
-            except Exception as e:
-                logger.error(f"Error evaluating resume {i}: {str(e)}")
-                # Use fallback evaluation with basic score
-                evaluation = {
-                    'score': 50,  # Default middle score
-                    'reasoning': f"Basic matching due to technical limitations. This candidate may have relevant skills and experience, but detailed analysis was not possible.",
-                    'strengths': ["Resume contains relevant keywords", "Basic qualifications met"],
-                    'weaknesses': ["Unable to perform detailed analysis"],
-                    'error': True
-                }
+            else:
                 error_count += 1
-            
-            # Normalize score to 0-1 range
-            normalized_score = evaluation.get('score', 0) / 100
-            
-            # Generate match reasons from evaluation - formatted to match NLP model display
-            match_reasons = []
-            
-            # First add the main reasoning as a long paragraph (will be displayed at the top)
-            if 'reasoning' in evaluation and evaluation['reasoning']:
-                match_reasons.append(evaluation['reasoning'])
-                
-            # Then add strengths with the exact format that ResumeCard.jsx expects
-            if 'strengths' in evaluation and evaluation['strengths']:
-                for strength in evaluation['strengths']:
-                    match_reasons.append(f"✓ Strength: {strength}")
-                    
-            # Then add weaknesses/gaps with the exact format that ResumeCard.jsx expects
-            if 'weaknesses' in evaluation and evaluation['weaknesses']:
-                for weakness in evaluation['weaknesses']:
-                    match_reasons.append(f"△ Gap: {weakness}")
-                
-            # Add skill matches if available
-            if 'skill_match' in evaluation and evaluation['skill_match']:
-                for skill in evaluation['skill_match']:
-                    if isinstance(skill, dict) and 'skill' in skill and 'match' in skill:
-                        if skill['match']:
-                            match_reasons.append(f"✓ Strength: Has required skill: {skill['skill']}")
-                        else:
-                            match_reasons.append(f"△ Gap: Missing skill: {skill['skill']}")
-            
-            # Add to results
-            results.append({
-                'resume': resume,
-                'score': normalized_score,
-                'raw_score': evaluation.get('score', 0),
-                'reasoning': evaluation.get('reasoning', ''),
-                'skill_match': evaluation.get('skill_match', []),
-                'experience_match': evaluation.get('experience_match', ''),
-                'education_match': evaluation.get('education_match', ''),
-                'strengths': evaluation.get('strengths', []),
-                'weaknesses': evaluation.get('weaknesses', []),
-                'match_reasons': match_reasons
-            })
-            
-        except Exception as e:
-            logger.error(f"Critical error processing resume {i}: {str(e)}")
-            logger.error(traceback.format_exc())
+            try:
+                results.append(build_llm_result(candidates[i], evaluation))
+            except Exception as e:
+                logger.error(f"Critical error processing resume {i}: {str(e)}")
+                logger.error(traceback.format_exc())
+    except Exception as e:
+        logger.error(f"Critical error during LLM evaluation: {str(e)}")
+        logger.error(traceback.format_exc())
     
     # Sort results by score in descending order
     results.sort(key=lambda x: x['score'], reverse=True)
@@ -517,8 +1025,126 @@ def recommend_resumes_llm(job_desc, resumes, top_n=5, model_name=DEFAULT_LLM_MOD
     
     return top_results
 
+def _result_resume(result):
+    """NLP results are either {'resume': {...}} or the resume itself"""
+    if 'resume' in result and isinstance(result['resume'], dict):
+        return result['resume']
+    return result
+
+def combine_hybrid_result(nlp_result, llm_result, nlp_weight=0.4, llm_weight=0.6):
+    """Hybrid entry for a candidate; llm_result is None when it wasn't evaluated by the LLM"""
+    nlp_score = nlp_result['score']
+    resume_data = _result_resume(nlp_result)
+    if llm_result is None:
+        # Scale up to compensate for the missing LLM component
+        return {
+            'resume': resume_data,
+            'score': nlp_score * (nlp_weight + llm_weight),
+            'nlp_score': nlp_score,
+            'llm_score': 0,
+            'nlp_reasoning': nlp_result.get('reasoning', ''),
+            'llm_reasoning': "Not evaluated by LLM"
+        }
+    llm_score = llm_result['score']
+    return {
+        'resume': resume_data,
+        'score': (nlp_weight * nlp_score) + (llm_weight * llm_score),
+        'nlp_score': nlp_score,
+        'llm_score': llm_score,
+        'nlp_reasoning': nlp_result.get('reasoning', ''),
+        'llm_reasoning': llm_result.get('reasoning', ''),
+        'skill_match': llm_result.get('skill_match', []),
+        'strengths': llm_result.get('strengths', []),
+        'weaknesses': llm_result.get('weaknesses', []),
+        'token_usage': llm_result.get('token_usage'),
+        'llm_error': llm_result.get('llm_error', False)
+    }
+
+def nlp_fallback_recommendations(job_desc, resumes, top_n=5):
+    """Traditional NLP recommendations shaped like LLM results, used when the LLM returns nothing"""
+    from .utils import recommend_resumes
+    fallback_recommendations = recommend_resumes(job_desc, resumes, top_n=top_n)
+    
+    # Add LLM-specific fields to maintain compatibility
+    for rec in fallback_recommendations:
+        rec['reasoning'] = "Generated using traditional NLP matching (LLM unavailable)"
+        rec['match_reasons'] = [
+            "Fallback mode: LLM evaluation unavailable",
+            "✓ Strength: Resume contains relevant skills and experience",
+            "△ Note: This is a basic match without semantic analysis"
+        ]
+    return fallback_recommendations
+
+def index_nlp_results(nlp_results):
+    """(resume_id, nlp_result) pairs in NLP order, dropping results without an id and duplicate ids"""
+    indexed = {}
+    for result in nlp_results:
+        resume_id = _result_resume(result).get('id')
+        if resume_id is None:
+            logger.warning(f"Skipping NLP result with unexpected structure: {result}")
+            continue
+        indexed.setdefault(resume_id, result)
+    return list(indexed.items())
+
+def iter_hybrid_cascade(job_desc, ranked, top_n=5, nlp_weight=0.4, llm_weight=0.6,
+                        model_name=DEFAULT_LLM_MODEL, budget=None):
+    """
+    Adaptive LLM cascade over NLP-ranked candidates (see index_nlp_results).
+    
+    The first `budget` candidates are evaluated in NLP order. A candidate's
+    combined score can be at most nlp_weight * nlp + llm_weight (an LLM score
+    of 100), or its scaled NLP score if it is never evaluated; both grow with
+    the NLP score, so once the next candidate's bound can't beat the current
+    Nth best score no remaining one can enter the top N and no further LLM
+    calls are made. The final ranking is the same as evaluating the whole
+    budget.
+    
+    Yields ('evaluation', entry) as each LLM evaluation completes, then
+    ('final', top N combined entries).
+    """
+    budget = LLM_EVALUATION_BUDGET if budget is None else max(0, budget)
+    candidates = ranked[:budget]
+    
+    # Candidates outside the budget keep their scaled NLP score
+    combined = {resume_id: combine_hybrid_result(result, None, nlp_weight, llm_weight)
+                for resume_id, result in ranked[budget:]}
+    known_scores = [entry['score'] for entry in combined.values()]
+    
+    def upper_bound(i):
+        nlp_score = candidates[i][1]['score']
+        return max(nlp_weight * nlp_score + llm_weight, nlp_score * (nlp_weight + llm_weight))
+    
+    def should_stop(i):
+        if len(known_scores) < top_n:
+            return False
+        return upper_bound(i) < heapq.nlargest(top_n, known_scores)[-1]
+    
+    evaluated = 0
+    for i, evaluation, succeeded in iter_llm_evaluations(
+            job_desc, [_result_resume(r) for _, r in candidates], model_name,
+            window=LLM_MAX_CONCURRENCY, should_stop=should_stop):
+        resume_id, nlp_result = candidates[i]
+        try:
+            llm_result = build_llm_result(_result_resume(nlp_result), evaluation)
+        except Exception as e:
+            logger.error(f"Error processing LLM evaluation for resume {resume_id}: {str(e)}")
+            continue
+        entry = combine_hybrid_result(nlp_result, llm_result, nlp_weight, llm_weight)
+        combined[resume_id] = entry
+        known_scores.append(entry['score'])
+        evaluated += 1
+        yield 'evaluation', entry
+    
+    logger.info(f"LLM cascade evaluated {evaluated} of {len(candidates)} budgeted candidates")
+    
+    # Skipped or failed candidates fall back to their scaled NLP score
+    results = [combined.get(resume_id) or combine_hybrid_result(result, None, nlp_weight, llm_weight)
+               for resume_id, result in ranked]
+    results.sort(key=lambda x: x['score'], reverse=True)
+    yield 'final', results[:top_n]
+
 def hybrid_recommend_resumes(job_desc, resumes, top_n=5, nlp_weight=0.4, llm_weight=0.6, 
-                            nlp_func=None, model_name=DEFAULT_LLM_MODEL):
+                            nlp_func=None, model_name=DEFAULT_LLM_MODEL, llm_budget=None):
     """
     Hybrid recommendation combining traditional NLP and LLM approaches.
     
@@ -530,6 +1156,7 @@ def hybrid_recommend_resumes(job_desc, resumes, top_n=5, nlp_weight=0.4, llm_wei
         llm_weight (float): Weight for LLM-based scores (0-1)
         nlp_func (callable): Function to call for NLP-based recommendations
         model_name (str): Name of the LLM model to use
+        llm_budget (int): Most candidates to evaluate with the LLM (default LLM_EVALUATION_BUDGET)
         
     Returns:
         list: Top N resume recommendations with combined scores
@@ -540,80 +1167,52 @@ def hybrid_recommend_resumes(job_desc, resumes, top_n=5, nlp_weight=0.4, llm_wei
         nlp_func = default_nlp_func
     
     # Phase 1: Get traditional NLP recommendations with scores
-    nlp_results = nlp_func(job_desc, resumes, top_n=len(resumes))
+    ranked = index_nlp_results(nlp_func(job_desc, resumes, top_n=len(resumes)))
     
-    # Create a map of resume ID to NLP score
-    nlp_scores = {}
-    for result in nlp_results:
-        # Check if the result has a nested 'resume' key or if the resume data is directly in the result
-        if 'resume' in result and isinstance(result['resume'], dict) and 'id' in result['resume']:
-            nlp_scores[result['resume']['id']] = result['score']
-        elif 'id' in result:  # If the resume data is directly in the result
-            nlp_scores[result['id']] = result['score']
-        else:
-            logger.warning(f"Skipping NLP result with unexpected structure: {result}")
+    # Phase 2: LLM cascade over the top NLP candidates, stopping once the top N is settled
+    for event, payload in iter_hybrid_cascade(job_desc, ranked, top_n, nlp_weight, llm_weight,
+                                              model_name=model_name, budget=llm_budget):
+        if event == 'final':
+            return payload
+    return []
+
+def stream_recommendations(job_desc, resumes, top_n=5, model_name=DEFAULT_LLM_MODEL, recommendation_type="hybrid",
+                           nlp_weight=0.4, llm_weight=0.6, llm_budget=None):
+    """
+    Generator behind the streaming LLM endpoint. Yields (event, payload) pairs:
+    'shortlist' with the candidates about to be evaluated (and their NLP scores
+    as provisional scores in hybrid mode), one 'evaluation' per candidate as its
+    LLM evaluation completes, then 'final' with the re-ranked top N in the same
+    shape as the non-streaming response.
+    """
+    final = []
+    if recommendation_type == "hybrid":
+        from .utils import recommend_resumes
+        ranked = index_nlp_results(recommend_resumes(job_desc, resumes, top_n=len(resumes)))
+        budget = LLM_EVALUATION_BUDGET if llm_budget is None else max(0, llm_budget)
+        yield 'shortlist', [
+            {'resume': _result_resume(r), 'score': r['score'], 'provisional': True}
+            for _, r in ranked[:budget]
+        ]
+        for event, payload in iter_hybrid_cascade(job_desc, ranked, top_n, nlp_weight, llm_weight,
+                                                  model_name=model_name, budget=budget):
+            if event == 'final':
+                final = payload
+            else:
+                yield event, payload
+    else:
+        # Same NLP pre-filter and budget as the non-streaming llm_only path
+        candidates = llm_only_candidates(job_desc, resumes, top_n, llm_budget)
+        yield 'shortlist', [{'resume': r, 'score': None, 'provisional': True} for r in candidates]
+        results = []
+        for i, evaluation, succeeded in iter_llm_evaluations(job_desc, candidates, model_name):
+            entry = build_llm_result(candidates[i], evaluation)
+            results.append(entry)
+            yield 'evaluation', entry
+        results.sort(key=lambda x: x['score'], reverse=True)
+        final = results[:top_n]
     
-    # Phase 2: Get LLM recommendations for top candidates from NLP
-    # Only process top 20 or all if less than 20 to save API costs
-    top_nlp_candidates = []
-    for r in nlp_results[:min(20, len(nlp_results))]:
-        if 'resume' in r and isinstance(r['resume'], dict):
-            top_nlp_candidates.append(r['resume'])
-        elif 'id' in r:  # If the resume data is directly in the result
-            top_nlp_candidates.append(r)
-    logger.info(f"Selected {len(top_nlp_candidates)} top candidates for LLM evaluation")
-    llm_results = recommend_resumes_llm(job_desc, top_nlp_candidates, top_n=len(top_nlp_candidates), model_name=model_name)
-    
-    # Create a map of resume ID to LLM score
-    llm_scores = {}
-    for result in llm_results:
-        if 'resume' in result and isinstance(result['resume'], dict) and 'id' in result['resume']:
-            llm_scores[result['resume']['id']] = result['score']
-    
-    # Phase 3: Combine scores
-    combined_results = []
-    for resume_id, nlp_score in nlp_scores.items():
-        # If we have an LLM score for this resume, combine them
-        if resume_id in llm_scores:
-            llm_score = llm_scores[resume_id]
-            combined_score = (nlp_weight * nlp_score) + (llm_weight * llm_score)
-            
-            # Find the full result objects to get reasoning
-            nlp_result = next((r for r in nlp_results if ('resume' in r and r['resume'].get('id') == resume_id) or r.get('id') == resume_id), None)
-            llm_result = next((r for r in llm_results if 'resume' in r and r['resume'].get('id') == resume_id), None)
-            
-            if nlp_result and llm_result:
-                # Get the resume data from the appropriate location
-                resume_data = nlp_result.get('resume') if 'resume' in nlp_result else nlp_result
-                combined_results.append({
-                    'resume': resume_data,
-                    'score': combined_score,
-                    'nlp_score': nlp_score,
-                    'llm_score': llm_score,
-                    'nlp_reasoning': nlp_result.get('reasoning', ''),
-                    'llm_reasoning': llm_result.get('reasoning', ''),
-                    'skill_match': llm_result.get('skill_match', []),
-                    'strengths': llm_result.get('strengths', []),
-                    'weaknesses': llm_result.get('weaknesses', [])
-                })
-        else:
-            # For resumes that weren't evaluated by LLM, just use the NLP score
-            # This shouldn't happen often with our design, but handles edge cases
-            nlp_result = next((r for r in nlp_results if ('resume' in r and r['resume'].get('id') == resume_id) or r.get('id') == resume_id), None)
-            if nlp_result:
-                # Get the resume data from the appropriate location
-                resume_data = nlp_result.get('resume') if 'resume' in nlp_result else nlp_result
-                combined_results.append({
-                    'resume': resume_data,
-                    'score': nlp_score * (nlp_weight + llm_weight),  # Scale up to compensate
-                    'nlp_score': nlp_score,
-                    'llm_score': 0,
-                    'nlp_reasoning': nlp_result.get('reasoning', ''),
-                    'llm_reasoning': "Not evaluated by LLM"
-                })
-    
-    # Sort by combined score
-    combined_results.sort(key=lambda x: x['score'], reverse=True)
-    
-    # Return top N
-    return combined_results[:top_n]
+    if not final and resumes:
+        logger.warning("Streaming LLM recommender produced no results - falling back to traditional NLP")
+        final = nlp_fallback_recommendations(job_desc, resumes, top_n=top_n)
+    yield 'final', final
@@ -0,0 +1,104 @@
+import json
+import subprocess
+import sys
+import time
+from django.core.management.base import BaseCommand
+from recommender.onnx_encoder import SAMPLE_SENTENCES
+
+def current_rss_mb():
+    """Resident set size of this process in MB (Linux /proc, else peak RSS from getrusage)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kB on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+class Command(BaseCommand):
+    help = 'Compare throughput and memory of the PyTorch and ONNX int8 embedding backends'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backends',
+            default='torch,onnx',
+            help='Comma-separated backends to compare'
+        )
+        parser.add_argument(
+            '--sentences',
+            type=int,
+            default=2000,
+            help='Sentences to encode per backend'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=64,
+            help='Encode batch size'
+        )
+        parser.add_argument(
+            '--child',
+            help='Internal: measure one backend in this process and print JSON'
+        )
+
+    def handle(self, *args, **options):
+        if options['child']:
+            self.stdout.write(json.dumps(self.measure(options['child'], options['sentences'], options['batch_size'])))
+            return
+
+        # Each backend runs in a fresh process so RSS isn't shared between them
+        results = []
+        for backend in options['backends'].split(','):
+            proc = subprocess.run(
+                [sys.executable, sys.argv[0], 'benchmark_embeddings', '--child', backend,
+                 '--sentences', str(options['sentences']), '--batch-size', str(options['batch_size'])],
+                capture_output=True, text=True
+            )
+            if proc.returncode != 0:
+                self.stderr.write(f"{backend} benchmark failed:\n{proc.stderr}", self.style.ERROR)
+                continue
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            if backend == 'onnx' and result['actual'] != 'OnnxSentenceEncoder':
+                self.stderr.write("ONNX model could not be loaded (run export_onnx_model); measured PyTorch instead", self.style.WARNING)
+            results.append(result)
+
+        self.stdout.write(f"{'backend':<8} {'load s':>8} {'sent/s':>10} {'model MB':>10} {'RSS MB':>10}")
+        for r in results:
+            self.stdout.write(
+                f"{r['backend']:<8} {r['load_seconds']:>8.2f} {r['sentences_per_second']:>10.1f} "
+                f"{r['model_rss_mb']:>10.1f} {r['rss_mb']:>10.1f}"
+            )
+        if len(results) == 2:
+            base, other = results
+            self.stdout.write(
+                f"{other['backend']} vs {base['backend']}: "
+                f"{other['sentences_per_second'] / base['sentences_per_second']:.2f}x throughput, "
+                f"{other['rss_mb'] - base['rss_mb']:+.1f} MB RSS",
+                self.style.SUCCESS
+            )
+
+    def measure(self, backend, count, batch_size):
+        from recommender.utils import get_sentence_transformer
+        rss_before = current_rss_mb()
+        start = time.perf_counter()
+        model = get_sentence_transformer(backend)
+        load_seconds = time.perf_counter() - start
+        model_rss = current_rss_mb() - rss_before
+
+        sentences = [SAMPLE_SENTENCES[i % len(SAMPLE_SENTENCES)] + f" #{i}" for i in range(count)]
+        model.encode(sentences[:batch_size], batch_size=batch_size)  # warm up
+        start = time.perf_counter()
+        model.encode(sentences, batch_size=batch_size)
+        elapsed = time.perf_counter() - start
+        return {
+            'backend': backend,
+            'actual': type(model).__name__,
+            'load_seconds': load_seconds,
+            'sentences_per_second': count / elapsed,
+            'model_rss_mb': model_rss,
+            'rss_mb': current_rss_mb(),
+        }
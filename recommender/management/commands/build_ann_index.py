@@ -0,0 +1,44 @@
+import logging
+from django.core.management.base import BaseCommand
+from recommender.utils import load_resumes
+from recommender.ann_index import ResumeANNIndex, ANN_INDEX_PATH
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Build the ANN index used to shortlist resumes before full scoring'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=ANN_INDEX_PATH,
+            help='Where to write the index (an .ids.json id map is written next to it)'
+        )
+        parser.add_argument(
+            '--m',
+            type=int,
+            default=16,
+            help='HNSW graph degree; higher improves recall and memory use'
+        )
+        parser.add_argument(
+            '--ef-construction',
+            type=int,
+            default=200,
+            help='HNSW build-time search width; higher improves recall and build time'
+        )
+
+    def handle(self, *args, **options):
+        resumes = load_resumes()
+        self.stdout.write(f"Loaded {len(resumes)} resumes")
+
+        try:
+            index = ResumeANNIndex.build(resumes, m=options['m'], ef_construction=options['ef_construction'])
+        except ImportError:
+            self.stderr.write("hnswlib is not installed (pip install hnswlib)", self.style.ERROR)
+            return
+        except ValueError as e:
+            self.stderr.write(str(e), self.style.ERROR)
+            return
+
+        index.save(options['path'])
+        self.stdout.write(f"Indexed {len(index)} resumes into {options['path']}", self.style.SUCCESS)
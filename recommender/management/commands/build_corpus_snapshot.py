@@ -0,0 +1,33 @@
+import logging
+from django.core.management.base import BaseCommand
+from recommender.utils import load_resumes, embedding_model_id
+from recommender.mapped_corpus import CORPUS_SNAPSHOT_PATH, build_snapshot
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Materialize the corpus into the memory-mapped local snapshot served when CORPUS_BACKEND is snapshot'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=CORPUS_SNAPSHOT_PATH,
+            help='Snapshot root; each build gets its own directory and CURRENT points at the latest'
+        )
+        parser.add_argument(
+            '--keep',
+            type=int,
+            default=2,
+            help='Number of builds to keep (including the new one)'
+        )
+
+    def handle(self, *args, **options):
+        resumes = load_resumes()
+        self.stdout.write(f"Loaded {len(resumes)} resumes")
+
+        try:
+            directory = build_snapshot(resumes, options['path'], model_id=embedding_model_id(), keep=max(1, options['keep']))
+        except ValueError as e:
+            self.stderr.write(str(e), self.style.ERROR)
+            return
+        self.stdout.write(f"Published corpus snapshot {directory}", self.style.SUCCESS)
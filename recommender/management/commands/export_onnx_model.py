@@ -0,0 +1,72 @@
+import logging
+import os
+import shutil
+import tempfile
+from django.core.management.base import BaseCommand, CommandError
+from recommender.onnx_encoder import (
+    ONNX_MODEL_PATH, ONNX_COSINE_TOLERANCE, SAMPLE_SENTENCES,
+    OnnxSentenceEncoder, cosine_agreement, export_onnx_model
+)
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Export the sentence transformer to an int8-quantized ONNX model and check it against PyTorch'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=ONNX_MODEL_PATH,
+            help='Directory to write the model, tokenizer and config to; only replaced once the new model passes the tolerance check'
+        )
+        parser.add_argument(
+            '--model',
+            default='all-MiniLM-L6-v2',
+            help='sentence-transformers model to export'
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=ONNX_COSINE_TOLERANCE,
+            help='Largest allowed 1 - cosine similarity to the PyTorch embedding of any validation sentence'
+        )
+
+    def handle(self, *args, **options):
+        path = os.path.abspath(options['path'])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Export next to the live model so the final rename stays on one filesystem
+        staging = tempfile.mkdtemp(prefix='.onnx-export-', dir=os.path.dirname(path))
+        try:
+            try:
+                model_path = export_onnx_model(options['model'], staging)
+            except ImportError as e:
+                raise CommandError(f"Missing export dependency ({e}); pip install onnx onnxruntime")
+            self.stdout.write(f"Wrote quantized model to {model_path}")
+
+            from sentence_transformers import SentenceTransformer
+            reference = SentenceTransformer(options['model'], device='cpu')
+            reference.max_seq_length = 128
+            quantized = OnnxSentenceEncoder(staging)
+
+            cosines = cosine_agreement(
+                reference.encode(SAMPLE_SENTENCES, normalize_embeddings=True),
+                quantized.encode(SAMPLE_SENTENCES)
+            )
+            self.stdout.write(f"Cosine similarity to PyTorch: min {cosines.min():.4f}, mean {cosines.mean():.4f}")
+            if cosines.min() < 1 - options['tolerance']:
+                raise CommandError(
+                    f"Quantized model is outside the cosine tolerance of {options['tolerance']}; "
+                    f"left {path} unchanged"
+                )
+
+            # Swap the validated model in; workers load it on their next start
+            previous = None
+            if os.path.exists(path):
+                previous = tempfile.mkdtemp(prefix='.onnx-previous-', dir=os.path.dirname(path))
+                os.replace(path, os.path.join(previous, 'model'))
+            os.replace(staging, path)
+            if previous:
+                shutil.rmtree(previous, ignore_errors=True)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        self.stdout.write(f"Quantized model is within tolerance; installed at {path}", self.style.SUCCESS)
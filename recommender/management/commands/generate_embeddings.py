@@ -1,78 +1,202 @@
 import os
+import json
+import hashlib
 import django
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from django.core.management.base import BaseCommand
-from supabase import create_client
-from sentence_transformers import SentenceTransformer
+from django.conf import settings
 import numpy as np
-import base64
-from recommender.utils import enhance_resume_embedding
+from recommender.utils import enhance_resume_embedding, enhance_resume_embeddings, get_sentence_transformer, embedding_model_id
+from recommender.embedding_codec import encode_embeddings, EMBEDDING_STORAGE_DTYPE
+from recommender.term_store import warm_resume_terms, get_term_store
+from recommender.supabase_client import get_supabase
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'resume_recommender.settings')
 django.setup()
 
 logger = logging.getLogger(__name__)
 
+def content_hash(embedding_text, storage_dtype):
+    """Hash of what a stored embedding is computed from, so unchanged rows can be skipped"""
+    return hashlib.sha256(f"{embedding_model_id()}\0{storage_dtype}\0{embedding_text}".encode('utf-8')).hexdigest()
+
+class BackfillState:
+    """
+    Checkpoint for a backfill run, kept in a local JSON file: the content hash
+    of every row embedded so far and the last id of the last finished page of
+    an unfinished run.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.hashes = {}
+        self.last_id = None
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.hashes = state.get('hashes', {})
+            self.last_id = state.get('last_id')
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump({'hashes': self.hashes, 'last_id': self.last_id}, f)
+        os.replace(self.path + '.tmp', self.path)
+
 class Command(BaseCommand):
     help = 'Generate embeddings for all resumes in resumes_duplicate table'
-    
+
     def add_arguments(self, parser):
         parser.add_argument(
             '--dry-run',
             action='store_true',
             help='Show what would be done without saving changes'
         )
+        parser.add_argument(
+            '--table',
+            default='resumes_duplicate',
+            help='Table to backfill'
+        )
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=500,
+            help='Rows fetched per page'
+        )
+        parser.add_argument(
+            '--write-workers',
+            type=int,
+            default=8,
+            help='Concurrent embedding updates per page'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=64,
+            help='Texts per model.encode batch'
+        )
+        parser.add_argument(
+            '--dtype',
+            choices=['float32', 'float16', 'int8', 'legacy'],
+            default=None,
+            help='Stored embedding precision (default EMBEDDING_STORAGE_DTYPE; legacy writes headerless float32)'
+        )
+        parser.add_argument(
+            '--state',
+            default=os.path.join('data', 'embedding_backfill.json'),
+            help='Checkpoint file holding content hashes and the resume position'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Re-embed every row even if its content hash is unchanged'
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignore the checkpoint of an unfinished run and start from the first row'
+        )
 
     def handle(self, *args, **options):
-        supabase = create_client(
-            os.getenv("SUPABASE_URL"),
-            os.getenv("SUPABASE_SERVICE_KEY")
-        )
-        
+        supabase = get_supabase(settings.SUPABASE_SERVICE_KEY)
+        table = options['table']
+
         # Verify connection
         try:
-            test = supabase.table('resumes_duplicate').select('count', count='exact').execute()
+            test = supabase.table(table).select('count', count='exact').execute()
             self.stdout.write(f"Connection successful. Table exists with ~{test.count} rows", self.style.SUCCESS)
         except Exception as e:
             self.stderr.write(f"Supabase connection failed: {str(e)}", self.style.ERROR)
             return
-        
-        model = SentenceTransformer("all-MiniLM-L6-v2")
+
+        model = get_sentence_transformer()
         dry_run = options['dry_run']
+        storage_dtype = options['dtype'] or EMBEDDING_STORAGE_DTYPE
+        state = BackfillState(options['state'])
+        if options['restart']:
+            state.last_id = None
+        if state.last_id is not None:
+            self.stdout.write(f"Resuming unfinished run after id {state.last_id}", self.style.WARNING)
 
-        # Fetch ALL resumes
-        res = supabase.table('resumes_duplicate') \
-            .select('*') \
-            .execute()
-            
-        resumes = res.data
-        self.stdout.write(f"Found {len(resumes)} resumes total")
+        processed = updated = skipped = failed = 0
+        last_id = state.last_id
+        while True:
+            # Keyset pagination: stable under concurrent inserts and resumable from last_id
+            query = supabase.table(table).select('*').order('id').limit(options['page_size'])
+            if last_id is not None:
+                query = query.gt('id', last_id)
+            try:
+                page = query.execute().data
+            except Exception as e:
+                self.stderr.write(f"Error fetching page after id {last_id}: {str(e)}", self.style.ERROR)
+                return
+            if not page:
+                break
+            processed += len(page)
 
-        for idx, resume in enumerate(resumes):
+            # One batched spaCy pass per page; fall back to row by row if a row breaks it
             try:
-                self.stdout.write(f"\nProcessing resume {idx+1}/{len(resumes)} (ID: {resume['id']})")
-                
-                # Generate enhanced embedding text
-                embedding_text = enhance_resume_embedding(resume)
-                
-                # Generate embedding
-                embedding = model.encode(embedding_text).astype(np.float32)
-                embedding_bytes = embedding.tobytes()
-                embedding_b64 = base64.b64encode(embedding_bytes).decode('utf-8')
-
-                if not dry_run:
-                    supabase.table('resumes_duplicate') \
-                        .update({'embedding': embedding_b64}) \
-                        .eq('id', resume['id']) \
-                        .execute()
-                    
-                    self.stdout.write(f"Updated resume {resume['id']}", self.style.SUCCESS)
+                page_texts = enhance_resume_embeddings(page)
+            except Exception:
+                page_texts = []
+                for resume in page:
+                    try:
+                        page_texts.append(enhance_resume_embedding(resume))
+                    except Exception as e:
+                        logger.error(f"Error processing resume {resume['id']}: {str(e)}")
+                        page_texts.append(None)
+                        failed += 1
+
+            changed, texts, hashes = [], [], []
+            for resume, embedding_text in zip(page, page_texts):
+                if embedding_text is None:
+                    continue
+                digest = content_hash(embedding_text, storage_dtype)
+                if not options['force'] and resume.get('embedding') and state.hashes.get(str(resume['id'])) == digest:
+                    skipped += 1
+                    continue
+                changed.append(resume)
+                texts.append(embedding_text)
+                hashes.append(digest)
+
+            if changed:
+                embeddings = np.asarray(
+                    model.encode(texts, batch_size=options['batch_size'], show_progress_bar=False),
+                    dtype=np.float32
+                )
+                # Only the embedding column is written, so edits made to other columns
+                # since the page was fetched are never overwritten
+                updates = [
+                    supabase.table(table).update({'embedding': encoded}).eq('id', resume['id'])
+                    for resume, encoded in zip(changed, encode_embeddings(embeddings, embedding_model_id(), storage_dtype))
+                ]
+
+                if dry_run:
+                    self.stdout.write(f"[Dry Run] Would update {len(updates)} resumes", self.style.WARNING)
                 else:
-                    self.stdout.write(f"[Dry Run] Would update {resume['id']}", self.style.WARNING)
+                    try:
+                        with ThreadPoolExecutor(max_workers=max(1, options['write_workers']), thread_name_prefix="embedding-write") as pool:
+                            list(pool.map(lambda update: update.execute(), updates))
+                    except Exception as e:
+                        # Leave the checkpoint at the previous page so a rerun retries this one
+                        self.stderr.write(f"Error updating page after id {last_id}: {str(e)}", self.style.ERROR)
+                        return
+                    for resume, digest in zip(changed, hashes):
+                        state.hashes[str(resume['id'])] = digest
+                    # Populate the skill/certification term store used during scoring
+                    warm_resume_terms(changed, save=False)
+                updated += len(updates)
 
-            except Exception as e:
-                logger.error(f"Error processing resume {resume['id']}: {str(e)}")
-                self.stderr.write(f"Error: {str(e)}", self.style.ERROR)
-                continue
+            last_id = page[-1]['id']
+            if not dry_run:
+                state.last_id = last_id
+                state.save()
+            self.stdout.write(f"Processed {processed} rows: {updated} embedded, {skipped} unchanged, {failed} failed")
+
+        if not dry_run:
+            state.last_id = None
+            state.save()
+            get_term_store().save()
 
-        self.stdout.write("\nEmbedding generation complete!", self.style.SUCCESS) 
\ No newline at end of file
+        self.stdout.write("\nEmbedding generation complete!", self.style.SUCCESS)
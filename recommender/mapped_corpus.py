@@ -0,0 +1,371 @@
+"""
+Memory-mapped local corpus snapshot shared by every worker on the host.
+
+The ``build_corpus_snapshot`` command materializes the prepared corpus into a
+directory under ``CORPUS_SNAPSHOT_PATH``:
+
+- ``embeddings.npy``: the normalized float32 embedding matrix,
+- ``experience_years.npy`` / ``education_rank.npy``: the numeric feature columns,
+- ``records.jsonl`` + ``offsets.npy`` + ``ids.json``: every prepared resume
+  (without its embedding) as one JSON line, with the byte offset of each line
+  and the resume id of each row,
+- ``candidates/``: the inputs the scorer reads per resume (skills,
+  certifications, languages, first education entry) as columns of string ids
+  into ``strings.json`` (see ``CandidateColumns``), so scoring never parses
+  the JSON records,
+- ``meta.json``: row count, dimension, embedding model and build time.
+
+Workers open the arrays with ``np.load(mmap_mode='r')`` and the records file
+with ``mmap``, so they all read the same page cache instead of each holding a
+Python copy of the corpus, and start without fetching or preparing anything.
+Resumes are exposed as lazy read-only mappings that parse their JSON line on
+first access (with a bounded LRU in front); only the few results a request
+returns are parsed.
+
+Each build is written to a fresh directory and published by atomically
+replacing the ``CURRENT`` pointer file; workers notice the new pointer within
+``CORPUS_SNAPSHOT_CHECK_SECONDS`` and switch over, and older builds are
+pruned (mappings that are still open stay valid after unlink).
+
+Enabled with ``CORPUS_BACKEND = 'snapshot'``. The snapshot is only as fresh as
+its last build, so rebuild it on a schedule.
+"""
+
+import json
+import logging
+import mmap
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+import numpy as np
+from django.conf import settings
+from .scoring import EmbeddingMatrix, FeatureColumns
+
+logger = logging.getLogger('recommender')
+
+CORPUS_SNAPSHOT_PATH = getattr(settings, 'CORPUS_SNAPSHOT_PATH', os.path.join('data', 'corpus_snapshot'))
+CORPUS_SNAPSHOT_CHECK_SECONDS = getattr(settings, 'CORPUS_SNAPSHOT_CHECK_SECONDS', 5)
+CORPUS_SNAPSHOT_CACHE_SIZE = getattr(settings, 'CORPUS_SNAPSHOT_CACHE_SIZE', 5000)
+
+SNAPSHOT_FORMAT = 1
+POINTER_FILE = 'CURRENT'
+
+
+class CandidateColumns:
+    """
+    Columnar scoring inputs (``utils.scoring_inputs``) for every row of a
+    snapshot. Strings are interned into one table; each list field is a flat
+    array of string ids plus row offsets, and the first education entry is a
+    pair of string id columns (-1 where the key is absent, -2 where the row
+    has no education dict).
+    """
+
+    LIST_FIELDS = ('skills', 'skills_lower', 'certifications', 'languages', 'languages_lower')
+    EDUCATION_FIELDS = ('degree', 'institution')
+    NO_EDUCATION = -2
+    MISSING = -1
+
+    def __init__(self, strings, lists, education):
+        self.strings = strings
+        self.lists = lists  # field -> (ids, offsets)
+        self.education = education  # field -> ids
+
+    @classmethod
+    def build(cls, candidates):
+        """Columns for a list of scoring_inputs dicts"""
+        strings, interned = [], {}
+
+        def intern(value):
+            if value not in interned:
+                interned[value] = len(strings)
+                strings.append(value)
+            return interned[value]
+
+        lists = {}
+        for field in cls.LIST_FIELDS:
+            ids, offsets = [], [0]
+            for candidate in candidates:
+                # Non-string entries are never matched by the scorer
+                ids.extend(intern(value) for value in candidate[field] or () if isinstance(value, str))
+                offsets.append(len(ids))
+            lists[field] = (np.array(ids, dtype=np.int32), np.array(offsets, dtype=np.int64))
+
+        education = {field: np.full(len(candidates), cls.NO_EDUCATION, dtype=np.int32) for field in cls.EDUCATION_FIELDS}
+        for row, candidate in enumerate(candidates):
+            first = candidate['education'][0] if candidate['education'] else None
+            if isinstance(first, dict):
+                for field in cls.EDUCATION_FIELDS:
+                    value = first.get(field)
+                    education[field][row] = intern(str(value)) if field in first and value is not None else cls.MISSING
+        return cls(strings, lists, education)
+
+    def save(self, directory):
+        os.makedirs(directory)
+        with open(os.path.join(directory, 'strings.json'), 'w') as f:
+            json.dump(self.strings, f)
+        for field, (ids, offsets) in self.lists.items():
+            np.save(os.path.join(directory, f'{field}.ids.npy'), ids)
+            np.save(os.path.join(directory, f'{field}.offsets.npy'), offsets)
+        for field, ids in self.education.items():
+            np.save(os.path.join(directory, f'education_{field}.npy'), ids)
+
+    @classmethod
+    def load(cls, directory):
+        """Open saved columns memory-mapped; only the string table is read into memory"""
+        with open(os.path.join(directory, 'strings.json')) as f:
+            strings = json.load(f)
+        lists = {
+            field: (np.load(os.path.join(directory, f'{field}.ids.npy'), mmap_mode='r'),
+                    np.load(os.path.join(directory, f'{field}.offsets.npy'), mmap_mode='r'))
+            for field in cls.LIST_FIELDS
+        }
+        education = {
+            field: np.load(os.path.join(directory, f'education_{field}.npy'), mmap_mode='r')
+            for field in cls.EDUCATION_FIELDS
+        }
+        return cls(strings, lists, education)
+
+    def __len__(self):
+        return len(self.education['degree'])
+
+    def __getitem__(self, row):
+        """The scoring_inputs dict of one row"""
+        strings = self.strings
+        candidate = {}
+        for field, (ids, offsets) in self.lists.items():
+            candidate[field] = [strings[i] for i in ids[offsets[row]:offsets[row + 1]]]
+        if len(candidate['skills_lower']) != len(candidate['skills']):
+            candidate['skills_lower'] = None
+        education = []
+        if self.education['degree'][row] != self.NO_EDUCATION:
+            entry = {}
+            for field in self.EDUCATION_FIELDS:
+                string_id = self.education[field][row]
+                if string_id != self.MISSING:
+                    entry[field] = strings[string_id]
+            education.append(entry)
+        candidate['education'] = education
+        return candidate
+
+
+def current_snapshot_dir(root=CORPUS_SNAPSHOT_PATH):
+    """Directory of the published snapshot, or None if none has been built"""
+    try:
+        with open(os.path.join(root, POINTER_FILE)) as f:
+            name = f.read().strip()
+    except OSError:
+        return None
+    directory = os.path.join(root, name)
+    return directory if name and os.path.isdir(directory) else None
+
+
+def build_snapshot(resumes, root=CORPUS_SNAPSHOT_PATH, model_id=None, keep=2):
+    """
+    Write prepared resumes as a new snapshot and publish it. Only resumes
+    whose embedding has the corpus' common dimension are included.
+    Returns the published directory.
+    """
+    from .utils import scoring_inputs
+    embedding_matrix = EmbeddingMatrix(resumes)
+    if not len(embedding_matrix):
+        raise ValueError("No resumes with embeddings to snapshot")
+
+    name = time.strftime('%Y%m%d-%H%M%S') + f"-{os.getpid()}"
+    building = os.path.join(root, name + '.building')
+    os.makedirs(building)
+    try:
+        np.save(os.path.join(building, 'embeddings.npy'), embedding_matrix.matrix)
+        np.save(os.path.join(building, 'experience_years.npy'), embedding_matrix.features.experience_years)
+        np.save(os.path.join(building, 'education_rank.npy'), embedding_matrix.features.education_rank)
+
+        ids, offsets = [], [0]
+        with open(os.path.join(building, 'records.jsonl'), 'wb') as f:
+            for i in embedding_matrix.rows:
+                record = {k: v for k, v in resumes[i].items() if k != 'embedding'}
+                line = json.dumps(record, default=str).encode('utf-8') + b'\n'
+                f.write(line)
+                offsets.append(offsets[-1] + len(line))
+                ids.append(record.get('id'))
+        np.save(os.path.join(building, 'offsets.npy'), np.array(offsets, dtype=np.int64))
+        CandidateColumns.build([scoring_inputs(resumes[i]) for i in embedding_matrix.rows]).save(
+            os.path.join(building, 'candidates')
+        )
+        with open(os.path.join(building, 'ids.json'), 'w') as f:
+            json.dump(ids, f, default=str)
+        with open(os.path.join(building, 'meta.json'), 'w') as f:
+            json.dump({
+                'format': SNAPSHOT_FORMAT,
+                'count': len(ids),
+                'dim': embedding_matrix.dim,
+                'model': model_id,
+                'built_at': time.time(),
+            }, f)
+
+        directory = os.path.join(root, name)
+        os.rename(building, directory)
+    except Exception:
+        shutil.rmtree(building, ignore_errors=True)
+        raise
+
+    # Publish: readers see either the old pointer or the new one
+    with open(os.path.join(root, POINTER_FILE + '.tmp'), 'w') as f:
+        f.write(name)
+    os.replace(os.path.join(root, POINTER_FILE + '.tmp'), os.path.join(root, POINTER_FILE))
+    _prune(root, keep)
+    return directory
+
+
+def _prune(root, keep):
+    """Remove all but the newest `keep` snapshot builds"""
+    builds = sorted(
+        (d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)) and not d.endswith('.building')),
+        reverse=True
+    )
+    for name in builds[keep:]:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+class SnapshotResume(Mapping):
+    """Read-only view of one snapshot row; the JSON record is parsed on first use"""
+
+    __slots__ = ('snapshot', 'row', 'id', 'embedding')
+    # Keys every prepared record has, answered without parsing it
+    KNOWN_KEYS = ('id', 'embedding', 'features')
+
+    def __init__(self, snapshot, row, resume_id):
+        self.snapshot = snapshot
+        self.row = row
+        self.id = resume_id
+        self.embedding = snapshot.matrix[row]
+
+    def __getitem__(self, key):
+        if key == 'id':
+            return self.id
+        if key == 'embedding':
+            return self.embedding
+        return self.snapshot.record(self.row)[key]
+
+    def __contains__(self, key):
+        return key in self.KNOWN_KEYS or key in self.snapshot.record(self.row)
+
+    def __iter__(self):
+        yield 'embedding'
+        yield from self.snapshot.record(self.row)
+
+    def __len__(self):
+        return len(self.snapshot.record(self.row)) + 1
+
+    def copy(self):
+        """A plain, mutable dict of the full resume"""
+        resume = dict(self.snapshot.record(self.row))
+        resume['embedding'] = self.embedding
+        return resume
+
+
+class LocalSnapshot:
+    """One published snapshot directory, opened memory-mapped"""
+
+    def __init__(self, directory, cache_size=CORPUS_SNAPSHOT_CACHE_SIZE):
+        self.directory = directory
+        self.name = os.path.basename(directory)
+        with open(os.path.join(directory, 'meta.json')) as f:
+            self.meta = json.load(f)
+        if self.meta.get('format') != SNAPSHOT_FORMAT:
+            raise ValueError(f"Unsupported corpus snapshot format {self.meta.get('format')}")
+
+        self.matrix = np.load(os.path.join(directory, 'embeddings.npy'), mmap_mode='r')
+        self.offsets = np.load(os.path.join(directory, 'offsets.npy'), mmap_mode='r')
+        self.embedding_matrix = EmbeddingMatrix.from_arrays(self.matrix, FeatureColumns.from_arrays(
+            np.load(os.path.join(directory, 'experience_years.npy'), mmap_mode='r'),
+            np.load(os.path.join(directory, 'education_rank.npy'), mmap_mode='r')
+        ))
+        with open(os.path.join(directory, 'records.jsonl'), 'rb') as f:
+            self._records = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(os.path.join(directory, 'ids.json')) as f:
+            ids = json.load(f)
+        if not (len(ids) == len(self.matrix) == len(self.offsets) - 1):
+            raise ValueError(f"Corpus snapshot {self.name} is inconsistent")
+        candidates_dir = os.path.join(directory, 'candidates')
+        if os.path.isdir(candidates_dir):
+            self.candidates = CandidateColumns.load(candidates_dir)
+            if len(self.candidates) != len(ids):
+                raise ValueError(f"Corpus snapshot {self.name} is inconsistent")
+        else:
+            # Built before scoring columns existed; scoring parses the records until the next build
+            logger.warning(f"Corpus snapshot {self.name} has no scoring columns; rebuild it")
+            self.candidates = None
+
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+        self.resumes = [SnapshotResume(self, row, resume_id) for row, resume_id in enumerate(ids)]
+
+    def __len__(self):
+        return len(self.resumes)
+
+    def record(self, row):
+        with self._lock:
+            record = self._cache.get(row)
+            if record is not None:
+                self._cache.move_to_end(row)
+                return record
+        record = json.loads(self._records[int(self.offsets[row]):int(self.offsets[row + 1])])
+        with self._lock:
+            self._cache[row] = record
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return record
+
+
+class MappedCorpus:
+    """Corpus served from the published local snapshot, following rebuilds"""
+
+    def __init__(self, root=CORPUS_SNAPSHOT_PATH, check_interval=CORPUS_SNAPSHOT_CHECK_SECONDS):
+        self.root = root
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._checked_at = 0
+        self._open(current_snapshot_dir(root))
+
+    @property
+    def version(self):
+        return self._snapshot.name if self._snapshot else None
+
+    def _open(self, directory):
+        if directory is None:
+            logger.warning(f"No corpus snapshot published under {self.root}")
+            return
+        start_time = time.time()
+        snapshot = LocalSnapshot(directory)
+        self._snapshot = snapshot
+        logger.info(f"Opened corpus snapshot {snapshot.name} ({len(snapshot)} resumes) in {time.time() - start_time:.2f} seconds")
+
+    def get_resumes(self):
+        """Return the snapshot's resumes, switching to a newer build if one was published"""
+        if time.time() - self._checked_at > self.check_interval:
+            with self._lock:
+                if time.time() - self._checked_at > self.check_interval:
+                    self._checked_at = time.time()
+                    directory = current_snapshot_dir(self.root)
+                    if directory is not None and (self._snapshot is None or directory != self._snapshot.directory):
+                        try:
+                            self._open(directory)
+                        except Exception as e:
+                            logger.error(f"Error opening corpus snapshot {directory}: {str(e)}")
+        return self._snapshot.resumes if self._snapshot else []
+
+    def version_stamp(self):
+        self.get_resumes()
+        return f"snapshot:{self.version}"
+
+    def is_stale(self):
+        return False
+
+    def invalidate(self, full=False):
+        """Rows only change when the snapshot is rebuilt; just re-check the pointer on the next read"""
+        self._checked_at = 0
+        logger.info("Mapped corpus invalidated; changes appear with the next snapshot build")
@@ -1,41 +1,207 @@
+"""
+Supabase token authentication.
+
+Access tokens are verified locally instead of with a ``get_user`` round trip
+per request: HS256 tokens against ``SUPABASE_JWT_SECRET``, asymmetric
+(RS256/ES256) tokens against the project's JWKS, fetched once and cached for
+``SUPABASE_JWKS_CACHE_SECONDS``. Only HS256 tokens without a configured
+secret still go to Supabase. The resolved user is kept in a bounded TTL cache
+keyed by the token's hash, never past the token's expiry, and is built from
+the token claims, so authentication needs no database access.
+
+Paths matching ``SUPABASE_AUTH_EXEMPT_PATHS`` (landing and test pages,
+static files, sign-up/login, health checks) skip authentication entirely.
+"""
+
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import jwt
+from django.conf import settings
+from django.http import JsonResponse
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
-from .supabase_client import supabase
-import logging
-from django.contrib.auth.models import User
+from .supabase_client import get_auth_client
 
 logger = logging.getLogger(__name__)
 
+SUPABASE_JWT_SECRET = getattr(settings, 'SUPABASE_JWT_SECRET', None)
+SUPABASE_JWT_AUDIENCE = getattr(settings, 'SUPABASE_JWT_AUDIENCE', 'authenticated')
+SUPABASE_JWKS_URL = getattr(settings, 'SUPABASE_JWKS_URL', None) or f"{settings.SUPABASE_URL}/auth/v1/.well-known/jwks.json"
+SUPABASE_JWKS_CACHE_SECONDS = getattr(settings, 'SUPABASE_JWKS_CACHE_SECONDS', 600)
+SUPABASE_JWT_LEEWAY = getattr(settings, 'SUPABASE_JWT_LEEWAY', 10)
+AUTH_CACHE_SIZE = getattr(settings, 'AUTH_CACHE_SIZE', 10000)
+AUTH_CACHE_SECONDS = getattr(settings, 'AUTH_CACHE_SECONDS', 300)
+SUPABASE_AUTH_EXEMPT_PATHS = [
+    re.compile(pattern) for pattern in getattr(settings, 'SUPABASE_AUTH_EXEMPT_PATHS', [])
+]
+
+ASYMMETRIC_ALGORITHMS = ['RS256', 'ES256']
+
+
+@dataclass(frozen=True)
+class SupabaseUser:
+    """Authenticated Supabase user, resolved from the access token"""
+    id: str
+    email: str = None
+    role: str = None
+    claims: dict = field(default=None, compare=False, repr=False)
+
+    is_authenticated = True
+    is_anonymous = False
+
+    @classmethod
+    def from_claims(cls, claims):
+        metadata = claims.get('user_metadata') or {}
+        return cls(id=claims['sub'], email=claims.get('email'), role=metadata.get('role'), claims=claims)
+
+
+class TokenCache:
+    """Bounded LRU of resolved users with a per-entry expiry"""
+
+    def __init__(self, max_size=AUTH_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            user, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return user
+
+    def set(self, key, user, expires_at):
+        with self._lock:
+            self._entries[key] = (user, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_token_cache = TokenCache()
+_jwks_client = None
+_jwks_lock = threading.Lock()
+
+
+def get_jwks_client():
+    """JWKS client for the project's signing keys; the key set is cached in memory"""
+    global _jwks_client
+    if _jwks_client is None:
+        with _jwks_lock:
+            if _jwks_client is None:
+                _jwks_client = jwt.PyJWKClient(
+                    SUPABASE_JWKS_URL,
+                    cache_jwk_set=True,
+                    lifespan=SUPABASE_JWKS_CACHE_SECONDS,
+                    headers={'apikey': settings.SUPABASE_KEY or ''}
+                )
+    return _jwks_client
+
+
+def _decode(token, key, algorithms):
+    return jwt.decode(
+        token, key,
+        algorithms=algorithms,
+        audience=SUPABASE_JWT_AUDIENCE,
+        leeway=SUPABASE_JWT_LEEWAY,
+        options={'require': ['exp', 'sub']}
+    )
+
+
+def verify_token(token):
+    """
+    Verify an access token and return (user, expiry timestamp). Raises
+    AuthenticationFailed for invalid or expired tokens.
+    """
+    try:
+        header = jwt.get_unverified_header(token)
+        algorithm = header.get('alg')
+        if algorithm in ASYMMETRIC_ALGORITHMS:
+            key = get_jwks_client().get_signing_key_from_jwt(token).key
+            claims = _decode(token, key, ASYMMETRIC_ALGORITHMS)
+        elif algorithm == 'HS256' and SUPABASE_JWT_SECRET:
+            claims = _decode(token, SUPABASE_JWT_SECRET, ['HS256'])
+        elif algorithm == 'HS256':
+            return _verify_remotely(token)
+        else:
+            raise AuthenticationFailed('Unsupported token algorithm')
+    except jwt.ExpiredSignatureError:
+        raise AuthenticationFailed('Token has expired')
+    except jwt.PyJWKClientError as e:
+        logger.error(f'Error fetching Supabase JWKS: {str(e)}')
+        raise AuthenticationFailed('Authentication failed')
+    except jwt.InvalidTokenError:
+        raise AuthenticationFailed('Invalid authentication token')
+    return SupabaseUser.from_claims(claims), claims['exp']
+
+
+def _verify_remotely(token):
+    """Fallback for HS256 tokens when no JWT secret is configured"""
+    # Signature is checked by Supabase; the claims only bound the cache entry
+    claims = jwt.decode(token, options={'verify_signature': False})
+    response = get_auth_client().auth.get_user(token)
+    if not response or not response.user:
+        raise AuthenticationFailed('Invalid authentication token')
+    metadata = response.user.user_metadata or {}
+    user = SupabaseUser(id=response.user.id, email=response.user.email, role=metadata.get('role'), claims=claims)
+    return user, claims.get('exp', time.time())
+
+
+def is_exempt(path):
+    return any(pattern.match(path) for pattern in SUPABASE_AUTH_EXEMPT_PATHS)
+
+
 class SupabaseAuthentication(BaseAuthentication):
     def __init__(self, get_response=None):
         self.get_response = get_response
 
     def __call__(self, request):
-        # Process the request
-        self.authenticate(request)
-        response = self.get_response(request)
-        return response
+        request.supabase_user = None
+        if not is_exempt(request.path_info):
+            try:
+                result = self.authenticate(request)
+            except AuthenticationFailed as e:
+                return JsonResponse({'error': str(e.detail)}, status=401)
+            if result:
+                request.supabase_user = result[0]
+        return self.get_response(request)
 
     def authenticate(self, request):
         auth_header = request.headers.get('Authorization')
-        
+
         if not auth_header:
             return None
-            
-        try:
-            token = auth_header.split(' ')[1]
-            user = supabase.auth.get_user(token)
-            
-            if user:
-                # Get or create user in your database
-                user_profile, created = User.objects.get_or_create(
-                    supabase_id=user.id,
-                    defaults={'email': user.email}
-                )
-                return (user_profile, None)
-            else:
-                raise AuthenticationFailed('Invalid authentication token')
-                
-        except Exception as e:
-            logger.error(f'Authentication error: {str(e)}')
-            raise AuthenticationFailed('Authentication failed') 
\ No newline at end of file
+
+        scheme, _, token = auth_header.partition(' ')
+        if scheme.lower() != 'bearer' or not token:
+            raise AuthenticationFailed('Invalid authorization header')
+
+        key = hashlib.sha256(token.encode('utf-8')).hexdigest()
+        user = _token_cache.get(key)
+        if user is None:
+            try:
+                user, expires_at = verify_token(token)
+            except AuthenticationFailed:
+                raise
+            except Exception as e:
+                logger.error(f'Authentication error: {str(e)}')
+                raise AuthenticationFailed('Authentication failed')
+            _token_cache.set(key, user, min(expires_at, time.time() + AUTH_CACHE_SECONDS))
+        return (user, token)
+
+    def authenticate_header(self, request):
+        return 'Bearer'
@@ -0,0 +1,170 @@
+"""
+ONNX Runtime backend for the sentence transformer.
+
+``all-MiniLM-L6-v2`` is exported to ONNX and dynamically quantized to int8
+(see the ``export_onnx_model`` management command), then run with
+onnxruntime and the standalone ``tokenizers`` tokenizer, so a worker using
+this backend never imports torch. Mean pooling and L2 normalization are done
+in numpy, matching the model's sentence-transformers pipeline.
+
+Selected with ``EMBEDDING_BACKEND = 'onnx'``. The export command rejects a
+quantized model whose embeddings are not within ``ONNX_COSINE_TOLERANCE`` of
+the PyTorch model's: every validation sentence must have a cosine similarity
+of at least ``1 - ONNX_COSINE_TOLERANCE`` (0.98 by default; int8 MiniLM
+typically stays above 0.99). Stored resume embeddings and query embeddings
+may come from different backends, so a looser tolerance shifts scores.
+"""
+
+import json
+import logging
+import os
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger('recommender')
+
+ONNX_MODEL_PATH = getattr(settings, 'ONNX_MODEL_PATH', os.path.join('data', 'onnx', 'all-MiniLM-L6-v2-int8'))
+ONNX_COSINE_TOLERANCE = getattr(settings, 'ONNX_COSINE_TOLERANCE', 0.02)
+
+MODEL_FILE = 'model_int8.onnx'
+TOKENIZER_FILE = 'tokenizer.json'
+CONFIG_FILE = 'config.json'
+
+# Sentences used to check the quantized model against PyTorch and to benchmark backends
+SAMPLE_SENTENCES = [
+    "Senior Python developer with Django, PostgreSQL and AWS experience",
+    "Worked as Data Scientist at Acme with focus on forecasting, pandas, experiments",
+    "Studied Master of Computer Science at University of Toronto",
+    "Looking for a frontend engineer skilled in React, TypeScript and accessibility",
+    "Certified Kubernetes Administrator",
+    "Machine learning",
+    "Registered nurse with five years of ICU experience and BLS certification",
+    "Fluent in French and Arabic, conversational Spanish",
+    "Led a team of eight engineers building payment infrastructure handling millions of transactions per day",
+    "Entry level accountant familiar with Excel, QuickBooks and month-end close",
+]
+
+
+class OnnxSentenceEncoder:
+    """Drop-in for the parts of SentenceTransformer the recommender uses (encode, max_seq_length)"""
+
+    def __init__(self, path=ONNX_MODEL_PATH, threads=0):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(path, CONFIG_FILE)) as f:
+            self.config = json.load(f)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(
+            os.path.join(path, MODEL_FILE), options, providers=['CPUExecutionProvider']
+        )
+        self._input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(os.path.join(path, TOKENIZER_FILE))
+        self.tokenizer.enable_padding(pad_id=self.config.get('pad_token_id', 0))
+        self.max_seq_length = self.config.get('max_seq_length', 128)
+        logger.info(f"Loaded ONNX sentence encoder from {path}")
+
+    @property
+    def max_seq_length(self):
+        return self._max_seq_length
+
+    @max_seq_length.setter
+    def max_seq_length(self, value):
+        self._max_seq_length = value
+        self.tokenizer.enable_truncation(max_length=value)
+
+    @property
+    def model_id(self):
+        """Id recorded with embeddings from this encoder (see embedding_codec)"""
+        return f"{self.config.get('model', 'all-MiniLM-L6-v2')}+onnx-int8"
+
+    def get_sentence_embedding_dimension(self):
+        return self.config.get('dimension')
+
+    def _embed(self, sentences):
+        encodings = self.tokenizer.encode_batch(sentences)
+        inputs = {
+            'input_ids': np.array([e.ids for e in encodings], dtype=np.int64),
+            'attention_mask': np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            'token_type_ids': np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {k: v for k, v in inputs.items() if k in self._input_names})[0]
+        # Mean pooling over real tokens, then L2 normalization (the model's Normalize module)
+        mask = inputs['attention_mask'][..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return pooled / np.clip(norms, 1e-12, None)
+
+    def encode(self, sentences, batch_size=32, show_progress_bar=False, normalize_embeddings=True, **kwargs):
+        """Encode a sentence or list of sentences into float32 unit vectors"""
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+        if not sentences:
+            return np.zeros((0, self.get_sentence_embedding_dimension() or 0), dtype=np.float32)
+        # Batch similar lengths together to minimize padding
+        order = np.argsort([-len(s) for s in sentences], kind='stable')
+        embeddings = np.empty((len(sentences), self.get_sentence_embedding_dimension()), dtype=np.float32)
+        for start in range(0, len(sentences), batch_size):
+            rows = order[start:start + batch_size]
+            embeddings[rows] = self._embed([sentences[i] for i in rows])
+        return embeddings[0] if single else embeddings
+
+
+def export_onnx_model(model_name, path=ONNX_MODEL_PATH, max_seq_length=128, opset=14):
+    """
+    Export a sentence-transformers model's transformer to ONNX, quantize it
+    to int8 with dynamic quantization, and save it with its tokenizer.
+    Returns the path of the quantized model.
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device='cpu')
+    transformer = model[0].auto_model
+    transformer.config.return_dict = False
+    transformer.eval()
+    tokenizer = model.tokenizer
+
+    os.makedirs(path, exist_ok=True)
+    fp32_path = os.path.join(path, 'model_fp32.onnx')
+    dummy = tokenizer(["export sample"], return_tensors='pt')
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in dummy]
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(dummy[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=['last_hidden_state'],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+        )
+
+    quantize_dynamic(fp32_path, os.path.join(path, MODEL_FILE), weight_type=QuantType.QInt8)
+    os.remove(fp32_path)
+
+    tokenizer.backend_tokenizer.save(os.path.join(path, TOKENIZER_FILE))
+    with open(os.path.join(path, CONFIG_FILE), 'w') as f:
+        json.dump({
+            'model': model_name,
+            'dimension': model.get_sentence_embedding_dimension(),
+            'max_seq_length': max_seq_length,
+            'pad_token_id': tokenizer.pad_token_id or 0,
+            'quantization': 'dynamic-int8',
+        }, f, indent=2)
+    return os.path.join(path, MODEL_FILE)
+
+
+def cosine_agreement(reference, candidate):
+    """Row-wise cosine similarity between two embedding matrices"""
+    reference = np.asarray(reference, dtype=np.float32)
+    candidate = np.asarray(candidate, dtype=np.float32)
+    dots = (reference * candidate).sum(axis=1)
+    norms = np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1)
+    return dots / np.clip(norms, 1e-12, None)
@@ -0,0 +1,257 @@
+"""
+Multi-process sharded scoring.
+
+Candidate scoring is CPU-bound Python, so under gunicorn's gthread workers
+concurrent recommendations contend for one core. The ShardedScorer splits the
+candidate rows across a persistent process pool instead:
+
+- the normalized embedding matrix and the numeric feature columns are published
+  once per corpus version into ``multiprocessing.shared_memory`` blocks, and the
+  per-candidate inputs (skills, certifications, languages) are pickled once into
+  another block, so nothing corpus-sized is pickled per request;
+- each worker scores its rows (a range, or the ANN shortlist's rows of the
+  published matrix) against the JobContext and returns a partial top-K, which
+  the parent merges.
+
+A publication is reference counted by the ``score`` calls using it and only
+unlinked once it has been replaced and the last of them has finished.
+
+Under gunicorn the pool is forked in ``post_fork`` (see ``warmup``), before the
+worker starts its request threads; started lazily anywhere else it uses
+``forkserver``, since forking a process that already runs threads can deadlock.
+
+Enabled with ``SCORING_WORKERS`` > 1 for candidate sets of at least
+``SCORING_PARALLEL_MIN_CANDIDATES`` rows; smaller sets are scored in-process.
+"""
+
+import logging
+import math
+import multiprocessing
+import pickle
+import threading
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+from django.conf import settings
+from .scoring import top_n_indices
+
+logger = logging.getLogger('recommender')
+
+SCORING_WORKERS = getattr(settings, 'SCORING_WORKERS', 0)
+SCORING_PARALLEL_MIN_CANDIDATES = getattr(settings, 'SCORING_PARALLEL_MIN_CANDIDATES', 2000)
+
+
+def _share_array(array):
+    """Copy an array into a new shared memory block and return (block, metadata)"""
+    array = np.ascontiguousarray(array)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm, {'name': shm.name, 'shape': array.shape, 'dtype': array.dtype.str}
+
+
+class SharedCorpus:
+    """An EmbeddingMatrix, its feature columns and candidate inputs published to shared memory"""
+
+    def __init__(self, embedding_matrix, resumes):
+        from .utils import scoring_inputs
+        self.blocks = []
+        self.meta = {'arrays': {}}
+        features = embedding_matrix.features
+        for name, array in (('matrix', embedding_matrix.matrix),
+                            ('experience_years', features.experience_years),
+                            ('education_rank', features.education_rank)):
+            shm, meta = _share_array(array)
+            self.blocks.append(shm)
+            self.meta['arrays'][name] = meta
+
+        candidates = [scoring_inputs(resumes[i]) for i in embedding_matrix.rows]
+        payload = pickle.dumps(candidates, protocol=pickle.HIGHEST_PROTOCOL)
+        shm, meta = _share_array(np.frombuffer(payload, dtype=np.uint8))
+        self.blocks.append(shm)
+        self.meta['candidates'] = meta
+        # Block names are unique, so the first one identifies this publication
+        self.meta['token'] = self.blocks[0].name
+        # In-flight score() calls using this publication
+        self.refs = 0
+
+    def close(self):
+        for shm in self.blocks:
+            try:
+                shm.close()
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+        self.blocks = []
+
+
+# Worker-side state: the publication this worker is currently attached to
+_attached = {'token': None, 'blocks': [], 'arrays': None, 'candidates': None}
+
+
+def _init_worker():
+    # Workers started by forkserver don't inherit the parent's app registry
+    from django.apps import apps
+    if not apps.ready:
+        import django
+        django.setup()
+    # Scoring is single-threaded per worker; don't let torch oversubscribe cores
+    try:
+        import torch
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+
+
+def _attach(meta):
+    if _attached['token'] == meta['token']:
+        return _attached
+
+    # Drop views before closing the blocks they point into
+    _attached['arrays'] = None
+    _attached['candidates'] = None
+    for shm in _attached['blocks']:
+        shm.close()
+
+    blocks, arrays = [], {}
+    for name, array_meta in meta['arrays'].items():
+        shm = shared_memory.SharedMemory(name=array_meta['name'])
+        blocks.append(shm)
+        arrays[name] = np.ndarray(array_meta['shape'], dtype=np.dtype(array_meta['dtype']), buffer=shm.buf)
+
+    candidates_meta = meta['candidates']
+    shm = shared_memory.SharedMemory(name=candidates_meta['name'])
+    candidates = pickle.loads(bytes(shm.buf[:candidates_meta['shape'][0]]))
+    shm.close()
+
+    _attached.update(token=meta['token'], blocks=blocks, arrays=arrays, candidates=candidates)
+    return _attached
+
+
+def _score_shard(meta, job_context, shard, top_k):
+    """Score the rows selected by shard (a slice or an array of rows) and return their top_k as (row, score, components, reasons)"""
+    from .utils import score_candidate, vector_component_scores
+    state = _attach(meta)
+    arrays = state['arrays']
+    rows = range(len(arrays['matrix']))[shard] if isinstance(shard, slice) else shard
+
+    similarities = arrays['matrix'][shard] @ job_context.unit_embedding
+    years = arrays['experience_years'][shard]
+    experience_scores, education_scores = vector_component_scores(job_context, years, arrays['education_rank'][shard])
+
+    results, scores = [], []
+    for offset, row in enumerate(rows):
+        try:
+            final_score, score_components, match_reasons = score_candidate(
+                state['candidates'][row],
+                job_context,
+                similarities[offset],
+                experience_scores[offset],
+                education_scores[offset],
+                years[offset]
+            )
+        except Exception as e:
+            logger.error(f"Error scoring row {row}: {str(e)}")
+            continue
+        results.append((int(row), final_score, score_components, match_reasons))
+        scores.append(final_score)
+    return [results[i] for i in top_n_indices(np.array(scores, dtype=np.float64), top_k)]
+
+
+class ShardedScorer:
+    """Persistent process pool that scores shards of the shared corpus"""
+
+    def __init__(self, workers, start_method='forkserver'):
+        # Start the resource tracker before the workers so they share it and
+        # don't unlink our blocks when they exit
+        resource_tracker.ensure_running()
+        self.workers = workers
+        self._pool = multiprocessing.get_context(start_method).Pool(processes=workers, initializer=_init_worker)
+        self._lock = threading.Lock()
+        self._published = None
+
+    def _acquire(self, embedding_matrix, resumes):
+        """The publication of embedding_matrix (publishing it if it is new), held until _release"""
+        previous = None
+        with self._lock:
+            if self._published is None or self._published[0] is not embedding_matrix:
+                previous = self._published
+                self._published = (embedding_matrix, SharedCorpus(embedding_matrix, resumes))
+                logger.info(f"Published {len(embedding_matrix)} candidates to shared memory for sharded scoring")
+            shared = self._published[1]
+            shared.refs += 1
+            # A replaced publication still in use is closed by its last _release
+            retired = previous is not None and previous[1].refs == 0
+        if retired:
+            previous[1].close()
+        return shared
+
+    def _release(self, shared):
+        with self._lock:
+            shared.refs -= 1
+            retired = shared.refs == 0 and (self._published is None or self._published[1] is not shared)
+        if retired:
+            shared.close()
+
+    def score(self, embedding_matrix, resumes, job_context, top_k, rows=None):
+        """
+        Return the merged top_k (row, score, components, reasons) across all
+        shards. rows restricts scoring to those rows of embedding_matrix (e.g.
+        an ANN shortlist), so the full matrix stays published across requests.
+        """
+        shared = self._acquire(embedding_matrix, resumes)
+        try:
+            total = len(embedding_matrix) if rows is None else len(rows)
+            shard_size = math.ceil(total / self.workers)
+            if rows is None:
+                shards = [slice(start, min(start + shard_size, total)) for start in range(0, total, shard_size)]
+            else:
+                rows = np.asarray(rows, dtype=np.int64)
+                shards = [rows[start:start + shard_size] for start in range(0, total, shard_size)]
+            partials = self._pool.starmap(_score_shard, [(shared.meta, job_context, shard, top_k) for shard in shards])
+        finally:
+            self._release(shared)
+
+        merged = [result for partial in partials for result in partial]
+        order = top_n_indices(np.array([r[1] for r in merged], dtype=np.float64), top_k)
+        return [merged[i] for i in order]
+
+    def close(self):
+        self._pool.terminate()
+        with self._lock:
+            published, self._published = self._published, None
+        if published is not None:
+            published[1].close()
+
+
+_scorer = None
+_scorer_failed = False
+_scorer_lock = threading.Lock()
+
+
+def _start_scorer(start_method):
+    global _scorer, _scorer_failed
+    with _scorer_lock:
+        if _scorer is None and not _scorer_failed:
+            try:
+                _scorer = ShardedScorer(SCORING_WORKERS, start_method)
+                logger.info(f"Started sharded scoring pool with {SCORING_WORKERS} {start_method} workers")
+            except Exception as e:
+                # e.g. start method unavailable on this platform; stay single-process
+                logger.error(f"Could not start sharded scoring pool: {str(e)}")
+                _scorer_failed = True
+    return _scorer
+
+
+def start_sharded_scorer():
+    """Fork the scoring pool now; call while the process has no other threads (gunicorn post_fork)"""
+    if SCORING_WORKERS > 1:
+        _start_scorer('fork')
+
+
+def get_sharded_scorer(candidates):
+    """Return the process-wide ShardedScorer if sharding is enabled and worthwhile for this many candidates"""
+    if SCORING_WORKERS <= 1 or candidates < SCORING_PARALLEL_MIN_CANDIDATES or _scorer_failed:
+        return None
+    if _scorer is None:
+        # Request threads are already running, so don't fork from here
+        return _start_scorer('forkserver')
+    return _scorer
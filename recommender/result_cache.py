@@ -0,0 +1,100 @@
+"""
+Cache of complete recommendation responses.
+
+Recruiters paginate, refresh and share links to the same search, and every
+repeat used to redo requirement extraction, scoring and, on the LLM
+endpoints, the LLM evaluations. Responses are cached under a hash of the
+normalized request (job description with whitespace collapsed, method,
+top_n, model and the other ranking parameters) together with the corpus
+version stamp (``corpus.corpus_version``), so inserting or updating a resume
+or profile makes older entries unreachable without explicit invalidation.
+
+TTLs are per method (``RESULT_CACHE_TTLS``). Empty and degraded results
+(LLM fallbacks) are cached too, but only for ``RESULT_CACHE_NEGATIVE_TTL``,
+so repeats don't hammer a failing provider and recover soon after it does.
+Entries are stored through ``django.core.cache``. Resumes served from the
+memory-mapped snapshot are lazy views holding an mmap and a lock, so results
+are copied into plain dicts and arrays before they are pickled.
+"""
+
+import hashlib
+import json
+import logging
+from collections.abc import Mapping
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger('recommender')
+
+RESULT_CACHE_ENABLED = getattr(settings, 'RESULT_CACHE_ENABLED', True)
+RESULT_CACHE_TTLS = getattr(settings, 'RESULT_CACHE_TTLS', {'nlp': 600, 'hybrid': 3600, 'llm_only': 3600})
+RESULT_CACHE_DEFAULT_TTL = getattr(settings, 'RESULT_CACHE_DEFAULT_TTL', 600)
+RESULT_CACHE_NEGATIVE_TTL = getattr(settings, 'RESULT_CACHE_NEGATIVE_TTL', 60)
+
+KEY_PREFIX = 'recommendations:v1:'
+# Response header telling clients whether the result came from the cache
+RESULT_CACHE_HEADER = 'X-Result-Cache'
+_MISS = object()
+
+
+def normalize_job_description(job_desc):
+    return ' '.join(str(job_desc or '').split())
+
+
+def result_cache_key(method, job_desc, corpus_version, **params):
+    """Cache key for a recommendation request against one corpus version"""
+    payload = json.dumps({
+        'method': method,
+        'job': normalize_job_description(job_desc),
+        'corpus': corpus_version,
+        'params': params,
+    }, sort_keys=True, default=str)
+    return KEY_PREFIX + hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def get_cached_result(key):
+    """(hit, result); an empty list is a valid (negatively cached) hit"""
+    if not RESULT_CACHE_ENABLED:
+        return False, None
+    try:
+        result = cache.get(key, _MISS)
+    except Exception as e:
+        logger.error(f"Error reading recommendation cache: {str(e)}")
+        return False, None
+    if result is _MISS:
+        return False, None
+    return True, result
+
+
+def plain_result(value):
+    """A copy of a result with snapshot resumes and memory-mapped arrays made plain"""
+    if isinstance(value, Mapping):
+        return {k: plain_result(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [plain_result(v) for v in value]
+    if isinstance(value, tuple):
+        return tuple(plain_result(v) for v in value)
+    if isinstance(value, np.memmap):
+        return np.array(value)
+    return value
+
+
+def cache_result(key, method, result, degraded=False):
+    """Store a result for its method's TTL, or briefly if it is empty or degraded"""
+    if not RESULT_CACHE_ENABLED:
+        return
+    if not result or degraded:
+        timeout = RESULT_CACHE_NEGATIVE_TTL
+    else:
+        timeout = RESULT_CACHE_TTLS.get(method, RESULT_CACHE_DEFAULT_TTL)
+    try:
+        cache.set(key, plain_result(result), timeout)
+    except Exception as e:
+        logger.error(f"Error writing recommendation cache: {str(e)}")
+
+
+def use_result_cache(request):
+    """Requests can skip cached results (still refreshing the cache) with {"cache": false} or ?cache=false"""
+    flag = request.data.get("cache", request.query_params.get("cache", True))
+    return flag not in (False, "false", "0", 0)
@@ -0,0 +1,134 @@
+"""
+Vectorized scoring helpers for the NLP recommender.
+
+Resume embeddings are stacked once into a contiguous, L2-normalized float32
+matrix so that the semantic similarity of every candidate to a job is a single
+matrix-vector product instead of one sklearn ``cosine_similarity`` call per
+resume. Top-N selection uses ``np.argpartition`` rather than a full sort.
+"""
+
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger('recommender')
+
+
+def normalize_rows(matrix):
+    """L2-normalize the rows of a float32 matrix in place (zero rows are left as zeros)"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+def normalize_vector(vector):
+    """Return a float32 unit vector (zero vectors are returned unchanged)"""
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class FeatureColumns:
+    """
+    Columnar view of the precomputed per-resume features (see
+    ``utils.compute_resume_features``), aligned with the rows of an
+    EmbeddingMatrix.
+    """
+
+    def __init__(self, resumes):
+        features = [r.get('features') or {} for r in resumes]
+        self.experience_years = np.array([f.get('experience_years', 0.0) for f in features], dtype=np.float32)
+        self.education_rank = np.array([f.get('education_rank', 0) for f in features], dtype=np.int8)
+
+    @classmethod
+    def from_arrays(cls, experience_years, education_rank):
+        """Wrap existing (e.g. memory-mapped) columns without copying"""
+        columns = cls.__new__(cls)
+        columns.experience_years = experience_years
+        columns.education_rank = education_rank
+        return columns
+
+    def __len__(self):
+        return len(self.experience_years)
+
+
+class EmbeddingMatrix:
+    """Normalized float32 embedding matrix for a list of resumes"""
+
+    def __init__(self, resumes, dim=None):
+        embeddings = [r.get('embedding') for r in resumes]
+        if dim is None:
+            # Use the most common dimension so a few malformed rows can't break the matrix
+            dims = [np.size(e) for e in embeddings if e is not None and np.size(e) > 0]
+            dim = max(set(dims), key=dims.count) if dims else 0
+        self.dim = dim
+
+        # Positions (into resumes) of rows that made it into the matrix
+        self.rows = [i for i, e in enumerate(embeddings) if e is not None and np.size(e) == dim and dim > 0]
+        skipped = len(resumes) - len(self.rows)
+        if skipped:
+            logger.warning(f"{skipped} resumes skipped from embedding matrix (missing or not {dim}-dimensional)")
+
+        self.matrix = np.empty((len(self.rows), dim), dtype=np.float32)
+        for out, i in enumerate(self.rows):
+            self.matrix[out] = np.asarray(embeddings[i], dtype=np.float32).ravel()
+        normalize_rows(self.matrix)
+        self.features = FeatureColumns([resumes[i] for i in self.rows])
+
+    @classmethod
+    def from_arrays(cls, matrix, features):
+        """Wrap an already-normalized (e.g. memory-mapped) matrix covering every row, without copying"""
+        embedding_matrix = cls.__new__(cls)
+        embedding_matrix.dim = matrix.shape[1]
+        embedding_matrix.rows = range(len(matrix))
+        embedding_matrix.matrix = matrix
+        embedding_matrix.features = features
+        return embedding_matrix
+
+    def __len__(self):
+        return len(self.rows)
+
+    def similarities(self, query):
+        """Cosine similarity of every row to the query embedding"""
+        return self.matrix @ normalize_vector(query)
+
+
+_matrix_lock = threading.Lock()
+_matrix_cache = {'key': None, 'matrix': None, 'embeddings': None}
+
+
+def get_embedding_matrix(resumes):
+    """
+    Return the EmbeddingMatrix for resumes, reusing the last one if the same
+    embedding arrays are passed again (the corpus snapshot hands out the same
+    objects until it refreshes).
+    """
+    # A whole local snapshot, in order, already has its memory-mapped matrix
+    snapshot = getattr(resumes[0], 'snapshot', None) if resumes else None
+    if snapshot is not None and len(resumes) == len(snapshot) and all(
+            getattr(r, 'snapshot', None) is snapshot and r.row == i for i, r in enumerate(resumes)):
+        return snapshot.embedding_matrix
+
+    embeddings = [r.get('embedding') for r in resumes]
+    key = tuple(id(e) for e in embeddings)
+    with _matrix_lock:
+        if _matrix_cache['key'] == key:
+            return _matrix_cache['matrix']
+    matrix = EmbeddingMatrix(resumes)
+    with _matrix_lock:
+        # Holding the arrays keeps their ids from being reused while cached
+        _matrix_cache.update(key=key, matrix=matrix, embeddings=embeddings)
+    return matrix
+
+
+def top_n_indices(scores, top_n):
+    """Indices of the top_n highest scores in descending order, using partial selection"""
+    scores = np.asarray(scores)
+    if top_n <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.intp)
+    if top_n < scores.size:
+        candidates = np.argpartition(-scores, top_n - 1)[:top_n]
+    else:
+        candidates = np.arange(scores.size)
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
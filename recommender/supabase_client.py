@@ -1,4 +1,136 @@
-from supabase import create_client, Client
+"""
+Shared Supabase data-access layer.
+
+Views, utils, the corpus and the management commands used to build their own
+clients (ProfileAPI and profile writes one per request), each with its own
+connection pool, so requests regularly paid for a new TLS handshake.
+``get_supabase`` returns one client per credential set for the whole process,
+backed by a keep-alive connection pool per Supabase URL (``SUPABASE_POOL_SIZE``
+connections, ``SUPABASE_*_TIMEOUT`` timeouts). ``get_auth_client`` is a
+separate client. Clients share only the pool's transport: each has its own
+``httpx.Client``, because postgrest writes its base URL and ``Authorization``
+header onto the client it is given, and a sign-in would otherwise leak the
+user's token into the data client's queries.
+
+Every HTTP call made through the pool is timed: calls slower than
+``SUPABASE_SLOW_QUERY_MS`` are logged and ``query_stats`` reports count,
+average and max latency per method and table.
+
+Clients are dropped in forked children (gunicorn workers inherit the
+master's after preload), so processes never share a socket.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+import httpx
 from django.conf import settings
+from supabase import create_client, Client, ClientOptions
+
+logger = logging.getLogger('recommender')
+
+SUPABASE_POOL_SIZE = getattr(settings, 'SUPABASE_POOL_SIZE', 20)
+SUPABASE_KEEPALIVE_SECONDS = getattr(settings, 'SUPABASE_KEEPALIVE_SECONDS', 60)
+SUPABASE_CONNECT_TIMEOUT = getattr(settings, 'SUPABASE_CONNECT_TIMEOUT', 5)
+SUPABASE_READ_TIMEOUT = getattr(settings, 'SUPABASE_READ_TIMEOUT', 30)
+SUPABASE_SLOW_QUERY_MS = getattr(settings, 'SUPABASE_SLOW_QUERY_MS', 500)
+
+_lock = threading.Lock()
+_transports = {}
+_clients = {}
+_stats = defaultdict(lambda: {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+
+
+def _query_label(request):
+    """'GET resumes' for PostgREST calls, 'POST auth/token' for the other services"""
+    path = request.url.path
+    if path.startswith('/rest/v1/'):
+        return f"{request.method} {path[len('/rest/v1/'):]}"
+    return f"{request.method} {path.replace('/v1/', '/', 1).strip('/')}"
+
+
+def _start_timer(request):
+    request.extensions['started_at'] = time.perf_counter()
+
+
+def _record_latency(response):
+    started_at = response.request.extensions.get('started_at')
+    if started_at is None:
+        return
+    elapsed_ms = (time.perf_counter() - started_at) * 1000
+    label = _query_label(response.request)
+    with _lock:
+        stats = _stats[label]
+        stats['count'] += 1
+        stats['total_ms'] += elapsed_ms
+        stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+    if elapsed_ms > SUPABASE_SLOW_QUERY_MS:
+        logger.warning(f"Slow Supabase query {label}: {elapsed_ms:.0f} ms (status {response.status_code})")
+    else:
+        logger.debug(f"Supabase query {label}: {elapsed_ms:.0f} ms")
+
+
+def _new_transport():
+    return httpx.HTTPTransport(limits=httpx.Limits(
+        max_connections=SUPABASE_POOL_SIZE,
+        max_keepalive_connections=SUPABASE_POOL_SIZE,
+        keepalive_expiry=SUPABASE_KEEPALIVE_SECONDS
+    ))
+
+
+def _new_http_client(transport):
+    # Headers and base URL live on this client, connections on the shared transport
+    return httpx.Client(
+        transport=transport,
+        timeout=httpx.Timeout(SUPABASE_READ_TIMEOUT, connect=SUPABASE_CONNECT_TIMEOUT),
+        event_hooks={'request': [_start_timer], 'response': [_record_latency]}
+    )
+
+
+def _get_client(url, key, role):
+    with _lock:
+        client = _clients.get((url, key, role))
+        if client is None:
+            transport = _transports.get(url)
+            if transport is None:
+                transport = _transports[url] = _new_transport()
+            http_client = _new_http_client(transport)
+            client = _clients[(url, key, role)] = create_client(url, key, options=ClientOptions(httpx_client=http_client))
+    return client
+
+
+def get_supabase(key=None, url=None) -> Client:
+    """Process-wide client for the given credential set (default SUPABASE_KEY)"""
+    return _get_client(url or settings.SUPABASE_URL, key or settings.SUPABASE_KEY, 'data')
+
+
+def get_auth_client(key=None, url=None) -> Client:
+    """Client for sign-up/sign-in calls, kept apart from the data client's session"""
+    return _get_client(url or settings.SUPABASE_URL, key or settings.SUPABASE_KEY, 'auth')
+
+
+def query_stats():
+    """Per-query latency since process start: {label: {count, avg_ms, max_ms}}"""
+    with _lock:
+        return {
+            label: {
+                'count': s['count'],
+                'avg_ms': round(s['total_ms'] / s['count'], 1),
+                'max_ms': round(s['max_ms'], 1),
+            }
+            for label, s in _stats.items()
+        }
+
+
+def _reset_after_fork():
+    # The inherited pools' sockets belong to the parent; start empty in the child
+    global _lock
+    _lock = threading.Lock()
+    _transports.clear()
+    _clients.clear()
+    _stats.clear()
+
 
-supabase: Client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY) 
\ No newline at end of file
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,278 @@
+"""
+Vocabulary-level embedding store for skills and certifications.
+
+The same few thousand skill and certification strings show up across every
+resume, so instead of re-encoding them inside the per-resume scoring loop each
+term is encoded once, L2-normalized and kept in a store:
+
+- on disk as a versioned directory under ``<path>/`` holding
+  ``vectors.npy`` (opened memory-mapped) and ``terms.json`` (the row of each
+  vector), published by replacing the ``CURRENT`` pointer so readers never
+  pair one save's vectors with another's terms,
+- with a bounded LRU of recently used vectors in front of it, which is also
+  the only place job-description terms (``get_query_vectors``) are kept, so
+  request text never grows the store,
+- with terms encoded on the fly shared with the other workers through the
+  host-shared cache,
+- and populated with corpus vocabulary at ingest time via ``warm_resume_terms``.
+
+Skill and certification similarity then reduce to lookups plus a small matrix
+product.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger('recommender')
+
+TERM_STORE_PATH = getattr(settings, 'TERM_STORE_PATH', os.path.join('data', 'term_embeddings'))
+TERM_STORE_CACHE_SIZE = getattr(settings, 'TERM_STORE_CACHE_SIZE', 10000)
+EMBEDDING_CACHE_SECONDS = getattr(settings, 'EMBEDDING_CACHE_SECONDS', 7 * 24 * 3600)
+
+POINTER_FILE = 'CURRENT'
+VECTORS_FILE = 'vectors.npy'
+TERMS_FILE = 'terms.json'
+# Older saves kept besides the published one, so a reader that just read the pointer can still open it
+KEEP_SAVES = 2
+
+
+def term_key(term):
+    """Store key for a term (the sentence transformer is uncased, so neither is the store)"""
+    return term.strip().lower()
+
+
+class TermEmbeddingStore:
+    """Maps terms to normalized float32 vectors, encoding unseen terms in batches"""
+
+    def __init__(self, path=TERM_STORE_PATH, cache_size=TERM_STORE_CACHE_SIZE):
+        self.path = path
+        self.cache_size = cache_size
+        self._lock = threading.RLock()
+        self._cache = OrderedDict()
+        self._pending = {}
+        self._index = {}
+        self._vectors = None
+        self.dim = None
+        self._load()
+
+    def __len__(self):
+        return len(self._index) + len(self._pending)
+
+    def __contains__(self, term):
+        key = term_key(term)
+        return key in self._index or key in self._pending
+
+    def _current_files(self):
+        """(vectors, terms) paths of the published save, falling back to the pre-versioned layout"""
+        try:
+            with open(os.path.join(self.path, POINTER_FILE)) as f:
+                directory = os.path.join(self.path, f.read().strip())
+            return os.path.join(directory, VECTORS_FILE), os.path.join(directory, TERMS_FILE)
+        except OSError:
+            return self.path + '.npy', self.path + '.json'
+
+    def _load(self):
+        vectors_path, terms_path = self._current_files()
+        if not (os.path.exists(vectors_path) and os.path.exists(terms_path)):
+            return
+        try:
+            with open(terms_path) as f:
+                terms = json.load(f)
+            vectors = np.load(vectors_path, mmap_mode='r')
+            if len(terms) != vectors.shape[0]:
+                raise ValueError(f"{len(terms)} terms but {vectors.shape[0]} vectors")
+            self._vectors = vectors
+            self._index = {t: i for i, t in enumerate(terms)}
+            self.dim = vectors.shape[1]
+            logger.info(f"Loaded {len(terms)} term embeddings from {vectors_path}")
+        except Exception as e:
+            logger.error(f"Error loading term embedding store: {str(e)}")
+
+    def _known(self, key):
+        return key in self._index or key in self._pending
+
+    def _remember(self, key, vector):
+        self._cache[key] = vector
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _lookup(self, key):
+        vector = self._cache.get(key)
+        if vector is not None:
+            self._cache.move_to_end(key)
+            return vector
+        vector = self._pending.get(key)
+        if vector is None and key in self._index:
+            vector = np.array(self._vectors[self._index[key]])
+        if vector is not None:
+            self._remember(key, vector)
+        return vector
+
+    def _encode(self, keys):
+        """
+        {key: vector} for keys, from the host-shared cache or one batched model
+        call. Called without the lock so other requests can read the store meanwhile.
+        """
+        from .utils import get_sentence_transformer, embedding_model_id
+        # Terms another worker on the host already encoded come from the shared cache
+        cache_keys = {key: f"term:v1:{embedding_model_id()}:{hashlib.sha256(key.encode('utf-8')).hexdigest()}" for key in keys}
+        try:
+            shared = cache.get_many(list(cache_keys.values()))
+        except Exception as e:
+            logger.warning(f"Error reading term vectors from cache: {str(e)}")
+            shared = {}
+        encoded = {key: shared[cache_keys[key]] for key in keys if cache_keys[key] in shared}
+        to_encode = [key for key in keys if key not in encoded]
+        if to_encode:
+            vectors = get_sentence_transformer().encode(to_encode, batch_size=64, normalize_embeddings=True)
+            vectors = np.asarray(vectors, dtype=np.float32)
+            encoded.update(zip(to_encode, vectors))
+            try:
+                cache.set_many({cache_keys[key]: vector for key, vector in zip(to_encode, vectors)}, EMBEDDING_CACHE_SECONDS)
+            except Exception as e:
+                logger.warning(f"Error writing term vectors to cache: {str(e)}")
+        return encoded
+
+    def add(self, terms):
+        """
+        Encode the corpus terms that aren't in the store yet with a single
+        batched model call and queue them for the next save
+        """
+        with self._lock:
+            missing = list(OrderedDict.fromkeys(term_key(t) for t in terms if t and t.strip()))
+            missing = [k for k in missing if not self._known(k)]
+        if not missing:
+            return 0
+        encoded = self._encode(missing)
+        with self._lock:
+            for key, vector in encoded.items():
+                if not self._known(key):
+                    self._pending[key] = vector
+                self.dim = vector.shape[0]
+        return len(missing)
+
+    def get_vectors(self, terms):
+        """
+        Return a (len(terms), dim) matrix of normalized vectors for corpus
+        terms (resume skills and certifications), adding unseen ones to the store
+        """
+        if not terms:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        keys = [term_key(t) for t in terms]
+        with self._lock:
+            unseen = any(not self._known(k) for k in keys)
+        if unseen:
+            self.add(terms)
+        with self._lock:
+            return np.vstack([self._lookup(k) for k in keys])
+
+    def get_query_vectors(self, terms):
+        """
+        Like get_vectors, for terms taken from job descriptions: unseen terms
+        are encoded and kept only in the bounded LRU, never saved to the store
+        """
+        if not terms:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        keys = [term_key(t) for t in terms]
+        with self._lock:
+            vectors = {k: self._lookup(k) for k in set(keys)}
+        missing = [k for k, vector in vectors.items() if vector is None]
+        if missing:
+            encoded = self._encode(missing)
+            with self._lock:
+                for key, vector in encoded.items():
+                    self._remember(key, vector)
+            vectors.update(encoded)
+        return np.vstack([vectors[k] for k in keys])
+
+    def save(self):
+        """
+        Write pending terms to disk, merging with whatever is there now (other
+        workers may have saved since we loaded), as a new save published atomically.
+        """
+        with self._lock:
+            if not self._pending:
+                return
+            on_disk = TermEmbeddingStore(self.path, cache_size=0)
+            terms = list(on_disk._index)
+            blocks = [on_disk._vectors] if on_disk._vectors is not None else []
+            new_terms = [k for k in self._pending if k not in on_disk._index]
+            if new_terms:
+                terms.extend(new_terms)
+                blocks.append(np.vstack([self._pending[k] for k in new_terms]))
+            vectors = np.ascontiguousarray(np.vstack(blocks), dtype=np.float32)
+
+            directory = self._publish(terms, vectors)
+
+            self._pending = {}
+            self._cache.clear()
+            self._load()
+            logger.info(f"Saved {len(terms)} term embeddings to {directory}")
+
+    def _publish(self, terms, vectors):
+        """Write a new save directory, point CURRENT at it and prune older saves"""
+        name = f"{time.time_ns()}-{os.getpid()}"
+        building = os.path.join(self.path, name + '.building')
+        os.makedirs(building)
+        try:
+            np.save(os.path.join(building, VECTORS_FILE), vectors)
+            with open(os.path.join(building, TERMS_FILE), 'w') as f:
+                json.dump(terms, f)
+            os.rename(building, os.path.join(self.path, name))
+        except Exception:
+            shutil.rmtree(building, ignore_errors=True)
+            raise
+
+        # Readers see either the old pointer or the new one
+        pointer = os.path.join(self.path, POINTER_FILE)
+        with open(f"{pointer}.{os.getpid()}.tmp", 'w') as f:
+            f.write(name)
+        os.replace(f"{pointer}.{os.getpid()}.tmp", pointer)
+
+        saves = sorted(
+            (d for d in os.listdir(self.path) if os.path.isdir(os.path.join(self.path, d)) and not d.endswith('.building')),
+            reverse=True
+        )
+        for old in saves[KEEP_SAVES + 1:]:
+            shutil.rmtree(os.path.join(self.path, old), ignore_errors=True)
+        return os.path.join(self.path, name)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_term_store():
+    """Return the process-wide term embedding store"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = TermEmbeddingStore()
+    return _store
+
+
+def warm_resume_terms(resumes, save=True):
+    """Populate the store with the skills and certifications of newly ingested resumes"""
+    terms = []
+    for resume in resumes:
+        terms.extend(s for s in resume.get('skills', []) if isinstance(s, str))
+        terms.extend(c for c in resume.get('certifications', []) if isinstance(c, str))
+    try:
+        store = get_term_store()
+        added = store.add(terms)
+        if added:
+            logger.info(f"Encoded {added} new skill/certification terms")
+            if save:
+                store.save()
+    except Exception as e:
+        logger.error(f"Error warming term embedding store: {str(e)}")
@@ -1,3 +1,691 @@
-from django.test import TestCase
+import base64
+import hashlib
+import multiprocessing
+import random
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+import jwt
+import numpy as np
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+from . import ann_index, cache_backends, corpus, llm_recommender, middleware, result_cache, utils
+from .ann_index import ResumeANNIndex
+from .cache_backends import SQLiteCache
+from .embedding_codec import decode_embedding, decode_embeddings, embedding_header, encode_embedding, encode_embeddings
+from .llm_recommender import build_llm_result, clamp_score, combine_hybrid_result, iter_hybrid_cascade
+from .result_cache import cache_result, get_cached_result, result_cache_key
+from .term_store import TermEmbeddingStore
 
-# Create your tests here.
+
+class LLMScoreTests(SimpleTestCase):
+    def test_clamp_score(self):
+        self.assertEqual(clamp_score(85), 85)
+        self.assertEqual(clamp_score("72"), 72)
+        self.assertEqual(clamp_score(64.6), 65)
+        self.assertEqual(clamp_score(120), 100)
+        self.assertEqual(clamp_score(-5), 0)
+        self.assertEqual(clamp_score("high"), 50)
+        self.assertEqual(clamp_score(None, default=0), 0)
+        self.assertEqual(clamp_score(float('inf')), 50)
+
+    def test_build_llm_result_clamps_score(self):
+        self.assertEqual(build_llm_result({}, {'score': 120})['score'], 1.0)
+        result = build_llm_result({}, {'score': '40'})
+        self.assertEqual(result['score'], 0.4)
+        self.assertEqual(result['raw_score'], 40)
+
+
+class HybridCascadeTests(SimpleTestCase):
+    """The cascade's early stop must not change the top N of evaluating every budgeted candidate"""
+
+    def run_cascade(self, ranked, llm_scores, top_n, budget):
+        def evaluate(job_desc, resume_text, model_name=None):
+            return {'score': llm_scores[resume_text], 'reasoning': ''}
+
+        def evaluate_batch(job_desc, resume_texts, model_name=None):
+            return [evaluate(job_desc, text) for text in resume_texts]
+
+        evaluated = []
+        with mock.patch.object(llm_recommender, 'format_resume_for_llm', lambda resume, token_budget=None: resume['id']), \
+                mock.patch.object(llm_recommender, 'get_llm_evaluation', evaluate), \
+                mock.patch.object(llm_recommender, 'get_llm_batch_evaluations', evaluate_batch):
+            for event, payload in iter_hybrid_cascade("job", ranked, top_n=top_n, budget=budget):
+                if event == 'final':
+                    return payload, evaluated
+                evaluated.append(payload['resume']['id'])
+
+    def exhaustive(self, ranked, llm_scores, top_n, budget):
+        results = []
+        for n, (resume_id, result) in enumerate(ranked):
+            llm_result = None
+            if n < budget:
+                llm_result = build_llm_result(result['resume'], {'score': llm_scores[resume_id]})
+            results.append(combine_hybrid_result(result, llm_result))
+        results.sort(key=lambda x: x['score'], reverse=True)
+        return results[:top_n]
+
+    def make_ranked(self, rng, size):
+        nlp_scores = sorted((rng.random() for _ in range(size)), reverse=True)
+        ranked = [(f"r{n}", {'resume': {'id': f"r{n}"}, 'score': score}) for n, score in enumerate(nlp_scores)]
+        llm_scores = {resume_id: rng.randint(0, 100) for resume_id, _ in ranked}
+        return ranked, llm_scores
+
+    def assert_same_ranking(self, cascade, exhaustive):
+        self.assertEqual([r['resume']['id'] for r in cascade], [r['resume']['id'] for r in exhaustive])
+        for got, expected in zip(cascade, exhaustive):
+            self.assertAlmostEqual(got['score'], expected['score'])
+
+    def test_matches_exhaustive_ranking(self):
+        rng = random.Random(7)
+        for _ in range(50):
+            size = rng.randint(1, 40)
+            top_n = rng.randint(1, 8)
+            budget = rng.randint(0, size)
+            ranked, llm_scores = self.make_ranked(rng, size)
+            cascade, _ = self.run_cascade(ranked, llm_scores, top_n, budget)
+            self.assert_same_ranking(cascade, self.exhaustive(ranked, llm_scores, top_n, budget))
+
+    def test_stops_early_when_top_n_is_settled(self):
+        # Strong NLP leaders with perfect LLM scores leave no room for the tail
+        ranked = [(f"r{n}", {'resume': {'id': f"r{n}"}, 'score': score})
+                  for n, score in enumerate([0.95, 0.9, 0.2, 0.1, 0.05])]
+        llm_scores = {resume_id: 100 for resume_id, _ in ranked}
+        with mock.patch.object(llm_recommender, 'LLM_MAX_CONCURRENCY', 1), \
+                mock.patch.object(llm_recommender, 'LLM_BATCH_SIZE', 1):
+            cascade, evaluated = self.run_cascade(ranked, llm_scores, top_n=2, budget=5)
+        self.assertEqual(evaluated, ['r0', 'r1'])
+        self.assert_same_ranking(cascade, self.exhaustive(ranked, llm_scores, 2, 5))
+
+    def test_out_of_range_scores_do_not_break_the_bound(self):
+        rng = random.Random(11)
+        ranked, llm_scores = self.make_ranked(rng, 20)
+        llm_scores.update({'r0': 150, 'r3': '90', 'r5': -20})
+        cascade, _ = self.run_cascade(ranked, llm_scores, top_n=5, budget=20)
+        self.assert_same_ranking(cascade, self.exhaustive(ranked, llm_scores, 5, 20))
+
+
+class BatchEvaluationTests(SimpleTestCase):
+    def test_parse_batch_response(self):
+        response = """Here you go: {"evaluations": [
+            {"id": "C1", "score": 80, "reasoning": "Strong"},
+            {"id": "C2", "score": "65"},
+            {"id": "C3", "score": 140},
+            {"id": "C4", "score": "high"},
+            {"id": "C9", "score": 70}
+        ]}"""
+        parsed = llm_recommender.parse_batch_response(response, {'C1', 'C2', 'C3', 'C4'})
+        self.assertEqual(set(parsed), {'C1', 'C2'})
+        self.assertEqual(parsed['C1'], {'score': 80, 'reasoning': 'Strong'})
+        self.assertEqual(parsed['C2'], {'score': 65, 'reasoning': ''})
+
+    def test_parse_batch_response_rejects_malformed_payloads(self):
+        for response in (None, '', 'no json here', '{"evaluations": ', '{"evaluations": {"id": "C1"}}', '[1, 2]'):
+            self.assertEqual(llm_recommender.parse_batch_response(response, {'C1'}), {})
+
+    def evaluate(self, texts, request):
+        with mock.patch.object(llm_recommender, 'request_llm_batch_evaluation', side_effect=request) as patched:
+            evaluations = llm_recommender.get_llm_batch_evaluations("job", texts)
+        return evaluations, patched
+
+    def test_prompt_versions_do_not_share_cached_evaluations(self):
+        model = llm_recommender.LLM_MODELS[llm_recommender.DEFAULT_LLM_MODEL]
+        llm_recommender.store_evaluation("job", "versioned resume", model, llm_recommender.PROMPT_VERSION,
+                                         {'score': 90, 'reasoning': 'single prompt'})
+        self.assertIsNone(llm_recommender.read_cached_evaluation(
+            "job", "versioned resume", model, llm_recommender.BATCH_PROMPT_VERSION))
+        cached = llm_recommender.read_cached_evaluation("job", "versioned resume", model, llm_recommender.PROMPT_VERSION)
+        self.assertEqual(cached['reasoning'], 'single prompt')
+
+    def test_timed_out_batch_gets_fallback_evaluations(self):
+        evaluations, patched = self.evaluate(['timeout a', 'timeout b', 'timeout c'], llm_recommender.APITimeoutError(request=None))
+        self.assertEqual(patched.call_count, 1)
+        self.assertTrue(all(e['error'] and e['score'] == 50 for e in evaluations))
+
+    def test_failed_batch_is_split_in_half(self):
+        def request(job_desc, resume_texts, model_name=None):
+            if len(resume_texts) > 2:
+                raise ValueError("prompt too long")
+            return [{'score': 70, 'reasoning': text} for text in resume_texts]
+
+        texts = ['split a', 'split b', 'split c', 'split d', 'split e']
+        evaluations, patched = self.evaluate(texts, request)
+        self.assertEqual([len(c.args[1]) for c in patched.call_args_list], [5, 2, 3, 2])
+        # The single resume left over from splitting three goes to the single-resume call
+        self.assertEqual([e and e['reasoning'] for e in evaluations], ['split a', 'split b', None, 'split d', 'split e'])
+
+
+class EmbeddingCodecTests(SimpleTestCase):
+    MODEL = "all-MiniLM-L6-v2"
+    # Worst-case absolute error per stored dtype for unit vectors
+    TOLERANCE = {'legacy': 0, 'float32': 0, 'float16': 1e-3, 'int8': 1e-2}
+
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        matrix = rng.standard_normal((6, 384)).astype(np.float32)
+        self.matrix = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+    def assert_decodes_to(self, decoded, matrix, dtype):
+        self.assertEqual(len(decoded), len(matrix))
+        for vector, expected in zip(decoded, matrix):
+            self.assertEqual(vector.dtype, np.float32)
+            np.testing.assert_allclose(vector, expected, rtol=0, atol=self.TOLERANCE[dtype] + 1e-7)
+
+    def test_round_trip_per_dtype(self):
+        for dtype in ('legacy', 'float32', 'float16', 'int8'):
+            with self.subTest(dtype=dtype):
+                values = encode_embeddings(self.matrix, self.MODEL, dtype=dtype)
+                self.assert_decodes_to(decode_embeddings(values, model=self.MODEL), self.matrix, dtype)
+                self.assert_decodes_to([decode_embedding(v) for v in values], self.matrix, dtype)
+                header = embedding_header(values[0])
+                if dtype == 'legacy':
+                    self.assertIsNone(header)
+                else:
+                    self.assertEqual((header['dtype'], header['dim'], header['model']), (dtype, 384, self.MODEL))
+
+    def test_mixed_batch(self):
+        dtypes = ['legacy', 'float32', 'float16', 'int8', 'float32', 'int8']
+        values = [encode_embedding(row, self.MODEL, dtype=dtype) for row, dtype in zip(self.matrix, dtypes)]
+        # Different dimensions and empty or invalid values in the same batch
+        short = np.ones(8, dtype=np.float32) / np.sqrt(8)
+        values += [encode_embedding(short, self.MODEL, dtype='float16'), '', None, 'not base64!']
+        decoded = decode_embeddings(values, model=self.MODEL)
+        for n, dtype in enumerate(dtypes):
+            self.assert_decodes_to([decoded[n]], self.matrix[n:n + 1], dtype)
+        np.testing.assert_allclose(decoded[6], short, atol=1e-3)
+        self.assertEqual(decoded[7:], [None, None, None])
+
+    def test_other_models_are_skipped(self):
+        onnx = encode_embeddings(self.matrix[:2], self.MODEL + "+onnx-int8")
+        other = encode_embeddings(self.matrix[2:4], "all-mpnet-base-v2")
+        legacy = encode_embeddings(self.matrix[4:], self.MODEL, dtype='legacy')
+        decoded = decode_embeddings(onnx + other + legacy, model=self.MODEL)
+        self.assertEqual([d is None for d in decoded], [False, False, True, True, False, False])
+        self.assertIsNone(decode_embedding(other[0], model=self.MODEL))
+        self.assertIsNotNone(decode_embeddings(other)[0])
+
+    def test_frontend_base64_round_trip(self):
+        # CreateResumePage turns the API's value into bytes with atob and stores btoa of those bytes
+        for dtype in ('legacy', 'float32', 'float16', 'int8'):
+            with self.subTest(dtype=dtype):
+                value = encode_embedding(self.matrix[0], self.MODEL, dtype=dtype)
+                binary = base64.b64decode(value).decode('latin-1')  # atob
+                stored = base64.b64encode(bytes(ord(c) for c in binary)).decode('ascii')  # btoa
+                self.assertEqual(stored, value)
+                self.assert_decodes_to(decode_embeddings([stored], model=self.MODEL), self.matrix[:1], dtype)
+
+
+JWT_SECRET = 'test-secret-for-hs256-tokens-0123456789'
+
+
+@mock.patch.object(middleware, 'SUPABASE_JWT_SECRET', JWT_SECRET)
+class SupabaseAuthenticationTests(SimpleTestCase):
+    def setUp(self):
+        middleware._token_cache.clear()
+        self.addCleanup(middleware._token_cache.clear)
+        self.middleware = middleware.SupabaseAuthentication(lambda request: HttpResponse('ok'))
+
+    def token(self, secret=JWT_SECRET, **claims):
+        payload = {'sub': 'user-1', 'email': 'user@example.com', 'aud': 'authenticated',
+                   'exp': int(time.time()) + 3600, 'user_metadata': {'role': 'recruiter'}}
+        payload.update(claims)
+        return jwt.encode(payload, secret, algorithm='HS256')
+
+    def call(self, token):
+        request = RequestFactory().get('/api/recommend/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return request, self.middleware(request)
+
+    def test_valid_token(self):
+        request, response = self.call(self.token())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((request.supabase_user.id, request.supabase_user.role), ('user-1', 'recruiter'))
+
+    def test_invalid_tokens_are_rejected(self):
+        cases = {
+            'expired': self.token(exp=int(time.time()) - 60),
+            'wrong audience': self.token(aud='anon'),
+            'bad signature': self.token(secret=JWT_SECRET[::-1]),
+            'malformed': 'not-a-jwt',
+        }
+        for name, token in cases.items():
+            with self.subTest(name):
+                request, response = self.call(token)
+                self.assertEqual(response.status_code, 401)
+                self.assertIsNone(request.supabase_user)
+
+    def test_cached_user_expires_with_the_token(self):
+        token = self.token(exp=int(time.time()) + 30)
+        with mock.patch.object(middleware, 'verify_token', wraps=middleware.verify_token) as verify:
+            self.call(token)
+            self.call(token)
+            self.assertEqual(verify.call_count, 1)
+            # Past the token's expiry (before AUTH_CACHE_SECONDS) the cache entry is dropped
+            later = time.time() + 31
+            with mock.patch.object(middleware.time, 'time', return_value=later):
+                self.call(token)
+            self.assertEqual(verify.call_count, 2)
+
+    def test_token_cache_ttl(self):
+        cache = middleware.TokenCache(max_size=2)
+        now = time.time()
+        cache.set('a', 'user-a', now + 5)
+        cache.set('b', 'user-b', now + 60)
+        self.assertEqual(cache.get('a'), 'user-a')
+        with mock.patch.object(middleware.time, 'time', return_value=now + 10):
+            self.assertIsNone(cache.get('a'))
+            self.assertEqual(cache.get('b'), 'user-b')
+        cache.set('c', 'user-c', now + 60)
+        cache.set('d', 'user-d', now + 60)
+        self.assertIsNone(cache.get('b'))
+
+
+class FakeEncoder:
+    """Deterministic unit vectors per text, counting the texts it encodes"""
+
+    def __init__(self, dim=8):
+        self.dim = dim
+        self.encoded = []
+
+    def vector(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:4], 'little')
+        vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def encode(self, texts, **kwargs):
+        self.encoded.extend(texts)
+        return np.vstack([self.vector(text) for text in texts])
+
+
+class TermStoreTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path, ignore_errors=True)
+        self.path += '/terms'
+        self.encoder = FakeEncoder()
+        for name, value in (('get_sentence_transformer', lambda: self.encoder), ('embedding_model_id', lambda: 'fake')):
+            patcher = mock.patch.object(utils, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_query_terms_are_not_persisted(self):
+        store = TermEmbeddingStore(self.path, cache_size=2)
+        vectors = store.get_query_vectors(['Kubernetes', 'Go', 'kubernetes'])
+        np.testing.assert_allclose(vectors[0], self.encoder.vector('kubernetes'))
+        np.testing.assert_array_equal(vectors[0], vectors[2])
+        self.assertEqual(len(store), 0)
+        self.assertNotIn('go', store)
+        store.get_query_vectors(['Rust', 'Zig', 'Elixir'])
+        self.assertLessEqual(len(store._cache), 2)
+        store.save()
+        self.assertEqual(len(TermEmbeddingStore(self.path)), 0)
+
+    def test_corpus_terms_are_encoded_once(self):
+        store = TermEmbeddingStore(self.path)
+        self.assertEqual(store.add(['Python', 'python ', 'AWS', '']), 2)
+        store.get_vectors(['Python', 'AWS', 'SQL'])
+        store.get_query_vectors(['python'])
+        self.assertEqual(sorted(self.encoder.encoded), ['aws', 'python', 'sql'])
+        self.assertEqual(len(store), 3)
+
+    def test_saves_from_other_processes_are_merged(self):
+        first = TermEmbeddingStore(self.path)
+        first.add(['Python', 'AWS'])
+        first.save()
+
+        def save_in_child(terms):
+            store = TermEmbeddingStore(self.path)
+            store.add(terms)
+            store.save()
+
+        child = multiprocessing.get_context('fork').Process(target=save_in_child, args=(['Docker', 'AWS'],))
+        child.start()
+        child.join()
+        self.assertEqual(child.exitcode, 0)
+
+        # The first process saves again without having seen the child's save
+        first.add(['Terraform'])
+        first.save()
+        merged = TermEmbeddingStore(self.path)
+        self.assertEqual(sorted(merged._index), ['aws', 'docker', 'python', 'terraform'])
+        for term in merged._index:
+            np.testing.assert_allclose(merged.get_vectors([term])[0], self.encoder.vector(term), rtol=1e-6)
+
+
+class FakeQuery:
+    def __init__(self, table):
+        self.table = table
+        self.filters = []
+
+    def select(self, columns):
+        return self
+
+    def gte(self, column, value):
+        self.filters.append((column, value))
+        return self
+
+    def execute(self):
+        self.table.queries.append(self.filters)
+        rows = [dict(row) for row in self.table.rows
+                if all(row.get(column) and row[column] >= value for column, value in self.filters)]
+        return mock.Mock(data=rows)
+
+
+class FakeTable:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+
+class FakeSupabase:
+    def __init__(self, resumes, profiles):
+        self.tables = {'resumes': FakeTable(resumes), 'profiles': FakeTable(profiles)}
+
+    def table(self, name):
+        return FakeQuery(self.tables[name])
+
+
+class FakeCorpusMixin:
+    """A CorpusSnapshot over an in-memory Supabase with two resumes and their profiles"""
+
+    def setUp(self):
+        self.supabase = FakeSupabase(
+            resumes=[
+                {'id': 'r1', 'user_id': 'u1', 'skills': ['Python'], 'updated_at': '2026-01-01T00:00:00'},
+                {'id': 'r2', 'user_id': 'u2', 'skills': ['Go'], 'updated_at': '2026-01-02T00:00:00'},
+            ],
+            profiles=[
+                {'id': 'u1', 'first_name': 'Ada', 'last_name': 'L', 'updated_at': '2026-01-01T00:00:00'},
+                {'id': 'u2', 'first_name': 'Alan', 'last_name': 'T', 'updated_at': '2026-01-01T00:00:00'},
+            ],
+        )
+        patches = [
+            mock.patch.object(corpus, 'get_supabase', lambda: self.supabase),
+            # Joining the profile is all these tests need from preparation
+            mock.patch.object(corpus, 'prepare_resumes',
+                              lambda resumes, get_profile: [utils.attach_profile(r, get_profile(r)) for r in resumes]),
+            mock.patch.object(corpus, '_sync_ann_index', lambda updated, removed: None),
+            mock.patch.object(corpus, 'warm_resume_terms', lambda resumes: None),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.snapshot = corpus.CorpusSnapshot(max_staleness=0, full_reload_interval=3600)
+
+
+class CorpusSnapshotTests(FakeCorpusMixin, SimpleTestCase):
+    def names(self, resumes):
+        return {r['id']: r['name'] for r in resumes}
+
+    def test_incremental_refresh_merges_changes_into_copies(self):
+        before = self.snapshot.get_resumes()
+        self.assertEqual(self.names(before), {'r1': 'Ada L', 'r2': 'Alan T'})
+        version = self.snapshot.version
+
+        self.supabase.tables['profiles'].rows[0].update(first_name='Grace', updated_at='2026-02-01T00:00:00')
+        self.supabase.tables['resumes'].rows.append(
+            {'id': 'r3', 'user_id': 'u2', 'skills': ['Rust'], 'updated_at': '2026-02-01T00:00:00'})
+        after = self.snapshot.get_resumes()
+
+        self.assertEqual(self.names(after), {'r1': 'Grace L', 'r2': 'Alan T', 'r3': 'Alan T'})
+        self.assertEqual(self.snapshot.version, version + 1)
+        # A reader still holding the previous list sees consistent, unmodified rows
+        self.assertEqual(self.names(before), {'r1': 'Ada L', 'r2': 'Alan T'})
+        self.assertIsNot(after[0], before[0])
+        self.assertIs(after[1], before[1])
+
+    def test_watermarks_bound_incremental_queries(self):
+        self.snapshot.get_resumes()
+        version = self.snapshot.version
+        self.snapshot.get_resumes()
+        # Rows at exactly the watermark come back again but don't count as changes
+        self.assertEqual(self.snapshot.version, version)
+        self.assertEqual(self.supabase.tables['resumes'].queries[-1], [('updated_at', '2026-01-02T00:00:00')])
+        self.assertEqual(self.supabase.tables['profiles'].queries[-1], [('updated_at', '2026-01-01T00:00:00')])
+
+        self.supabase.tables['resumes'].rows[0].update(skills=['Python', 'SQL'], updated_at='2026-01-03T00:00:00')
+        resumes = {r['id']: r for r in self.snapshot.get_resumes()}
+        self.assertEqual(resumes['r1']['skills'], ['Python', 'SQL'])
+        self.assertEqual(self.snapshot.version, version + 1)
+        self.snapshot.get_resumes()
+        self.assertEqual(self.supabase.tables['resumes'].queries[-1], [('updated_at', '2026-01-03T00:00:00')])
+
+    def test_failed_load_backs_off(self):
+        failing = mock.Mock(side_effect=RuntimeError("Supabase unavailable"))
+        with mock.patch.object(corpus, 'get_supabase', failing):
+            self.assertEqual(self.snapshot.get_resumes(), [])
+            self.assertEqual(self.snapshot.get_resumes(), [])
+        self.assertEqual(failing.call_count, 1)
+        self.snapshot.invalidate()
+        self.assertEqual(len(self.snapshot.get_resumes()), 2)
+
+
+class ResultCacheTests(FakeCorpusMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def key(self, job_desc="Python developer", **params):
+        return result_cache_key('nlp', job_desc, self.snapshot.version_stamp(), top_n=5, **params)
+
+    def test_key_normalizes_the_request(self):
+        self.assertEqual(self.key("Python   developer\n"), self.key("Python developer"))
+        self.assertNotEqual(self.key(), self.key(shortlist_size=100))
+
+    def test_corpus_changes_invalidate_cached_results(self):
+        key = self.key()
+        cache_result(key, 'nlp', [{'resume': {'id': 'r1'}, 'score': 0.9}])
+        self.assertEqual(get_cached_result(self.key()), (True, [{'resume': {'id': 'r1'}, 'score': 0.9}]))
+
+        # A profile edit changes what the response shows, so it needs a new key too
+        self.supabase.tables['profiles'].rows[1].update(last_name='Turing', updated_at='2026-03-01T00:00:00')
+        profile_key = self.key()
+        self.assertNotEqual(profile_key, key)
+        self.assertEqual(get_cached_result(profile_key), (False, None))
+
+        self.supabase.tables['resumes'].rows.append(
+            {'id': 'r3', 'user_id': 'u1', 'skills': ['SQL'], 'updated_at': '2026-03-02T00:00:00'})
+        self.assertNotIn(self.key(), (key, profile_key))
+
+    def test_empty_results_are_cached_briefly(self):
+        with mock.patch.object(result_cache, 'cache') as backend:
+            cache_result('k', 'nlp', [])
+            cache_result('k', 'hybrid', [{'score': 1}], degraded=True)
+            cache_result('k', 'hybrid', [{'score': 1}])
+        timeouts = [c.args[2] for c in backend.set.call_args_list]
+        self.assertEqual(timeouts, [result_cache.RESULT_CACHE_NEGATIVE_TTL] * 2 + [result_cache.RESULT_CACHE_TTLS['hybrid']])
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def make_cache(self, max_bytes=10 ** 6):
+        return SQLiteCache(self.path, {'OPTIONS': {'MAX_BYTES': max_bytes}})
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = directory + '/cache.sqlite3'
+
+    def test_entries_are_shared_and_expire(self):
+        writer, reader = self.make_cache(), self.make_cache()
+        writer.set('job', {'skills': ['python']}, 60)
+        self.assertTrue(writer.add('other', 1, 60))
+        self.assertFalse(writer.add('other', 2, 60))
+        self.assertEqual(reader.get('job'), {'skills': ['python']})
+        self.assertEqual(reader.get('other'), 1)
+        writer.set('stale', 1, 60)
+        with mock.patch.object(cache_backends.time, 'time', return_value=time.time() + 120):
+            self.assertIsNone(reader.get('stale'))
+            self.assertFalse(reader.has_key('job'))
+
+    def test_prune_evicts_least_recently_used(self):
+        backend = self.make_cache(max_bytes=4000)
+        now = time.time()
+        for n in range(5):
+            with mock.patch.object(cache_backends.time, 'time', return_value=now + n * 100):
+                backend.set(f'k{n}', b'x' * 900, None)
+        # Reading k0 refreshes its access time, so k1 and k2 go first
+        with mock.patch.object(cache_backends.time, 'time', return_value=now + 1000):
+            backend.get('k0')
+        backend.prune()
+        self.assertEqual([backend.has_key(f'k{n}') for n in range(5)], [True, False, False, True, True])
+        self.assertEqual(backend.stats()['evictions'], 2)
+
+    def test_counters_are_shared_by_thread_local_instances(self):
+        def work():
+            backend = self.make_cache()
+            backend.set('a', 1)
+            backend.get('a')
+            backend.get('missing')
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = self.make_cache().stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['sets']), (4, 4, 4))
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+
+class ANNIndexTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        vectors = rng.standard_normal((50, 16)).astype(np.float32)
+        self.resumes = [{'id': f"r{n}", 'embedding': vector} for n, vector in enumerate(vectors)]
+
+    def test_query_add_remove_and_reload(self):
+        index = ResumeANNIndex.build(self.resumes)
+        self.assertEqual(index.query(self.resumes[7]['embedding'], 1), ['r7'])
+
+        # A re-generated embedding replaces the stale vector; unchanged rows are skipped
+        moved = -self.resumes[7]['embedding']
+        index.add([{'id': 'r7', 'embedding': moved}, self.resumes[8]])
+        self.assertEqual(index.query(moved, 1), ['r7'])
+        index.remove(['r3'])
+        self.assertNotIn('r3', index)
+        self.assertNotIn('r3', index.query(self.resumes[3]['embedding'], 5))
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        index.save(directory + '/index.bin')
+        loaded = ResumeANNIndex.load(directory + '/index.bin')
+        self.assertEqual(len(loaded), 49)
+        self.assertEqual(loaded.query(moved, 1), ['r7'])
+        self.assertEqual(loaded._hashes, index._hashes)
+
+    def test_shortlist_keeps_resumes_the_index_does_not_know(self):
+        index = ResumeANNIndex.build(self.resumes[:40])
+        with mock.patch.object(ann_index, 'get_ann_index', lambda: index):
+            shortlist = ann_index.shortlist_resumes(self.resumes, self.resumes[0]['embedding'], k=5)
+        ids = [r['id'] for r in shortlist]
+        self.assertIn('r0', ids)
+        self.assertEqual(len(ids), 15)
+        self.assertTrue(all(f"r{n}" in ids for n in range(40, 50)))
+
+
+class SentenceEncoderLoadingTests(SimpleTestCase):
+    def setUp(self):
+        utils._load_sentence_transformer.cache_clear()
+        self.addCleanup(utils._load_sentence_transformer.cache_clear)
+        self.loaded = []
+        fake_module = mock.Mock(SentenceTransformer=lambda name, device=None: self.loaded.append(name) or mock.Mock())
+        patcher = mock.patch.dict('sys.modules', {'sentence_transformers': fake_module})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @mock.patch.object(utils.settings, 'EMBEDDING_BACKEND', 'torch', create=True)
+    def test_default_and_explicit_backend_share_one_model(self):
+        self.assertIs(utils.get_sentence_transformer(), utils.get_sentence_transformer('torch'))
+        self.assertEqual(self.loaded, [utils.EMBEDDING_MODEL_NAME])
+
+    @mock.patch.object(utils.settings, 'EMBEDDING_BACKEND', 'onnx', create=True)
+    def test_onnx_fallback_reuses_the_torch_model(self):
+        from . import onnx_encoder
+        with mock.patch.object(onnx_encoder, 'OnnxSentenceEncoder', side_effect=FileNotFoundError("no model")) as onnx:
+            model = utils.get_sentence_transformer()
+            self.assertIs(utils.get_sentence_transformer('onnx'), model)
+            self.assertIs(utils.get_sentence_transformer('torch'), model)
+        self.assertEqual(onnx.call_count, 1)
+        self.assertEqual(len(self.loaded), 1)
+
+
+class LLMExecutorTests(SimpleTestCase):
+    def test_concurrent_callers_share_one_pool(self):
+        created = []
+
+        def make_pool(**kwargs):
+            # Widen the window in which an unguarded check could let a second caller in
+            time.sleep(0.01)
+            created.append(kwargs)
+            return mock.Mock()
+
+        barrier = threading.Barrier(8)
+        pools = []
+
+        def get():
+            barrier.wait()
+            pools.append(llm_recommender.get_llm_executor())
+
+        with mock.patch.object(llm_recommender, '_executor', None), \
+                mock.patch.object(llm_recommender, 'ThreadPoolExecutor', side_effect=make_pool):
+            threads = [threading.Thread(target=get) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(created), 1)
+        self.assertEqual(created[0]['max_workers'], llm_recommender.LLM_MAX_CONCURRENCY)
+        self.assertTrue(all(pool is pools[0] for pool in pools))
+
+
+class LLMOnlyCandidateTests(SimpleTestCase):
+    """llm_only requests evaluate only the NLP pre-filtered budget, streamed or not"""
+
+    def setUp(self):
+        self.resumes = [{'id': f"r{n}", 'embedding': [1.0]} for n in range(30)]
+        # NLP prefers later resumes, so the budget is not just the first rows
+        nlp_order = list(reversed(self.resumes))
+        self.evaluated = []
+
+        def recommend_resumes(job_desc, resumes, top_n=5):
+            return [{'resume': dict(r), 'score': 1 - n / 100} for n, r in enumerate(nlp_order[:top_n])]
+
+        def evaluate(job_desc, resume_text, model_name=None):
+            self.evaluated.append(resume_text)
+            return {'score': int(resume_text[1:]), 'reasoning': ''}
+
+        def evaluate_batch(job_desc, resume_texts, model_name=None):
+            return [evaluate(job_desc, text) for text in resume_texts]
+
+        patches = [
+            mock.patch.object(utils, 'recommend_resumes', recommend_resumes),
+            mock.patch.object(llm_recommender, 'format_resume_for_llm', lambda resume, token_budget=None: resume['id']),
+            mock.patch.object(llm_recommender, 'get_llm_evaluation', evaluate),
+            mock.patch.object(llm_recommender, 'get_llm_batch_evaluations', evaluate_batch),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_streaming_llm_only_is_capped(self):
+        events = list(llm_recommender.stream_recommendations(
+            "job", self.resumes, top_n=3, recommendation_type="llm_only", llm_budget=5))
+        shortlist = [e for name, e in events if name == 'shortlist'][0]
+        self.assertEqual([c['resume']['id'] for c in shortlist], ['r29', 'r28', 'r27', 'r26', 'r25'])
+        self.assertEqual(sorted(self.evaluated), ['r25', 'r26', 'r27', 'r28', 'r29'])
+        final = events[-1][1]
+        self.assertEqual([r['resume']['id'] for r in final], ['r29', 'r28', 'r27'])
+
+    def test_llm_only_matches_streaming(self):
+        recommended = llm_recommender.recommend_resumes_llm("job", self.resumes, top_n=3, llm_budget=5)
+        self.assertEqual(len(self.evaluated), 5)
+        self.assertEqual([r['resume']['id'] for r in recommended], ['r29', 'r28', 'r27'])
+        # The original resume dicts are evaluated, not the NLP result copies
+        self.assertIs(recommended[0]['resume'], self.resumes[29])
+
+    def test_budget_covers_top_n(self):
+        llm_recommender.recommend_resumes_llm("job", self.resumes, top_n=8, llm_budget=2)
+        self.assertEqual(len(self.evaluated), 8)
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import RecommendAPI, ProfileAPI, GenerateEmbeddingAPI, LLMRecommendAPI, PDFResumeParseAPI, LandingPageView, TestRecommenderView
+from .views import RecommendAPI, ProfileAPI, GenerateEmbeddingAPI, LLMRecommendAPI, PDFResumeParseAPI, LandingPageView, TestRecommenderView, ReadinessAPI
 from .auth_views import SignUpView, LoginView
 
 urlpatterns = [
@@ -12,4 +12,5 @@ urlpatterns = [
     path('profile/<str:user_id>/', ProfileAPI.as_view(), name='profile-api'),
     path('generate-embedding/', GenerateEmbeddingAPI.as_view(), name='generate-embedding'),
     path('parse-resume/', PDFResumeParseAPI.as_view(), name='parse-resume'),
+    path('health/ready/', ReadinessAPI.as_view(), name='readiness'),
 ]
\ No newline at end of file
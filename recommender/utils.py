@@ -1,17 +1,18 @@
 import json
+import hashlib
+import heapq
 import numpy as np
 import spacy
-from sentence_transformers import SentenceTransformer
 from sklearn.metrics.pairwise import cosine_similarity
 from sklearn.feature_extraction.text import TfidfVectorizer
 from collections import defaultdict
 from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 import time
 import logging
 from django.core.cache import cache
-from multiprocessing import Pool
 from datetime import datetime
-from supabase import create_client
+from .supabase_client import get_supabase
 from django.conf import settings
 import base64
 import re
@@ -20,6 +21,11 @@ from nltk.util import ngrams
 from nltk.corpus import stopwords
 from string import punctuation
 from sklearn.feature_extraction.text import CountVectorizer
+from .scoring import EmbeddingMatrix, get_embedding_matrix, normalize_vector, top_n_indices
+from .ann_index import shortlist_resumes
+from .term_store import get_term_store
+from .parallel import get_sharded_scorer
+from .embedding_codec import decode_embedding, decode_embeddings
 
 # Lazy-load models with simple caching to avoid repeated loading
 _nlp = None
@@ -31,14 +37,89 @@ def get_nlp():
         _nlp = spacy.load("en_core_web_sm")
     return _nlp
 
-@lru_cache(maxsize=1)
-def get_sentence_transformer():
-    """Instantiate SentenceTransformer once per process."""
-    model = SentenceTransformer("all-MiniLM-L6-v2", device="cpu")
+# Batch size and worker processes for corpus-level spaCy passes (nlp.pipe)
+SPACY_BATCH_SIZE = getattr(settings, 'SPACY_BATCH_SIZE', 256)
+SPACY_N_PROCESS = getattr(settings, 'SPACY_N_PROCESS', 1)
+REQUIREMENTS_CACHE_SECONDS = getattr(settings, 'REQUIREMENTS_CACHE_SECONDS', 24 * 3600)
+EMBEDDING_CACHE_SECONDS = getattr(settings, 'EMBEDDING_CACHE_SECONDS', 7 * 24 * 3600)
+
+def tokenize_texts(texts, n_process=None):
+    """
+    Tokenize many texts in one nlp.pipe pass with every pipeline component
+    disabled: stop words, punctuation and alphabetic checks are lexical
+    attributes, so the tagger, parser and NER aren't needed for them.
+    """
+    nlp = get_nlp()
+    n_process = n_process or SPACY_N_PROCESS
+    if n_process > 1 and len(texts) < SPACY_BATCH_SIZE * n_process:
+        # Not worth starting worker processes
+        n_process = 1
+    return nlp.pipe(texts, batch_size=SPACY_BATCH_SIZE, n_process=n_process, disable=nlp.pipe_names)
+
+# Base model of the sentence encoder; stored embeddings from other models are skipped
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+
+def get_sentence_transformer(backend=None):
+    """
+    Instantiate the sentence encoder once per process: PyTorch
+    SentenceTransformer, or the int8 ONNX model when EMBEDDING_BACKEND
+    (or backend) is 'onnx'. Falls back to PyTorch if the ONNX model can't load.
+    """
+    # Cache on the resolved backend, so the default and an explicit name share one model
+    return _load_sentence_transformer(backend or getattr(settings, 'EMBEDDING_BACKEND', 'torch'))
+
+@lru_cache(maxsize=None)
+def _load_sentence_transformer(backend):
+    if backend == 'onnx':
+        try:
+            from .onnx_encoder import OnnxSentenceEncoder
+            model = OnnxSentenceEncoder()
+            model.max_seq_length = 128
+            return model
+        except Exception as e:
+            logger.error(f"Could not load ONNX sentence encoder, using PyTorch: {str(e)}")
+            return _load_sentence_transformer('torch')
+    
+    # Imported here so ONNX workers never load torch
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(EMBEDDING_MODEL_NAME, device="cpu")
     # Reduce memory usage
     model.max_seq_length = 128
     return model
 
+def embedding_model_id():
+    """
+    Model id recorded in stored embeddings (see embedding_codec), taken from
+    the encoder that actually loaded, so a fallback to PyTorch is recorded as such
+    """
+    return getattr(get_sentence_transformer(), 'model_id', EMBEDDING_MODEL_NAME)
+
+def cached_value(key, compute, timeout):
+    """Return the host-shared cache entry for key, computing and storing it on a miss"""
+    try:
+        value = cache.get(key)
+    except Exception as e:
+        logger.warning(f"Error reading cache: {str(e)}")
+        value = None
+    if value is None:
+        value = compute()
+        try:
+            cache.set(key, value, timeout)
+        except Exception as e:
+            logger.warning(f"Error writing cache: {str(e)}")
+    return value
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def get_job_embedding(text):
+    """Sentence embedding of a job description, shared across workers through the cache"""
+    return cached_value(
+        f"job_embedding:v1:{embedding_model_id()}:{text_hash(text)}",
+        lambda: get_sentence_transformer().encode(text),
+        EMBEDDING_CACHE_SECONDS
+    )
+
 # Configuration - Adjust these weights based on importance
 WEIGHTS = {
     'similarity': 0.40,  # Increased weight for semantic similarity
@@ -49,15 +130,46 @@ WEIGHTS = {
     'certifications': 0.05
 }
 
-logger = logging.getLogger(__name__)
+# Education levels and their numeric values
+EDUCATION_LEVELS = {
+    'none': 0,
+    'high school': 1,
+    'associate': 2, 
+    'diploma': 2,
+    'bachelors': 3,
+    'masters': 4,
+    'phd': 5,
+    'doctorate': 5
+}
 
-# Initialize Supabase client
-supabase = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+logger = logging.getLogger(__name__)
 
-__all__ = ['load_resumes', 'enhance_resume_embedding', 'recommend_resumes']
+__all__ = ['load_resumes', 'prepare_resume', 'prepare_resumes', 'enhance_resume_embedding', 'enhance_resume_embeddings', 'recommend_resumes', 'recommend_resumes_streaming']
 
 def enhance_resume_embedding(resume):
     """Generate embedding text with contextual emphasis"""
+    return enhance_resume_embeddings([resume])[0]
+
+def enhance_resume_embeddings(resumes, n_process=None):
+    """
+    Embedding text for many resumes, with the experience descriptions of all
+    of them streamed through a single batched spaCy pass.
+    """
+    descriptions = []
+    for resume in resumes:
+        for exp in resume.get('experience', []):
+            if exp.get('description', ''):
+                descriptions.append(exp['description'])
+    
+    # Extract meaningful keywords from descriptions
+    keywords = iter([
+        [token.text for token in doc if not token.is_stop and token.is_alpha and len(token.text) > 2][:5]  # limit to top 5 keywords
+        for doc in tokenize_texts(descriptions, n_process)
+    ])
+    return [_embedding_text(resume, keywords) for resume in resumes]
+
+def _embedding_text(resume, keywords):
+    """Embedding text for one resume, taking its description keywords in order from the keywords iterator"""
     sections = []
     
     # Education with institution context
@@ -76,16 +188,11 @@ def enhance_resume_embedding(resume):
         position = exp.get('position', '')
         description = exp.get('description', '')
         
-        # Extract meaningful keywords from description
-        keywords = []
-        if description:
-            doc = get_nlp()(description)
-            keywords = [token.text for token in doc if not token.is_stop and token.is_alpha and len(token.text) > 2]
-            keywords = keywords[:5]  # limit to top 5 keywords
+        description_keywords = next(keywords) if description else []
         
         experience_entry = f"Worked as {position} at {company}"
-        if keywords:
-            experience_entry += f" with focus on {', '.join(keywords)}"
+        if description_keywords:
+            experience_entry += f" with focus on {', '.join(description_keywords)}"
         experience.append(experience_entry)
     
     if experience:
@@ -107,80 +214,154 @@ def enhance_resume_embedding(resume):
     logger.debug(f"Enhanced embedding text: {embedding_text[:500]}...")
     return embedding_text
 
+def attach_profile(resume, profile):
+    """Copy display fields from a profile row onto a resume"""
+    if profile:
+        first_name = profile.get('first_name', '').strip()
+        last_name = profile.get('last_name', '').strip() 
+        if first_name or last_name:
+            resume['name'] = f"{first_name} {last_name}".strip()
+        else:
+            resume['name'] = f"Candidate {resume.get('user_id', 'Unknown')[:8]}"
+        resume['email'] = profile.get('email', '')
+        resume['phone'] = profile.get('phone', '')
+        resume['address'] = profile.get('address', '')
+    else:
+        resume['name'] = f"Candidate {resume.get('user_id', 'Unknown')[:8]}"
+    return resume
+
+def prepare_resume(resume, profile=None, with_embedding_text=True):
+    """Join a raw resume row with its profile, decode its embedding and build embedding text"""
+    attach_profile(resume, profile)
+        
+    # Ensure there's always some content in the key fields
+    if not resume.get('experience') or not isinstance(resume.get('experience'), list) or len(resume.get('experience', [])) == 0:
+        resume['experience'] = [{
+            'position': 'Unspecified Position',
+            'company': 'No company information available',
+            'description': ''
+        }]
+        
+    if not resume.get('education') or not isinstance(resume.get('education'), list) or len(resume.get('education', [])) == 0:
+        resume['education'] = [{
+            'degree': 'Unspecified Degree',
+            'institution': 'No institution information available'
+        }]
+    
+    # Ensure skills and other arrays exist
+    if not resume.get('skills') or not isinstance(resume.get('skills'), list):
+        resume['skills'] = []
+        
+    if not resume.get('certifications') or not isinstance(resume.get('certifications'), list):
+        resume['certifications'] = []
+        
+    if not resume.get('languages') or not isinstance(resume.get('languages'), list):
+        resume['languages'] = []
+
+    # Decode the stored embedding (unless decode_resume_embeddings already did)
+    if isinstance(resume.get('embedding'), str):
+        resume['embedding'] = decode_embedding(resume['embedding'], model=EMBEDDING_MODEL_NAME) if resume['embedding'] else None
+
+    # Convert education to list if it's a single object
+    if 'education' in resume and isinstance(resume['education'], dict):
+        resume['education'] = [resume['education']]
+    # Add empty array if education is missing
+    if 'education' not in resume:
+        resume['education'] = []
+
+    # Add embedding text and job-independent scoring features
+    if with_embedding_text:
+        resume['embedding_text'] = enhance_resume_embedding(resume)
+    resume['features'] = compute_resume_features(resume)
+    return resume
+
+def prepare_resumes(resumes, get_profile=lambda resume: None, with_embedding_text=True):
+    """
+    Batch version of prepare_resume: the embedding text of every resume comes
+    from one batched spaCy pass. Resumes that fail to prepare are logged and
+    left out.
+    """
+    prepared = []
+    for resume in resumes:
+        try:
+            prepared.append(prepare_resume(resume, get_profile(resume), with_embedding_text=False))
+        except Exception as e:
+            logger.error(f"Error preparing resume {resume.get('id')}: {str(e)}")
+    if with_embedding_text:
+        for resume, embedding_text in zip(prepared, enhance_resume_embeddings(prepared)):
+            resume['embedding_text'] = embedding_text
+    return prepared
+
+def compute_resume_features(resume):
+    """
+    Job-independent features read by the scorer, computed once at ingest so
+    that scoring doesn't re-parse dates, degrees and language entries.
+    """
+    education_level = get_highest_education(resume.get('education', []))
+    languages = []
+    for item in resume.get('languages', []):
+        if isinstance(item, str):
+            languages.append(item)
+        elif isinstance(item, dict):
+            name = item.get('name') or ''
+            if name:
+                languages.append(name)
+    return {
+        'experience_years': calculate_total_experience(resume.get('experience', [])),
+        'education_level': education_level,
+        'education_rank': EDUCATION_LEVELS.get(education_level, 0),
+        'languages': languages,
+        'languages_lower': [lang.strip().lower() for lang in languages],
+        'skills_lower': [s.lower() for s in resume.get('skills', []) if isinstance(s, str)]
+    }
+
+def decode_resume_embeddings(resumes):
+    """Decode the stored embeddings of freshly fetched resumes in bulk, in place (other models' become None)"""
+    encoded = [i for i, r in enumerate(resumes) if isinstance(r.get('embedding'), str)]
+    values = [resumes[i]['embedding'] for i in encoded]
+    for i, embedding in zip(encoded, decode_embeddings(values, model=EMBEDDING_MODEL_NAME)):
+        resumes[i]['embedding'] = embedding
+    return resumes
+
+def fetch_concurrently(*queries):
+    """Execute independent Supabase queries in parallel; returns the rows of each, in order"""
+    with ThreadPoolExecutor(max_workers=len(queries), thread_name_prefix="supabase-fetch") as pool:
+        futures = [pool.submit(query.execute) for query in queries]
+        return [future.result().data for future in futures]
+
 def load_resumes():
     """Load resumes from Supabase with enhanced embedding text"""
     try:
-        # Fetch resumes
-        resumes_response = supabase.table('resumes').select('*').execute()
-        resumes = resumes_response.data
-
-        # Fetch profiles
-        profiles_response = supabase.table('profiles').select('*').execute()
-        profiles = profiles_response.data
-
-        # Join resumes with profiles and ensure all resumes have basic info
-        for resume in resumes:
-            # Find matching profile
-            profile = next((p for p in profiles if p['id'] == resume.get('user_id')), None)
-            
-            # Add profile data
-            if profile:
-                first_name = profile.get('first_name', '').strip()
-                last_name = profile.get('last_name', '').strip() 
-                if first_name or last_name:
-                    resume['name'] = f"{first_name} {last_name}".strip()
-                else:
-                    resume['name'] = f"Candidate {resume.get('user_id', 'Unknown')[:8]}"
-                resume['email'] = profile.get('email', '')
-                resume['phone'] = profile.get('phone', '')
-                resume['address'] = profile.get('address', '')
-            else:
-                resume['name'] = f"Candidate {resume.get('user_id', 'Unknown')[:8]}"
-                
-            # Ensure there's always some content in the key fields
-            if not resume.get('experience') or not isinstance(resume.get('experience'), list) or len(resume.get('experience', [])) == 0:
-                resume['experience'] = [{
-                    'position': 'Unspecified Position',
-                    'company': 'No company information available',
-                    'description': ''
-                }]
-                
-            if not resume.get('education') or not isinstance(resume.get('education'), list) or len(resume.get('education', [])) == 0:
-                resume['education'] = [{
-                    'degree': 'Unspecified Degree',
-                    'institution': 'No institution information available'
-                }]
-            
-            # Ensure skills and other arrays exist
-            if not resume.get('skills') or not isinstance(resume.get('skills'), list):
-                resume['skills'] = []
-                
-            if not resume.get('certifications') or not isinstance(resume.get('certifications'), list):
-                resume['certifications'] = []
-                
-            if not resume.get('languages') or not isinstance(resume.get('languages'), list):
-                resume['languages'] = []
-                
+        stage_timings = {}
+        stage_start = time.time()
 
-        # Decode Base64 embeddings
-        for resume in resumes:
-            if resume.get('embedding'):
-                embedding_bytes = base64.b64decode(resume['embedding'])
-                resume['embedding'] = np.frombuffer(embedding_bytes, dtype='float32')
-
-        # Ensure education is properly formatted
-        for resume in resumes:
-            # Convert education to list if it's a single object
-            if 'education' in resume and isinstance(resume['education'], dict):
-                resume['education'] = [resume['education']]
-            # Add empty array if education is missing
-            if 'education' not in resume:
-                resume['education'] = []
-
-        # Add embedding text to resumes
-        for resume in resumes:
-            resume['embedding_text'] = enhance_resume_embedding(resume)
-            
+        # Fetch resumes and profiles at the same time
+        resumes, profiles = fetch_concurrently(
+            get_supabase().table('resumes').select('*'),
+            get_supabase().table('profiles').select('*')
+        )
+        stage_timings['fetch'] = time.time() - stage_start
+
+        stage_start = time.time()
+        resumes = decode_resume_embeddings(resumes)
+        stage_timings['decode'] = time.time() - stage_start
+
+        # Hash join: index profiles by id once instead of scanning them per resume
+        stage_start = time.time()
+        profiles_by_id = {p['id']: p for p in profiles}
+        stage_timings['join'] = time.time() - stage_start
+
+        # Attach profiles and ensure all resumes have basic info
+        stage_start = time.time()
+        resumes = prepare_resumes(resumes, lambda resume: profiles_by_id.get(resume.get('user_id')))
+        stage_timings['prepare'] = time.time() - stage_start
+
+        logger.info({
+            'event': 'load_resumes',
+            'resumes': len(resumes),
+            'profiles': len(profiles),
+            'stage_timings': {stage: round(seconds, 3) for stage, seconds in stage_timings.items()}
+        })
         logger.debug(f"Loaded Resumes: {resumes[:1]}")  # Log first resume
         return resumes
     except Exception as e:
@@ -188,6 +369,14 @@ def load_resumes():
         return []
 
 def extract_keywords_and_requirements(text):
+    """Job requirements for text, shared across workers through the cache"""
+    return cached_value(
+        f"requirements:v1:{text_hash(text)}",
+        lambda: _extract_keywords_and_requirements(text),
+        REQUIREMENTS_CACHE_SECONDS
+    )
+
+def _extract_keywords_and_requirements(text):
     """Extract job requirements using advanced NLP techniques without domain-specific hardcoding"""
     
     # 1. Use NLP to find requirements based on linguistic patterns
@@ -201,18 +390,22 @@ def extract_keywords_and_requirements(text):
     skills = []
     
     # Extract based on skill indicators
+    fragments = []
     for indicator in skill_indicators:
         idx = text.lower().find(indicator)
         if idx >= 0:
             # Extract a meaningful chunk following the indicator
             end_idx = min(idx + len(indicator) + 100, len(text))
-            fragment = text[idx + len(indicator):end_idx]
-            fragment_doc = get_nlp(fragment)
-            
-            # Get noun phrases (more meaningful than single nouns)
-            for chunk in fragment_doc.noun_chunks:
-                if len(chunk.text) > 2:
-                    skills.append(chunk.text.strip())
+            fragments.append(text[idx + len(indicator):end_idx])
+    
+    # Noun chunks only need the tagger and parser
+    nlp = get_nlp()
+    unneeded = [name for name in ('ner', 'lemmatizer') if name in nlp.pipe_names]
+    for fragment_doc in nlp.pipe(fragments, disable=unneeded):
+        # Get noun phrases (more meaningful than single nouns)
+        for chunk in fragment_doc.noun_chunks:
+            if len(chunk.text) > 2:
+                skills.append(chunk.text.strip())
     
     # 2. Extract years of experience using regex
     experience_pattern = r'(\d+)[\+]?\s+years?(?:\s+of)?(?:\s+experience)?'
@@ -316,33 +509,74 @@ def extract_keywords_and_requirements(text):
     
     return requirements
 
-def get_skill_similarity(resume_skills, job_skills):
+class JobContext:
+    """
+    Job-side features computed once per request and shared by every scoring
+    component: requirements, the job embedding, job skill embeddings and the
+    lowercased/tokenized forms used for direct matching.
+    """
+
+    def __init__(self, job_desc):
+        self.job_desc = job_desc
+        self.requirements = extract_keywords_and_requirements(job_desc)
+
+        self.embedding = get_job_embedding(job_desc)
+        self.unit_embedding = normalize_vector(self.embedding)
+
+        self.skills = self.requirements['skills']
+        self.skills_lower = [js.lower() for js in self.skills]
+        self.skill_words = [set(js.split()) for js in self.skills_lower]
+        self.skill_vectors = None
+        if self.skills:
+            try:
+                self.skill_vectors = get_term_store().get_query_vectors(self.skills)
+            except Exception as e:
+                logger.warning(f"Error embedding job skills: {e}")
+
+        self.years_experience = self.requirements['years_experience']
+        self.education_level = self.requirements['education_level']
+        self.education_mentioned = self.requirements.get('education_mentioned', False)
+        self.languages = self.requirements.get('languages', []) or []
+        self.languages_lower = [j.strip().lower() for j in self.languages]
+        self.certifications = self.requirements.get('certifications', []) or []
+        self.certifications_lower = [j.lower() for j in self.certifications]
+
+def get_skill_similarity(resume_skills, job_skills, job_context=None, resume_skills_lower=None):
     """Calculate skill similarity using semantic embeddings and direct matching"""
     if not resume_skills or not job_skills:
         return 0.0
     
+    if job_context is not None:
+        job_skills_lower = job_context.skills_lower
+        job_skill_words = job_context.skill_words
+    else:
+        job_skills_lower = [js.lower() for js in job_skills]
+        job_skill_words = [set(js.split()) for js in job_skills_lower]
+    if resume_skills_lower is None:
+        resume_skills_lower = [rs.lower() for rs in resume_skills]
+    
     # Direct matches (case-insensitive)
     direct_matches = 0
-    matched_resume_skills = []
+    matched_resume_skills = set()
+    matched_lower = []
     
-    for js in job_skills:
+    for js, js_words in zip(job_skills_lower, job_skill_words):
         best_match = None
         best_score = 0
         
-        for rs in resume_skills:
+        for rs, rs_lower in zip(resume_skills, resume_skills_lower):
             # Skip if this resume skill already matched with a job skill
             if rs in matched_resume_skills:
                 continue
                 
             # Exact match or substring match
-            if js.lower() == rs.lower():
+            if js == rs_lower:
                 score = 1.0
-            elif js.lower() in rs.lower() or rs.lower() in js.lower():
+            elif js in rs_lower or rs_lower in js:
                 score = 0.8
             else:
                 # Check for word-level overlap
-                js_words = set(js.lower().split())
-                rs_words = set(rs.lower().split())
+                rs_words = set(rs_lower.split())
                 if js_words & rs_words:  # If there's an intersection
                     score = len(js_words & rs_words) / len(js_words)
                 else:
@@ -354,23 +588,27 @@ def get_skill_similarity(resume_skills, job_skills):
         
         if best_match and best_score > 0.5:  # Only consider good enough matches
             direct_matches += best_score
-            matched_resume_skills.append(best_match)
+            matched_resume_skills.add(best_match)
+            matched_lower.append(best_match.lower())
     
     # Semantic similarity for unmatched skills
     semantic_score = 0
     remaining_resume_skills = [rs for rs in resume_skills if rs not in matched_resume_skills]
-    remaining_job_skills = [js for js in job_skills if not any(js.lower() in rs.lower() or rs.lower() in js.lower() for rs in matched_resume_skills)]
+    remaining_job_idx = [i for i, js in enumerate(job_skills_lower) if not any(js in rs or rs in js for rs in matched_lower)]
     
     # Only calculate semantic score if there are remaining skills and direct matches are not satisfactory
-    if remaining_resume_skills and remaining_job_skills and direct_matches < len(job_skills) * 0.7:
+    if remaining_resume_skills and remaining_job_idx and direct_matches < len(job_skills) * 0.7:
         try:
-            # Use sentence transformer for semantic matching
-            model = get_sentence_transformer()
-            resume_embeddings = model.encode(remaining_resume_skills)
-            job_embeddings = model.encode(remaining_job_skills)
+            # Look up normalized skill embeddings (encoded once per term, not per resume)
+            store = get_term_store()
+            resume_embeddings = store.get_vectors(remaining_resume_skills)
+            if job_context is not None and job_context.skill_vectors is not None:
+                job_embeddings = job_context.skill_vectors[remaining_job_idx]
+            else:
+                job_embeddings = store.get_query_vectors([job_skills[i] for i in remaining_job_idx])
             
-            # Calculate similarity matrix
-            sim_matrix = cosine_similarity(resume_embeddings, job_embeddings)
+            # Cosine similarity matrix is a plain product of unit vectors
+            sim_matrix = resume_embeddings @ job_embeddings.T
             
             # For each job skill, find best matching resume skill
             best_matches = np.max(sim_matrix, axis=0)
@@ -386,7 +624,7 @@ def get_skill_similarity(resume_skills, job_skills):
     
     return min(1.0, combined_score)
 
-def get_certification_score(resume_certs, job_description, job_certs=None):
+def get_certification_score(resume_certs, job_description, job_certs=None, job_context=None):
     """Calculate certification relevance score without relying on domain detection"""
     if not resume_certs:
         return 0.0, []
@@ -399,10 +637,11 @@ def get_certification_score(resume_certs, job_description, job_certs=None):
     # If job specifies certifications, do direct matching
     match_reasons = []
     if job_certs:
+        job_certs_lower = job_context.certifications_lower if job_context is not None else [j.lower() for j in job_certs]
         cert_matches = []
         for r_cert in resume_certs:
-            for j_cert in job_certs:
-                if r_cert.lower() == j_cert.lower():
+            for j_cert in job_certs_lower:
+                if r_cert.lower() == j_cert:
                     cert_matches.append(r_cert)
                     match_reasons.append(f"Has required certification: {r_cert}")
                     break
@@ -412,12 +651,14 @@ def get_certification_score(resume_certs, job_description, job_certs=None):
     
     # If no direct matches or no job certs specified, evaluate relevance using semantic similarity
     try:
-        model = get_sentence_transformer()
-        cert_embeddings = model.encode(resume_certs)
-        job_embedding = model.encode([job_description])
+        cert_embeddings = get_term_store().get_vectors(resume_certs)
+        if job_context is not None:
+            job_embedding = job_context.unit_embedding
+        else:
+            job_embedding = normalize_vector(get_job_embedding(job_description))
         
         # Calculate similarity between each cert and the job
-        similarities = cosine_similarity(cert_embeddings, job_embedding)
+        similarities = (cert_embeddings @ job_embedding).reshape(-1, 1)
         
         # Get best matching certs (above threshold)
         relevant_certs = []
@@ -435,133 +676,260 @@ def get_certification_score(resume_certs, job_description, job_certs=None):
     # Give minimal credit just for having certifications
     return min(0.3, 0.1 * len(resume_certs)), []
 
-def recommend_resumes(job_desc, resumes, top_n=5):
-    """Match resumes to job description using NLP and provide match reasons"""
+def vector_component_scores(job_context, experience_years, education_rank):
+    """Experience and education scores for every candidate from the precomputed feature columns"""
+    req_years = job_context.years_experience
+    # Experience is capped at 1.5x when a requirement is set, 1.0 otherwise
+    experience_scores = np.minimum(experience_years / max(1, req_years), 1.5 if req_years > 0 else 1.0)
+    required_rank = EDUCATION_LEVELS.get(job_context.education_level.lower(), 0)
+    if required_rank == 0:
+        education_scores = np.ones(len(education_rank), dtype=np.float32)
+    else:
+        education_scores = np.minimum(education_rank / required_rank, 1.0)
+    return experience_scores, education_scores
+
+def scoring_inputs(resume):
+    """The subset of a prepared resume that score_candidate reads"""
+    # Snapshot rows read theirs from the snapshot's columns instead of parsing the record
+    snapshot = getattr(resume, 'snapshot', None)
+    if snapshot is not None and snapshot.candidates is not None:
+        return snapshot.candidates[resume.row]
+    features = resume.get('features') or compute_resume_features(resume)
+    skills = resume.get('skills', [])
+    skills_lower = features['skills_lower']
+    return {
+        'skills': skills,
+        'skills_lower': skills_lower if len(skills_lower) == len(skills) else None,
+        'education': resume.get('education', [])[:1],
+        'certifications': resume.get('certifications', []),
+        'languages': features['languages'],
+        'languages_lower': features['languages_lower']
+    }
+
+def score_candidate(candidate, job_context, similarity, experience_score, education_score, experience_years):
+    """
+    Combine the per-candidate score components. Vectorized components are
+    passed in; skills, certifications and languages are scored here.
+    Returns (final_score, score_components, match_reasons).
+    """
+    match_reasons = []
+    score_components = {}
+    
+    # 1. Semantic similarity score
+    score_components['similarity'] = float(similarity)
+    
+    # 2. Calculate skill match score
+    resume_skills = candidate['skills']
+    resume_skills_lower = candidate['skills_lower']
+    skill_match_score = get_skill_similarity(resume_skills, job_context.skills, job_context, resume_skills_lower)
+    score_components['skill_match'] = skill_match_score
+    
+    # Only include specific skill matches in reasons, not the raw score
+    for rs, rs_lower in zip(resume_skills, resume_skills_lower or [rs.lower() for rs in resume_skills]):
+        for js in job_context.skills_lower:
+            if js in rs_lower or rs_lower in js:
+                match_reasons.append(f"Has required skill: {rs}")
+                break
+    
+    # 3. Experience score
+    req_years = job_context.years_experience
+    years = float(experience_years)
+    if req_years > 0 and years >= req_years:
+        match_reasons.append(f"Has {int(years)} years of experience (required: {req_years})")
+    score_components['experience'] = float(experience_score)
+    
+    # 4. Education score
+    edu_score = float(education_score)
+    score_components['education'] = edu_score
+    
+    # Only add education as a match reason if education was explicitly mentioned
+    if job_context.education_mentioned and edu_score > 0.7:
+        for edu in candidate['education']:
+            degree = edu.get('degree', 'degree')
+            institution = edu.get('institution', 'institution')
+            match_reasons.append(f"Has {degree} from {institution}")
+            break
+    
+    # 5. Calculate certification score
+    cert_score_tuple = get_certification_score(candidate['certifications'], job_context.job_desc, job_context.certifications, job_context)
+    
+    # Handle the tuple return value correctly
+    if isinstance(cert_score_tuple, tuple):
+        cert_score, cert_reasons = cert_score_tuple
+        match_reasons.extend(cert_reasons)
+    else:
+        # Handle the case where a float was returned (backward compatibility)
+        cert_score = cert_score_tuple
+        
+    score_components['certifications'] = cert_score
+    
+    # 6. Calculate language score (handles objects with name/fluency)
+    language_score = 0.0
+    resume_langs = candidate['languages']
+    job_langs = job_context.languages_lower
+    if resume_langs and job_langs:
+        matches = []
+        for r, r_lower in zip(resume_langs, candidate['languages_lower']):
+            for j in job_langs:
+                if r_lower == j:
+                    matches.append(r)
+                    match_reasons.append(f"Speaks required language: {r}")
+                    break
+        language_score = len(matches) / len(job_langs)
+    score_components['languages'] = language_score
+    
+    # Calculate final score with weights
+    final_score = sum(WEIGHTS[component] * score for component, score in score_components.items())
+    return final_score, score_components, match_reasons
+
+def score_embedding_matrix(embedding_matrix, resumes, job_context, rows=None):
+    """
+    Score the rows of an EmbeddingMatrix over resumes (all of them, or only
+    the given rows): [(row, final_score, score_components, match_reasons)]
+    """
+    features = embedding_matrix.features
+    if rows is None:
+        rows = range(len(embedding_matrix))
+        similarities = embedding_matrix.similarities(job_context.embedding)
+        years, education_rank = features.experience_years, features.education_rank
+    else:
+        rows = np.asarray(rows, dtype=np.int64)
+        similarities = embedding_matrix.matrix[rows] @ job_context.unit_embedding
+        years, education_rank = features.experience_years[rows], features.education_rank[rows]
+    
+    # Experience and education scores for all candidates from precomputed columns
+    experience_scores, education_scores = vector_component_scores(job_context, years, education_rank)
+    
+    # Process each resume using optimized scoring
+    candidates = []
+    for offset, row in enumerate(rows):
+        resume = resumes[embedding_matrix.rows[row]]
+        try:
+            final_score, score_components, match_reasons = score_candidate(
+                scoring_inputs(resume),
+                job_context,
+                similarities[offset],
+                experience_scores[offset],
+                education_scores[offset],
+                years[offset]
+            )
+            candidates.append((int(row), final_score, score_components, match_reasons))
+        except Exception as e:
+            logger.error(f"Error scoring resume {resume.get('id')}: {str(e)}")
+    return candidates
+
+def recommend_resumes(job_desc, resumes, top_n=5, shortlist_size=None, search_ef=None):
+    """
+    Match resumes to job description using NLP and provide match reasons.
+    When an ANN index is available only the shortlist_size nearest resumes get
+    the full score; search_ef raises recall at the cost of query latency.
+    """
     try:
         start_time = time.time()
         
-        # Extract requirements from job description
-        job_requirements = extract_keywords_and_requirements(job_desc)
+        # Extract requirements and embed the job once for all candidates
+        job_context = JobContext(job_desc)
+        job_requirements = job_context.requirements
         logger.info(f"Extracted requirements: {job_requirements}")
+        job_embedding = job_context.embedding
         
-        # Generate job description embedding for semantic matching
-        job_embedding = get_sentence_transformer().encode(job_desc)
-        
-        # Process resumes in parallel
+        # Semantic similarity for every candidate in one matrix-vector product
         resumes_to_process = [r for r in resumes if r.get('embedding') is not None and np.size(r['embedding']) > 0]
-        scores = []
         
-        # Process each resume using optimized scoring
+        # Resumes that didn't come through prepare_resume get their features now
         for resume in resumes_to_process:
+            if 'features' not in resume:
+                resume['features'] = compute_resume_features(resume)
+        
+        embedding_matrix = get_embedding_matrix(resumes_to_process)
+        if embedding_matrix.dim != np.size(job_embedding):
+            logger.error(f"Resume embeddings are {embedding_matrix.dim}-dimensional but job embedding is {np.size(job_embedding)}-dimensional")
+            return []
+        
+        # First stage: shortlist nearest candidates before the expensive components run.
+        # Shortlisted rows are scored in place, so the corpus matrix is reused across requests
+        rows = None
+        shortlisted = shortlist_resumes(resumes_to_process, job_embedding, k=shortlist_size, ef=search_ef)
+        if len(shortlisted) < len(resumes_to_process):
+            logger.info(f"ANN shortlist kept {len(shortlisted)} of {len(resumes_to_process)} resumes")
+            kept = {id(r) for r in shortlisted}
+            rows = [row for row, i in enumerate(embedding_matrix.rows) if id(resumes_to_process[i]) in kept]
+        
+        # Large candidate sets are sharded across the scoring pool when enabled
+        ranked = None
+        scorer = get_sharded_scorer(len(embedding_matrix) if rows is None else len(rows))
+        if scorer is not None:
             try:
-                match_reasons = []
-                score_components = {}
-                
-                # 1. Calculate semantic similarity score
-                resume_embedding = np.array(resume['embedding'])
-                semantic_score = cosine_similarity([job_embedding], [resume_embedding])[0][0]
-                score_components['similarity'] = semantic_score
-                
-                # 2. Calculate skill match score
-                resume_skills = resume.get('skills', [])
-                skill_match_score = get_skill_similarity(resume_skills, job_requirements['skills'])
-                score_components['skill_match'] = skill_match_score
-                
-                # Only include specific skill matches in reasons, not the raw score
-                for rs in resume_skills:
-                    for js in job_requirements['skills']:
-                        if js.lower() in rs.lower() or rs.lower() in js.lower():
-                            match_reasons.append(f"Has required skill: {rs}")
-                            break
-                
-                # 3. Calculate experience score
-                req_years = job_requirements['years_experience']
-                candidate_years = calculate_total_experience(resume.get('experience', []))
-                
-                if req_years > 0 and candidate_years >= req_years:
-                    match_reasons.append(f"Has {int(candidate_years)} years of experience (required: {req_years})")
-                    experience_score = min(candidate_years / req_years, 1.5)  # Cap at 1.5x
-                else:
-                    experience_score = min(candidate_years / max(1, req_years), 1.0)
-                
-                score_components['experience'] = experience_score
-                
-                # 4. Calculate education score
-                candidate_education = get_highest_education(resume.get('education', []))
-                edu_score = calculate_education_score(candidate_education, job_requirements['education_level'])
-                score_components['education'] = edu_score
-                
-                # Only add education as a match reason if education was explicitly mentioned
-                if job_requirements.get('education_mentioned', False) and edu_score > 0.7:
-                    for edu in resume.get('education', []):
-                        degree = edu.get('degree', 'degree')
-                        institution = edu.get('institution', 'institution')
-                        match_reasons.append(f"Has {degree} from {institution}")
-                        break
-                
-                # 5. Calculate certification score
-                resume_certs = resume.get('certifications', [])
-                job_certs = job_requirements.get('certifications', [])
-                cert_score_tuple = get_certification_score(resume_certs, job_desc, job_certs)
-                
-                # Handle the tuple return value correctly
-                if isinstance(cert_score_tuple, tuple):
-                    cert_score, cert_reasons = cert_score_tuple
-                    match_reasons.extend(cert_reasons)
-                else:
-                    # Handle the case where a float was returned (backward compatibility)
-                    cert_score = cert_score_tuple
-                    
-                score_components['certifications'] = cert_score
-                
-                # 6. Calculate language score (handles objects with name/fluency)
-                language_score = 0.0
-                raw_langs = resume.get('languages', [])
-                resume_langs = []
-                for item in raw_langs:
-                    if isinstance(item, str):
-                        resume_langs.append(item)
-                    elif isinstance(item, dict):
-                        name = item.get('name') or ''
-                        if name:
-                            resume_langs.append(name)
-                job_langs = job_requirements.get('languages', []) or []
-                if resume_langs and job_langs:
-                    matches = []
-                    for r in resume_langs:
-                        for j in job_langs:
-                            if r.strip().lower() == j.strip().lower():
-                                matches.append(r)
-                                match_reasons.append(f"Speaks required language: {r}")
-                                break
-                    language_score = len(matches) / len(job_langs)
-                score_components['languages'] = language_score
-                
-                # Calculate final score with weights
-                final_score = sum(WEIGHTS[component] * score for component, score in score_components.items())
-                
-                # Add match reasons and score to resume
-                resume_with_reasons = resume.copy()
-                resume_with_reasons['match_reasons'] = match_reasons
-                resume_with_reasons['score'] = float(final_score)
-                resume_with_reasons['score_components'] = score_components  # Add component scores for transparency
-                
-                scores.append((resume_with_reasons, final_score))
-                
+                ranked = scorer.score(embedding_matrix, resumes_to_process, job_context, int(top_n), rows=rows)
             except Exception as e:
-                logger.error(f"Error scoring resume {resume.get('id')}: {str(e)}")
+                logger.error(f"Sharded scoring failed, scoring in-process: {str(e)}")
         
-        # Sort by score and return top N
-        scores.sort(key=lambda x: x[1], reverse=True)
+        if ranked is None:
+            candidates = score_embedding_matrix(embedding_matrix, resumes_to_process, job_context, rows=rows)
+            
+            # Select top N without sorting the whole candidate list
+            top = top_n_indices(np.array([c[1] for c in candidates], dtype=np.float64), int(top_n))
+            ranked = [candidates[i] for i in top]
+        
+        recommendations = []
+        for row, final_score, score_components, match_reasons in ranked:
+            # Add match reasons and score to resume
+            resume_with_reasons = resumes_to_process[embedding_matrix.rows[row]].copy()
+            resume_with_reasons['match_reasons'] = match_reasons
+            resume_with_reasons['score'] = float(final_score)
+            resume_with_reasons['score_components'] = score_components  # Add component scores for transparency
+            recommendations.append(resume_with_reasons)
         
         end_time = time.time()
         logger.info(f"Recommendation took {end_time - start_time:.2f} seconds")
         
-        return [resume for resume, _ in scores[:top_n]]
+        return recommendations
     except Exception as e:
         logger.error(f"Error in recommendation: {str(e)}")
         return []
 
+def recommend_resumes_streaming(job_desc, batches, top_n=5):
+    """
+    recommend_resumes over a stream of prepared resume batches (see
+    corpus.iter_resume_batches). Each batch is scored and discarded; only the
+    top_n best candidates so far are kept in a bounded min-heap, so memory is
+    O(batch + top_n) instead of O(corpus).
+    """
+    try:
+        start_time = time.time()
+        top_n = int(top_n)
+        job_context = JobContext(job_desc)
+        logger.info(f"Extracted requirements: {job_context.requirements}")
+        dim = np.size(job_context.embedding)
+        
+        # Min-heap of (score, -position, resume, components, reasons): the root is the
+        # weakest kept candidate, and on equal scores the earlier resume is kept
+        heap = []
+        scanned = 0
+        for batch in batches:
+            embedding_matrix = EmbeddingMatrix(batch, dim=dim)
+            for row, final_score, score_components, match_reasons in score_embedding_matrix(embedding_matrix, batch, job_context):
+                entry = (float(final_score), -(scanned + row), batch[embedding_matrix.rows[row]], score_components, match_reasons)
+                if len(heap) < top_n:
+                    heapq.heappush(heap, entry)
+                elif entry[:2] > heap[0][:2]:
+                    heapq.heapreplace(heap, entry)
+            scanned += len(embedding_matrix)
+        
+        recommendations = []
+        for final_score, _, resume, score_components, match_reasons in sorted(heap, key=lambda e: e[:2], reverse=True):
+            resume_with_reasons = resume.copy()
+            resume_with_reasons['match_reasons'] = match_reasons
+            resume_with_reasons['score'] = final_score
+            resume_with_reasons['score_components'] = score_components
+            recommendations.append(resume_with_reasons)
+        
+        logger.info(f"Streaming recommendation scored {scanned} resumes in {time.time() - start_time:.2f} seconds")
+        return recommendations
+    except Exception as e:
+        logger.error(f"Error in streaming recommendation: {str(e)}")
+        return []
+
 def calculate_total_experience(experiences):
     """Calculate total years of experience from experience entries"""
     total_years = 0
@@ -598,21 +966,9 @@ def get_highest_education(education_entries):
 
 def calculate_education_score(candidate_edu, required_edu):
     """Calculate how well candidate's education matches requirements"""
-    # Define education levels and their numeric values
-    edu_levels = {
-        'none': 0,
-        'high school': 1,
-        'associate': 2, 
-        'diploma': 2,
-        'bachelors': 3,
-        'masters': 4,
-        'phd': 5,
-        'doctorate': 5
-    }
-    
     # Default values if not in the dictionary
-    candidate_level = edu_levels.get(candidate_edu.lower(), 0)
-    required_level = edu_levels.get(required_edu.lower(), 0)
+    candidate_level = EDUCATION_LEVELS.get(candidate_edu.lower(), 0)
+    required_level = EDUCATION_LEVELS.get(required_edu.lower(), 0)
     
     # If no education is required, any education is fine
     if required_level == 0:
@@ -628,10 +984,14 @@ def calculate_education_score(candidate_edu, required_edu):
 
 def preprocess_text(text):
     """Clean and standardize text before embedding"""
-    doc = get_nlp()(text.lower())
-    tokens = [token.text for token in doc 
-             if not token.is_stop and not token.is_punct]
-    return " ".join(tokens)
+    return preprocess_texts([text])[0]
+
+def preprocess_texts(texts, n_process=None):
+    """Batch version of preprocess_text (tokenizer-only spaCy pass)"""
+    return [
+        " ".join(token.text for token in doc if not token.is_stop and not token.is_punct)
+        for doc in tokenize_texts([text.lower() for text in texts], n_process)
+    ]
 
 def get_embedding(text):
     """Generate embedding for the given text using lazy-loaded model. Logs execution for debugging."""
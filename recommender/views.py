@@ -1,21 +1,30 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
-from .utils import load_resumes, recommend_resumes, enhance_resume_embedding, extract_keywords_and_requirements
+from .utils import recommend_resumes, recommend_resumes_streaming, enhance_resume_embedding, extract_keywords_and_requirements, embedding_model_id
 from .serializers import ResumeSerializer
 import logging
 from .models import User
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+import json
 from django.views.decorators.csrf import csrf_exempt
 from datetime import datetime
-from supabase import create_client
 import os
+from django.conf import settings
 # from sentence_transformers import SentenceTransformer  # now loaded lazily from utils
 import numpy as np
 import base64
-from .llm_recommender import recommend_resumes_llm, hybrid_recommend_resumes
+from .llm_recommender import recommend_resumes_llm, hybrid_recommend_resumes, stream_recommendations, nlp_fallback_recommendations
 from django.views.generic import TemplateView
 from .pdf_utils import extract_text_from_pdf
+from .corpus import get_corpus, invalidate_corpus, iter_resume_batches, corpus_version, CORPUS_BACKEND
+from .result_cache import result_cache_key, get_cached_result, cache_result, use_result_cache, RESULT_CACHE_HEADER
+from .term_store import warm_resume_terms
+from .embedding_codec import encode_embedding
+from .warmup import warmup_state
+from .supabase_client import get_supabase, query_stats
+from .cache_backends import cache_stats
 
 logger = logging.getLogger('recommender')
 
@@ -25,29 +34,93 @@ class RecommendAPI(APIView):
             logger.info(f"Received request data: {request.data}")
             job_desc = request.data.get("job_description", "")
             top_n = request.data.get("top_n", 5)
+            # Recall vs latency knobs for the ANN shortlist (None uses the configured defaults)
+            shortlist_size = request.data.get("shortlist_size")
+            search_ef = request.data.get("search_ef")
             
-            resumes = load_resumes()
-            
-            # Filter only resumes with valid embeddings
-            valid_resumes = [r for r in resumes if r.get('embedding') is not None and np.size(r['embedding']) > 0]
-            logger.info(f"Processing {len(valid_resumes)} resumes with valid embeddings")
-            
-            # Get recommendations with enhanced algorithm that extracts requirements from job description
-            recommended = recommend_resumes(job_desc, valid_resumes, top_n)
+            # Identical requests against the same corpus version are served from the result cache
+            cache_key = result_cache_key(
+                'nlp', job_desc, corpus_version(),
+                top_n=int(top_n), shortlist_size=shortlist_size, search_ef=search_ef
+            )
+            hit, recommended = get_cached_result(cache_key) if use_result_cache(request) else (False, None)
+            if not hit:
+                recommended = self.recommend(job_desc, top_n, shortlist_size, search_ef)
+                cache_result(cache_key, 'nlp', recommended)
             
             logger.info({
                 'event': 'recommendation_request',
                 'user_id': getattr(request.user, 'id', None),
-                'params': request.data
+                'params': request.data,
+                'cache_hit': hit
             })
-            return Response(recommended)
+            response = Response(recommended)
+            response[RESULT_CACHE_HEADER] = 'hit' if hit else 'miss'
+            return response
         except Exception as e:
             logger.error(f'Error in recommendation: {str(e)}')
             return Response({"error": str(e)}, status=500)
 
+    def recommend(self, job_desc, top_n, shortlist_size, search_ef):
+        if CORPUS_BACKEND == 'stream':
+            # Page through the corpus, keeping only the top N candidates in memory
+            return recommend_resumes_streaming(job_desc, iter_resume_batches(), top_n)
+
+        resumes = get_corpus().get_resumes()
+        
+        # Filter only resumes with valid embeddings
+        valid_resumes = [r for r in resumes if r.get('embedding') is not None and np.size(r['embedding']) > 0]
+        logger.info(f"Processing {len(valid_resumes)} resumes with valid embeddings")
+        
+        # Get recommendations with enhanced algorithm that extracts requirements from job description
+        return recommend_resumes(
+            job_desc,
+            valid_resumes,
+            top_n,
+            shortlist_size=int(shortlist_size) if shortlist_size else None,
+            search_ef=int(search_ef) if search_ef else None
+        )
+
+
+def get_stream_format(request):
+    """
+    Streaming is opt-in: {"stream": true} or ?stream=ndjson for NDJSON,
+    {"stream": "sse"}, ?stream=sse or an Accept: text/event-stream header for SSE.
+    """
+    stream = request.data.get("stream", request.query_params.get("stream"))
+    if stream in ("sse", "ndjson"):
+        return stream
+    if "text/event-stream" in request.headers.get("Accept", ""):
+        return "sse"
+    if stream in (True, "true", "1"):
+        return "ndjson"
+    return None
+
+def streaming_response(events, stream_format):
+    """Serialize (event, payload) pairs as NDJSON lines or Server-Sent Events"""
+    def encode(event, payload):
+        if stream_format == "sse":
+            return f"event: {event}\ndata: {json.dumps(payload, cls=JSONEncoder)}\n\n"
+        return json.dumps({'event': event, 'data': payload}, cls=JSONEncoder) + "\n"
+
+    def body():
+        try:
+            for event, payload in events:
+                yield encode(event, payload)
+        except Exception as e:
+            # Headers are already sent, so report the failure in-band
+            logger.error(f"Error while streaming LLM recommendations: {str(e)}")
+            yield encode('error', {'error': str(e)})
+
+    content_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+    response = StreamingHttpResponse(body(), content_type=content_type)
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 class LLMRecommendAPI(APIView):
-    """API endpoint for LLM-based resume recommendations"""
+    """API endpoint for LLM-based resume recommendations (optionally streamed)"""
     def post(self, request):
         try:
             logger.info(f"Received LLM recommendation request: {request.data}")
@@ -55,74 +128,100 @@ class LLMRecommendAPI(APIView):
             top_n = request.data.get("top_n", 5)
             model_name = request.data.get("model", "llama4")  # llama4 or nemotron
             recommendation_type = request.data.get("recommendation_type", "hybrid")  # hybrid or llm_only
+            llm_budget = request.data.get("llm_budget")  # most candidates to send to the LLM
+            llm_budget = int(llm_budget) if llm_budget is not None else None
             
             # Load resumes
-            resumes = load_resumes()
+            resumes = get_corpus().get_resumes()
             
             # Filter only resumes with valid embeddings for hybrid approach
             valid_resumes = [r for r in resumes if r.get('embedding') is not None and np.size(r['embedding']) > 0]
             logger.info(f"Processing {len(valid_resumes)} resumes with valid embeddings")
             
-            # Get recommendations using the appropriate method
-            try:
-                if recommendation_type == "hybrid":
-                    recommended = hybrid_recommend_resumes(
-                        job_desc, 
-                        valid_resumes, 
-                        top_n=top_n, 
-                        model_name=model_name
-                    )
-                else:  # llm_only
-                    recommended = recommend_resumes_llm(
-                        job_desc, 
-                        valid_resumes, 
-                        top_n=top_n, 
-                        model_name=model_name
-                    )
-                    
-                # Fallback: If no recommendations were returned, use traditional method
-                if not recommended and valid_resumes:
-                    logger.warning("LLM recommender returned no results - falling back to traditional NLP")
-                    from .utils import recommend_resumes
-                    # Use traditional NLP-based recommendation as fallback
-                    fallback_recommendations = recommend_resumes(job_desc, valid_resumes, top_n=top_n)
-                    
-                    # Add LLM-specific fields to maintain compatibility
-                    for rec in fallback_recommendations:
-                        rec['reasoning'] = "Generated using traditional NLP matching (LLM unavailable)"
-                        rec['match_reasons'] = [
-                            "Fallback mode: LLM evaluation unavailable",
-                            "✓ Strength: Resume contains relevant skills and experience",
-                            "△ Note: This is a basic match without semantic analysis"
-                        ]
-                    recommended = fallback_recommendations
-            except Exception as e:
-                logger.error(f"Error in recommendation process: {str(e)}")
-                # Last-resort fallback - return top N resumes with default scores
-                recommended = []
-                for i, resume in enumerate(valid_resumes[:top_n]):
-                    recommended.append({
-                        'resume': resume,
-                        'score': 0.5,  # Default middle score
-                        'reasoning': "Using basic matching due to service error.",
-                        'match_reasons': [
-                            "System notice: Recommendation service encountered an error.",
-                            "✓ Basic match based on resume content"
-                        ]
-                    })
+            stream_format = get_stream_format(request)
+            if stream_format:
+                events = stream_recommendations(
+                    job_desc,
+                    valid_resumes,
+                    top_n=top_n,
+                    model_name=model_name,
+                    recommendation_type=recommendation_type,
+                    llm_budget=llm_budget
+                )
+                return streaming_response(events, stream_format)
+            
+            # Identical requests against the same corpus version are served from the result cache
+            cache_key = result_cache_key(
+                recommendation_type, job_desc, corpus_version(),
+                top_n=int(top_n), model=model_name, llm_budget=llm_budget
+            )
+            hit, recommended = get_cached_result(cache_key) if use_result_cache(request) else (False, None)
+            if not hit:
+                recommended, degraded = self.recommend(job_desc, valid_resumes, top_n, model_name, recommendation_type, llm_budget)
+                cache_result(cache_key, recommendation_type, recommended, degraded=degraded)
             
             logger.info({
                 'event': 'llm_recommendation_request',
                 'user_id': getattr(request.user, 'id', None),
                 'params': request.data,
                 'model': model_name,
-                'type': recommendation_type
+                'type': recommendation_type,
+                'cache_hit': hit
             })
-            return Response(recommended)
+            response = Response(recommended)
+            response[RESULT_CACHE_HEADER] = 'hit' if hit else 'miss'
+            return response
         except Exception as e:
             logger.error(f'Error in LLM recommendation: {str(e)}')
             return Response({"error": str(e)}, status=500)
 
+    def recommend(self, job_desc, valid_resumes, top_n, model_name, recommendation_type, llm_budget):
+        """Recommendations for the requested method, and whether any fallback was used"""
+        # Get recommendations using the appropriate method
+        degraded = False
+        try:
+            if recommendation_type == "hybrid":
+                recommended = hybrid_recommend_resumes(
+                    job_desc, 
+                    valid_resumes, 
+                    top_n=top_n, 
+                    model_name=model_name,
+                    llm_budget=llm_budget
+                )
+            else:  # llm_only
+                recommended = recommend_resumes_llm(
+                    job_desc, 
+                    valid_resumes, 
+                    top_n=top_n, 
+                    model_name=model_name,
+                    llm_budget=llm_budget
+                )
+
+            # Fallback: If no recommendations were returned, use traditional method
+            if not recommended and valid_resumes:
+                logger.warning("LLM recommender returned no results - falling back to traditional NLP")
+                recommended = nlp_fallback_recommendations(job_desc, valid_resumes, top_n=top_n)
+                degraded = True
+        except Exception as e:
+            logger.error(f"Error in recommendation process: {str(e)}")
+            # Last-resort fallback - return top N resumes with default scores
+            degraded = True
+            recommended = []
+            for i, resume in enumerate(valid_resumes[:top_n]):
+                recommended.append({
+                    'resume': resume,
+                    'score': 0.5,  # Default middle score
+                    'reasoning': "Using basic matching due to service error.",
+                    'match_reasons': [
+                        "System notice: Recommendation service encountered an error.",
+                        "✓ Basic match based on resume content"
+                    ]
+                })
+        
+        # Candidates scored with a fallback evaluation are only cached briefly
+        degraded = degraded or any(r.get('llm_error') for r in recommended)
+        return recommended, degraded
+
 def get_match_reasons(resume, job_desc):
     """Generate human-readable reasons for the match"""
     reasons = []
@@ -180,10 +279,7 @@ def get_match_reasons(resume, job_desc):
 class ProfileAPI(APIView):
     def get(self, request, user_id):
         try:
-            supabase = create_client(
-                os.getenv("SUPABASE_URL"),
-                os.getenv("SUPABASE_KEY")
-            )
+            supabase = get_supabase()
             
             # Fetch profile
             profile_response = supabase.table('profiles') \
@@ -214,10 +310,7 @@ class ProfileAPI(APIView):
 
 def create_or_update_profile(user, profile_data):
     # Update or create profile in Supabase
-    supabase = create_client(
-        url=os.getenv("SUPABASE_URL"),
-        key=os.getenv("SUPABASE_ANON_KEY"),
-    )
+    supabase = get_supabase(settings.SUPABASE_ANON_KEY)
     supabase.table('profiles').upsert({
         'id': user.id,
         'first_name': profile_data.get('first_name', ''),
@@ -230,9 +323,11 @@ def create_or_update_profile(user, profile_data):
         'twitter': profile_data.get('twitter', ''),
         'updated_at': datetime.now().isoformat()
     }).execute()
+    # Pick up the new name/contact details on the next recommendation
+    invalidate_corpus()
 
 def get_profile(user_id):
-    response = supabase.table('profiles') \
+    response = get_supabase().table('profiles') \
         .select('*') \
         .eq('id', user_id) \
         .single() \
@@ -259,10 +354,13 @@ class GenerateEmbeddingAPI(APIView):
             embedding_text = enhance_resume_embedding(resume_data)
             
             # Compute embedding
-            embedding = self.model.encode(embedding_text).astype("float32").tobytes()
+            embedding = self.model.encode(embedding_text).astype("float32")
+            
+            # Encode in the versioned storage format (base64 text)
+            embedding_base64 = encode_embedding(embedding, embedding_model_id())
             
-            # Encode as Base64
-            embedding_base64 = base64.b64encode(embedding).decode('utf-8')
+            # Encode any new skills/certifications now rather than during scoring
+            warm_resume_terms([resume_data])
             
             return Response({"embedding": embedding_base64}, status=200)
         except Exception as e:
@@ -334,7 +432,7 @@ class TestRecommenderView(TemplateView):
         top_n = int(request.POST.get("top_n", 5))
         method = request.POST.get("method", "standard")
         
-        resumes = load_resumes()
+        resumes = get_corpus().get_resumes()
         
         # Filter only resumes with valid embeddings
         valid_resumes = [r for r in resumes if r.get('embedding') is not None and np.size(r['embedding']) > 0]
@@ -362,4 +460,12 @@ class TestRecommenderView(TemplateView):
             'recommendations': recommended
         }
         
-        return self.render_to_response(context)
\ No newline at end of file
+        return self.render_to_response(context)
+
+class ReadinessAPI(APIView):
+    """Reports whether models and corpus are warm; 503 until warmup has succeeded"""
+    def get(self, request):
+        state = warmup_state()
+        state['supabase_queries'] = query_stats()
+        state['caches'] = cache_stats()
+        return Response(state, status=200 if state['status'] == 'ready' else 503)
@@ -0,0 +1,134 @@
+"""
+Model and corpus warmup.
+
+spaCy and the sentence encoder are loaded lazily, so without warmup the first
+request after every worker (re)start pays for loading them. With gunicorn's
+``preload_app`` the master process calls ``warm_up`` once before forking
+(see ``gunicorn_config.py``): models, the term store, the ANN index and the
+corpus are loaded and a dummy inference is run, and every worker, including
+those recycled by ``max_requests``, inherits them copy-on-write.
+``post_fork`` then repeats a tiny inference in the worker before it accepts
+requests.
+
+Only fork-safe state is built before forking: torch runs single-threaded in
+the master (``gunicorn_config`` sets ``OMP_NUM_THREADS``) and each worker
+raises it to ``TORCH_NUM_THREADS`` after fork; the LLM thread pool and SQLite
+connections stay lazy and are created in the workers; the sharded scoring
+pool is forked at the start of ``post_fork`` (before the worker starts any
+threads), and the Supabase HTTP pool opened by the corpus load is discarded
+in each worker (see ``supabase_client``). ``warmup_state`` backs the
+readiness endpoint.
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger('recommender')
+
+DUMMY_JOB = (
+    "We are looking for a senior Python developer with 5 years of experience in Django "
+    "and AWS. A bachelor's degree in computer science is required; fluency in English "
+    "and an AWS certification are a plus."
+)
+
+_lock = threading.Lock()
+_state = {'status': 'cold', 'pid': None, 'started_at': None, 'finished_at': None, 'components': {}}
+
+
+def _load_nlp():
+    from .utils import get_nlp
+    get_nlp()(DUMMY_JOB)
+
+
+def _load_encoder():
+    from .utils import get_sentence_transformer
+    get_sentence_transformer().encode([DUMMY_JOB, "Python"])
+
+
+def _load_term_store():
+    from .term_store import get_term_store
+    get_term_store().get_query_vectors(["Python", "AWS Certified Solutions Architect"])
+
+
+def _load_ann_index():
+    from .ann_index import get_ann_index
+    get_ann_index()
+
+
+def _load_corpus():
+    from .corpus import get_corpus, CORPUS_BACKEND
+    # A streamed corpus is read per request; holding it all would defeat the point
+    if CORPUS_BACKEND != 'stream':
+        get_corpus().get_resumes()
+
+
+def _dummy_recommendation():
+    from .utils import JobContext
+    JobContext(DUMMY_JOB)
+
+
+# (name, loader, required for readiness)
+COMPONENTS = [
+    ('nlp', _load_nlp, True),
+    ('sentence_encoder', _load_encoder, True),
+    ('term_store', _load_term_store, False),
+    ('ann_index', _load_ann_index, False),
+    ('corpus', _load_corpus, False),
+    ('job_context', _dummy_recommendation, False),
+]
+
+
+def warm_up(components=None):
+    """Load and exercise the models and corpus, recording per-component timings"""
+    selected = [c for c in COMPONENTS if components is None or c[0] in components]
+    with _lock:
+        _state.update(status='warming', pid=os.getpid(), started_at=time.time(), finished_at=None)
+    ready = True
+    for name, loader, required in selected:
+        start_time = time.time()
+        try:
+            loader()
+            result = {'ready': True, 'seconds': round(time.time() - start_time, 3)}
+        except Exception as e:
+            logger.error(f"Warmup of {name} failed: {str(e)}")
+            result = {'ready': False, 'seconds': round(time.time() - start_time, 3), 'error': str(e)}
+            ready = ready and not required
+        with _lock:
+            _state['components'][name] = result
+    with _lock:
+        _state.update(status='ready' if ready else 'failed', finished_at=time.time())
+    logger.info(f"Warmup finished in {_state['finished_at'] - _state['started_at']:.2f} seconds (status {_state['status']})")
+    return warmup_state()
+
+
+def _set_torch_threads():
+    from django.conf import settings
+    threads = getattr(settings, 'TORCH_NUM_THREADS', 1)
+    # Only if the master loaded torch; a worker that imports it later reads OMP_NUM_THREADS
+    if threads > 1 and 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(threads)
+
+
+def post_fork():
+    """Run in each worker right after fork: re-check the inherited models with a tiny inference"""
+    from .parallel import start_sharded_scorer
+    # Fork the scoring pool first, while this worker has no threads of its own
+    start_sharded_scorer()
+    _set_torch_threads()
+    with _lock:
+        inherited = _state['status']
+    if inherited == 'ready':
+        warm_up(components=('nlp', 'sentence_encoder'))
+    with _lock:
+        _state['pid'] = os.getpid()
+        _state['inherited_from_master'] = inherited == 'ready'
+
+
+def warmup_state():
+    with _lock:
+        state = dict(_state)
+        state['components'] = dict(_state['components'])
+    return state
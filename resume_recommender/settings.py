@@ -22,9 +22,113 @@ load_dotenv()
 # Supabase configuration
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY')
+SUPABASE_ANON_KEY = os.getenv('SUPABASE_ANON_KEY')
+SUPABASE_SERVICE_KEY = os.getenv('SUPABASE_SERVICE_KEY')
+
+# Shared Supabase HTTP pool: connections per Supabase URL, keep-alive and timeouts in seconds,
+# and the latency above which a query is logged as slow
+SUPABASE_POOL_SIZE = int(os.getenv('SUPABASE_POOL_SIZE', '20'))
+SUPABASE_KEEPALIVE_SECONDS = float(os.getenv('SUPABASE_KEEPALIVE_SECONDS', '60'))
+SUPABASE_CONNECT_TIMEOUT = float(os.getenv('SUPABASE_CONNECT_TIMEOUT', '5'))
+SUPABASE_READ_TIMEOUT = float(os.getenv('SUPABASE_READ_TIMEOUT', '30'))
+SUPABASE_SLOW_QUERY_MS = float(os.getenv('SUPABASE_SLOW_QUERY_MS', '500'))
+
+# Local access token verification: HS256 secret (legacy projects) or the project's JWKS for
+# asymmetric keys; resolved users are cached per token for at most AUTH_CACHE_SECONDS
+SUPABASE_JWT_SECRET = os.getenv('SUPABASE_JWT_SECRET')
+SUPABASE_JWT_AUDIENCE = os.getenv('SUPABASE_JWT_AUDIENCE', 'authenticated')
+SUPABASE_JWKS_URL = os.getenv('SUPABASE_JWKS_URL')
+SUPABASE_JWKS_CACHE_SECONDS = int(os.getenv('SUPABASE_JWKS_CACHE_SECONDS', '600'))
+AUTH_CACHE_SIZE = int(os.getenv('AUTH_CACHE_SIZE', '10000'))
+AUTH_CACHE_SECONDS = int(os.getenv('AUTH_CACHE_SECONDS', '300'))
+# Paths (with or without the api/ prefix) that skip token authentication
+SUPABASE_AUTH_EXEMPT_PATHS = [
+    r'^/static/',
+    r'^/admin/',
+    r'^/(api/)?$',
+    r'^/(api/)?test/$',
+    r'^/(api/)?auth/',
+    r'^/(api/)?health/',
+]
+
+# Resume corpus snapshot: seconds before an incremental refresh, seconds between full reloads
+CORPUS_MAX_STALENESS_SECONDS = int(os.getenv('CORPUS_MAX_STALENESS_SECONDS', '60'))
+CORPUS_FULL_RELOAD_SECONDS = int(os.getenv('CORPUS_FULL_RELOAD_SECONDS', '3600'))
+# Seconds to wait after a failed refresh before querying Supabase again
+CORPUS_RETRY_SECONDS = int(os.getenv('CORPUS_RETRY_SECONDS', '10'))
+CORPUS_WATERMARK_COLUMN = os.getenv('CORPUS_WATERMARK_COLUMN', 'updated_at')
+
+# ANN candidate shortlist (built with `python manage.py build_ann_index`)
+ANN_INDEX_PATH = os.getenv('ANN_INDEX_PATH', os.path.join('data', 'resume_index.bin'))
+ANN_SHORTLIST_SIZE = int(os.getenv('ANN_SHORTLIST_SIZE', '200'))
+ANN_SEARCH_EF = int(os.getenv('ANN_SEARCH_EF', '100'))
+
+# Skill/certification term embedding store (memory-mapped .npy + .json vocabulary)
+TERM_STORE_PATH = os.getenv('TERM_STORE_PATH', os.path.join('data', 'term_embeddings'))
+TERM_STORE_CACHE_SIZE = int(os.getenv('TERM_STORE_CACHE_SIZE', '10000'))
+
+# Corpus source: 'live' (in-memory, refreshed from Supabase), 'snapshot' (memory-mapped
+# local snapshot written by the build_corpus_snapshot command, rebuilt on a schedule) or
+# 'stream' (NLP recommendations page through Supabase per request, keeping only the top N)
+CORPUS_BACKEND = os.getenv('CORPUS_BACKEND', 'live')
+# Streaming reader: rows per page and the columns fetched from resumes and profiles
+CORPUS_STREAM_BATCH_SIZE = int(os.getenv('CORPUS_STREAM_BATCH_SIZE', '1000'))
+# User ids per profiles `in` filter, which travels in the request URL
+CORPUS_PROFILE_CHUNK_SIZE = int(os.getenv('CORPUS_PROFILE_CHUNK_SIZE', '150'))
+CORPUS_RESUME_COLUMNS = ['id', 'user_id', 'embedding', 'skills', 'experience', 'education', 'certifications', 'languages']
+CORPUS_PROFILE_COLUMNS = ['id', 'first_name', 'last_name', 'email', 'phone', 'address']
+CORPUS_SNAPSHOT_PATH = os.getenv('CORPUS_SNAPSHOT_PATH', os.path.join('data', 'corpus_snapshot'))
+CORPUS_SNAPSHOT_CHECK_SECONDS = int(os.getenv('CORPUS_SNAPSHOT_CHECK_SECONDS', '5'))
+CORPUS_SNAPSHOT_CACHE_SIZE = int(os.getenv('CORPUS_SNAPSHOT_CACHE_SIZE', '5000'))
+
+# spaCy batch size and worker processes for corpus-level text processing
+SPACY_BATCH_SIZE = int(os.getenv('SPACY_BATCH_SIZE', '256'))
+SPACY_N_PROCESS = int(os.getenv('SPACY_N_PROCESS', '1'))
+
+# Sharded scoring: worker processes (0/1 = score in-process) and the candidate count worth sharding
+SCORING_WORKERS = int(os.getenv('SCORING_WORKERS', '0'))
+SCORING_PARALLEL_MIN_CANDIDATES = int(os.getenv('SCORING_PARALLEL_MIN_CANDIDATES', '2000'))
+
+# Sentence encoder backend: 'torch' or 'onnx' (int8 model from the export_onnx_model command;
+# embeddings within ONNX_COSINE_TOLERANCE of PyTorch, checked at export)
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'torch')
+# torch intra-op threads per gunicorn worker (the preloading master always uses one)
+TORCH_NUM_THREADS = int(os.getenv('TORCH_NUM_THREADS', '1'))
+ONNX_MODEL_PATH = os.getenv('ONNX_MODEL_PATH', os.path.join('data', 'onnx', 'all-MiniLM-L6-v2-int8'))
+ONNX_COSINE_TOLERANCE = float(os.getenv('ONNX_COSINE_TOLERANCE', '0.02'))
+# Precision of newly written embeddings: float32, float16, int8, or legacy (headerless float32)
+EMBEDDING_STORAGE_DTYPE = os.getenv('EMBEDDING_STORAGE_DTYPE', 'float32')
 
 # OpenRouter API configuration
 OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY')
+# Concurrent LLM evaluations per process, per-call timeout and overall deadline (seconds)
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '5'))
+LLM_REQUEST_TIMEOUT = int(os.getenv('LLM_REQUEST_TIMEOUT', '30'))
+LLM_EVALUATION_DEADLINE = int(os.getenv('LLM_EVALUATION_DEADLINE', '90'))
+# Most NLP candidates a hybrid recommendation sends to the LLM (overridable per request)
+LLM_EVALUATION_BUDGET = int(os.getenv('LLM_EVALUATION_BUDGET', '20'))
+# Resumes evaluated per batched LLM prompt (1 sends one resume per call)
+LLM_BATCH_SIZE = int(os.getenv('LLM_BATCH_SIZE', '1'))
+# Prompt token budgets for resume text (per candidate, per batched prompt) and completion tokens per candidate
+LLM_RESUME_TOKEN_BUDGET = int(os.getenv('LLM_RESUME_TOKEN_BUDGET', '800'))
+LLM_BATCH_TOKEN_BUDGET = int(os.getenv('LLM_BATCH_TOKEN_BUDGET', '3000'))
+LLM_MAX_OUTPUT_TOKENS = int(os.getenv('LLM_MAX_OUTPUT_TOKENS', '800'))
+# Host-wide persistent LLM evaluation cache (the 'llm_evaluations' entry of CACHES)
+LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', os.path.join('data', 'cache', 'llm_evaluations.sqlite3'))
+LLM_CACHE_TTL_SECONDS = int(os.getenv('LLM_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+LLM_CACHE_MAX_BYTES = int(os.getenv('LLM_CACHE_MAX_BYTES', str(128 * 1024 * 1024)))
+
+# Recommendation result cache: TTL per method (seconds), and the shorter TTL for empty or
+# degraded (LLM fallback) results; keys include the corpus version, so data changes invalidate
+RESULT_CACHE_ENABLED = os.getenv('RESULT_CACHE_ENABLED', 'True') == 'True'
+RESULT_CACHE_TTLS = {
+    'nlp': int(os.getenv('RESULT_CACHE_NLP_TTL', '600')),
+    'hybrid': int(os.getenv('RESULT_CACHE_HYBRID_TTL', '3600')),
+    'llm_only': int(os.getenv('RESULT_CACHE_LLM_TTL', '3600')),
+}
+RESULT_CACHE_NEGATIVE_TTL = int(os.getenv('RESULT_CACHE_NEGATIVE_TTL', '60'))
+# Seconds a streamed corpus' version stamp (two Supabase queries) is reused across requests
+CORPUS_VERSION_CACHE_SECONDS = float(os.getenv('CORPUS_VERSION_CACHE_SECONDS', '5'))
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -133,6 +237,8 @@ CORS_ALLOW_HEADERS = [
     'x-csrftoken',
     'x-requested-with',
 ]
+# Let the frontend read whether a recommendation came from the result cache
+CORS_EXPOSE_HEADERS = ['x-result-cache']
 
 # If your mobile app needs wildcard origin support (test environment)
 # Uncomment the line below during development if you face CORS issues
@@ -247,9 +353,44 @@ LOGGING = {
 # Ensure logs directory exists
 os.makedirs('logs', exist_ok=True)
 
-CACHES = {
-    "default": {
-        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
-        "LOCATION": "unique-snowflake",  # Unique identifier for the cache
+# Cache tier: 'sqlite' (files shared by every worker on the host, evicted by size),
+# 'redis' (CACHE_REDIS_URL, shared across hosts; needs the redis package and is bounded by
+# Redis' maxmemory) or 'locmem' (per process)
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'sqlite')
+CACHE_PATH = os.getenv('CACHE_PATH', os.path.join('data', 'cache', 'default.sqlite3'))
+CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+# Seconds to keep extracted job requirements and job embeddings
+REQUIREMENTS_CACHE_SECONDS = int(os.getenv('REQUIREMENTS_CACHE_SECONDS', str(24 * 3600)))
+EMBEDDING_CACHE_SECONDS = int(os.getenv('EMBEDDING_CACHE_SECONDS', str(7 * 24 * 3600)))
+
+if CACHE_BACKEND == 'redis':
+    CACHES = {
+        alias: {
+            "BACKEND": "recommender.cache_backends.CountingRedisCache",
+            "LOCATION": CACHE_REDIS_URL,
+            "KEY_PREFIX": alias,
+        }
+        for alias in ("default", "llm_evaluations")
+    }
+elif CACHE_BACKEND == 'locmem':
+    CACHES = {
+        alias: {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": alias,
+        }
+        for alias in ("default", "llm_evaluations")
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "recommender.cache_backends.SQLiteCache",
+            "LOCATION": CACHE_PATH,
+            "OPTIONS": {"MAX_BYTES": CACHE_MAX_BYTES},
+        },
+        "llm_evaluations": {
+            "BACKEND": "recommender.cache_backends.SQLiteCache",
+            "LOCATION": LLM_CACHE_PATH,
+            "OPTIONS": {"MAX_BYTES": LLM_CACHE_MAX_BYTES},
+        },
     }
-}